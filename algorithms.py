@@ -1,9 +1,8 @@
 import numpy as np, uuid, random 
 from itertools import takewhile
-from graph_tool import *
-import graph_tool.all as gt
 from math import e, factorial
-from block import Block
+from block import Block, BlockType, GENESIS_ID
+from blockstore import BlockStore
 from abc import ABC, abstractmethod
 from constants import FINALIZATION_DEPTH
 
@@ -25,26 +24,57 @@ def compute_finalization_depth(epsilon, num_nodes, num_adversaries):
     return k
 
 class Algorithm():
-    def __init__(self):
-        self.tree = Graph()
-        # maps vertex to block
-        self.vertex_to_blocks = self.tree.new_vertex_property('object')
-        # maps block to vertex
-        self.block_to_vertices = {}
-        # create a new vertex property corresponding to depth
-        self.depth = self.tree.new_vertex_property('int')
-
-        # add genesis block and vertex
-        self.root = self.tree.add_vertex()
-        genesis = Block(id='Genesis')
-        self.vertex_to_blocks[self.root] = genesis
-        self.block_to_vertices[genesis.id] = self.root
-        self.depth[self.root] = 0
+    def __init__(self, blockstore=None):
+        # blocks live in a store shared by every node; a node's blocktree is
+        # the subset of the store it has seen
+        if blockstore is None:
+            blockstore = BlockStore()
+        self.blockstore = blockstore
+        self.root = blockstore.root
+        self.genesis = blockstore.get_block(self.root)
+
+        # per-node bitmap of seen blocks, indexed by store index
+        self.seen = np.zeros(blockstore.capacity(), dtype=bool)
+        self.seen[self.root] = True
+
+        # main chain through the first leaf chosen by the fork choice rule,
+        # as store indices indexed by depth
+        self.main_chain = np.zeros(64, dtype=np.int32)
+        self.main_chain[0] = self.root
+        self.main_chain_length = 1
+        # reorg delta accumulated since the last call to main_chain_delta:
+        # the chain is unchanged up to fork_depth, and disconnected holds the
+        # blocks that were on it beyond fork_depth
+        self.fork_depth = 0
+        self.disconnected = []
+        # number of main chain blocks including each transaction, indexed by
+        # tx id; txs past the end of the array are not included
+        self.included = np.zeros(1024, dtype=np.int32)
+
+    def _grow(self):
+        seen = np.zeros(self.blockstore.capacity(), dtype=bool)
+        seen[:self.seen.shape[0]] = self.seen
+        self.seen = seen
+
+    def _mark_seen(self, index):
+        if index>=self.seen.shape[0]:
+            self._grow()
+        self.seen[index] = True
+
+    def has_seen(self, index):
+        return index<self.seen.shape[0] and self.seen[index]
+
+    def depth_array(self):
+        # depths of all stored blocks, -1 for blocks this node has not seen
+        n = len(self.blockstore)
+        if self.seen.shape[0]<n:
+            self._grow()
+        return np.where(self.seen[:n], self.blockstore.depths[:n], -1)
 
     def get_block_by_id(self, id):
-        if id in self.block_to_vertices:
-            vertex = self.block_to_vertices[id]
-            return self.vertex_to_blocks[vertex]
+        index = self.blockstore.index(id)
+        if index is not None and self.has_seen(index):
+            return self.blockstore.get_block(index)
 
     def random_main_chain(self, main_chains=None):
         if main_chains is None:
@@ -56,30 +86,135 @@ class Algorithm():
     def fork_choice_rule(self):
         pass
 
+    # walk up from a block until reaching the cached main chain, returning the
+    # depth at which it joins the main chain and the path below that point
+    def _path_to_main_chain(self, index):
+        path = []
+        depth = self.blockstore.depths[index]
+        while depth>=self.main_chain_length or self.main_chain[depth]!=index:
+            path.append(index)
+            index = self.blockstore.parents[index]
+            depth-=1
+        return depth, path[::-1]
+
+    # move the cached main chain to the current fork choice, paying only for
+    # the blocks that change
+    def update_main_chain(self):
+        tip = self.blockstore.index(self.fork_choice_rule()[0].id)
+        fork_depth, path = self._path_to_main_chain(tip)
+        if len(path)==0 and fork_depth==self.main_chain_length-1:
+            return
+
+        # undo and apply transaction inclusion for the blocks that change
+        for index in self.main_chain[fork_depth+1:self.main_chain_length]:
+            self._exclude_txs(self.blockstore.get_block(index))
+        for index in path:
+            self._include_txs(self.blockstore.get_block(index))
+
+        # blocks beyond the fork that were on the chain at the last delta
+        if fork_depth<self.fork_depth:
+            self.disconnected = [self.blockstore.get_block(index) for index in
+                    self.main_chain[fork_depth+1:self.fork_depth+1]]+self.disconnected
+            self.fork_depth = fork_depth
+
+        length = fork_depth+1+len(path)
+        if length>self.main_chain.shape[0]:
+            main_chain = np.zeros(2*length, dtype=np.int32)
+            main_chain[:self.main_chain_length] = self.main_chain[:self.main_chain_length]
+            self.main_chain = main_chain
+        self.main_chain[fork_depth+1:length] = path
+        self.main_chain_length = length
+
+    # blocks whose transactions are confirmed by a main chain block
+    def ledger_blocks(self, block):
+        return [block]
+
+    def _include_txs(self, block):
+        self._count_txs(block, 1)
+
+    def _exclude_txs(self, block):
+        self._count_txs(block, -1)
+
+    # add count to the inclusion counts of the txs confirmed by block
+    def _count_txs(self, block, count):
+        for ledger_block in self.ledger_blocks(block):
+            txs = ledger_block.txs
+            if txs.shape[0]==0:
+                continue
+            end = int(txs.max())+1
+            if end>self.included.shape[0]:
+                included = np.zeros(max(2*self.included.shape[0], end), dtype=np.int32)
+                included[:self.included.shape[0]] = self.included
+                self.included = included
+            np.add.at(self.included, txs, count)
+
+    # inclusion counts of the txs on the main chain of the current tip, indexed
+    # by tx id
+    def included_txs(self):
+        self.update_main_chain()
+        return self.included
+
+    # blocks disconnected from and connected to the main chain since the last
+    # call, both in chain order
+    def main_chain_delta(self):
+        self.update_main_chain()
+        disconnected = self.disconnected
+        connected = [self.blockstore.get_block(index) for index in
+                self.main_chain[self.fork_depth+1:self.main_chain_length]]
+        self.fork_depth = self.main_chain_length-1
+        self.disconnected = []
+        return disconnected, connected
+
+    def main_chain_blocks(self):
+        self.update_main_chain()
+        return [self.blockstore.get_block(index) for index in
+                self.main_chain[:self.main_chain_length]]
+
     @abstractmethod
     def main_chains(self):
         # find leaf blocks via fork choice rule
         leaf_blocks = self.fork_choice_rule()
+        self.update_main_chain()
         main_chains = []
 
-        # traverse from leaf vertices up to root and add to main chain
-        root_block = self.vertex_to_blocks[self.root]
+        # traverse from leaf vertices up to the cached main chain and add the
+        # shared prefix of the main chain
         for leaf_block in leaf_blocks: 
-            main_chains.append([])
-            block = leaf_block
-            while block.id!=root_block.id:
-                main_chains[-1].append(block)
-                parent_vertex = self.block_to_vertices[block.parent_id]
-                block = self.vertex_to_blocks[parent_vertex]
-            main_chains[-1].append(root_block)
-            # reverse the path
-            main_chains[-1] = main_chains[-1][::-1]
+            index = self.blockstore.index(leaf_block.id)
+            fork_depth, path = self._path_to_main_chain(index)
+            main_chains.append([self.blockstore.get_block(index) for index in
+                self.main_chain[:fork_depth+1]]+[self.blockstore.get_block(index)
+                    for index in path])
 
         return main_chains
 
+    def is_ancestor(self, ancestor_block, block):
+        return self.blockstore.is_ancestor(self.blockstore.index(ancestor_block.id),
+                self.blockstore.index(block.id))
+
+    def lca(self, block_a, block_b):
+        index = self.blockstore.lca(self.blockstore.index(block_a.id),
+                self.blockstore.index(block_b.id))
+        if index is not None:
+            return self.blockstore.get_block(index)
+
+    def ancestor_at_depth(self, block, depth):
+        index = self.blockstore.ancestor_at_depth(self.blockstore.index(block.id),
+                depth)
+        if index is not None:
+            return self.blockstore.get_block(index)
+
     def common_prefix(self, main_chains=None):
         if main_chains is None:
-            main_chains = self.main_chains()
+            # the common prefix of all main chains ends at the lowest common
+            # ancestor of their leaves, which lies on the cached main chain
+            leaf_blocks = self.fork_choice_rule()
+            common_block = leaf_blocks[0]
+            for leaf_block in leaf_blocks[1:]:
+                common_block = self.lca(common_block, leaf_block)
+            self.update_main_chain()
+            return [self.blockstore.get_block(index) for index in
+                    self.main_chain[:common_block.depth+1]]
 
         common_prefix = [v[0] for v in takewhile(lambda chain:
             chain.count(chain[0])==len(chain), zip(*main_chains))]
@@ -88,16 +223,9 @@ class Algorithm():
 
     # add a new block given a parent block
     def add_block_by_parent(self, new_block, parent_block):
-        new_vertex = self.tree.add_vertex()
-        self.vertex_to_blocks[new_vertex] = new_block
-        self.block_to_vertices[new_block.id] = new_vertex
-
-        parent_vertex = self.block_to_vertices[parent_block.id]
-
-        self.tree.add_edge(parent_vertex, new_vertex)
-        self.depth[new_vertex] = self.depth[self.tree.vertex(parent_vertex)]+1
-        new_block.set_parent_id(parent_block.id)
-        new_block.set_depth(parent_block.depth+1)
+        parent_index = self.blockstore.index(parent_block.id)
+        new_index = self.blockstore.add_block(new_block, parent_index)
+        self._mark_seen(new_index)
 
         return parent_block
 
@@ -107,115 +235,113 @@ class Algorithm():
         self.add_block_by_parent(new_block, parent_block)
         return parent_block
 
-    def graph_to_str(self, vertex=None, level=0):
-        if vertex==None:
-            vertex=self.root
-        ret = '   '*level+f'{self.vertex_to_blocks[vertex].id}\n'
-        for e in vertex.out_edges():
-            child = e.target()	
-            ret += self.graph_to_str(vertex=child, level=level+1)
+    def graph_to_str(self, index=None, level=0):
+        if index==None:
+            index=self.root
+        ret = '   '*level+f'{self.blockstore.get_block(index).id}\n'
+        for child in self.blockstore.children[index]:
+            if self.has_seen(child):
+                ret += self.graph_to_str(index=child, level=level+1)
         return ret
 
 
 class LongestChain(Algorithm):
-    def fork_choice_rule(self):
-        depth_array = self.depth.get_array()
-        # find max depth
-        max_depth = np.amax(depth_array)
+    def __init__(self, blockstore=None):
+        super(LongestChain, self).__init__(blockstore)
+        # track the deepest blocks seen so far as blocks are added
+        self.max_depth = 0
+        self.tips = [self.root]
 
-        # find indices where depth is max depth
-        max_indices = np.where(depth_array==np.amax(depth_array))[0]
+    def add_block_by_parent(self, new_block, parent_block):
+        parent_block = super(LongestChain, self).add_block_by_parent(new_block,
+                parent_block)
 
-        # copy blocks into parent blocks array
-        it = np.nditer(max_indices, flags=['f_index'])
-        parent_blocks = np.empty(shape=max_indices.shape[0], dtype=object)
-        while not it.finished:
-            parent_blocks[it.index] = self.vertex_to_blocks[self.tree.vertex(it[0])]
-            it.iternext()
+        # update max depth and the tips at that depth
+        depth = new_block.depth
+        if depth>self.max_depth:
+            self.max_depth = depth
+            self.tips = [self.blockstore.index(new_block.id)]
+        elif depth==self.max_depth:
+            self.tips.append(self.blockstore.index(new_block.id))
 
-        return parent_blocks
+        return parent_block
+
+    def fork_choice_rule(self):
+        # blocks at max depth, in the order they were seen
+        return [self.blockstore.get_block(tip) for tip in self.tips]
 
 '''
 NOTE: Prism algorithm simulations are still under development
 '''
 class Prism(LongestChain):
-    def __init__(self, num_voting_chains=10):
+    def __init__(self, blockstore=None, num_voting_chains=10):
         # Initialize main proposer tree according to longest chain protocol
-        super(LongestChain, self).__init__()
+        super(Prism, self).__init__(blockstore)
 
         # Initialize all voting chains
         self.num_voting_chains = num_voting_chains
         self.voting_chains = []
 
 
+        # voting chains are kept in their own shared stores
         for i in range(0, self.num_voting_chains):
-            voting_chain = LongestChain()
+            voting_chain = LongestChain(self.blockstore.substore(i))
             self.voting_chains.append(voting_chain)
 
+        # the ledger is decided by votes, so it is recomputed by main_chains,
+        # which tallies every vote. It is cached until a block is added and
+        # the inclusion counts are moved by the blocks that changed; votes
+        # other nodes add to shared blocks show up at the next block added
+        self.num_added = 0
+        self.ledger = [self.genesis]
+        self.ledger_num_added = 0
+
     def get_referenced_blocks(self, proposer_block_id):
-        if proposer_block_id in self.block_to_vertices:
-            proposer_vertex = self.block_to_vertices[proposer_block_id]
-            proposer_block = self.vertex_to_blocks[proposer_vertex] 
-            if proposer_vertex!=self.root:
-                return proposer_block.referenced_blocks
+        proposer_block = super(Prism, self).get_block_by_id(proposer_block_id)
+        if proposer_block is not None and proposer_block is not self.genesis:
+            return proposer_block.referenced_blocks
         return []
 
+    def get_block_by_id(self, id):
+        # search proposer tree first, then voting chains
+        block = super(Prism, self).get_block_by_id(id)
+        if block is None:
+            for voting_chain in self.voting_chains:
+                block = voting_chain.get_block_by_id(id)
+                if block is not None:
+                    break
+        return block
+
     def set_block_chain(self, block):
         choice = np.random.randint(0, self.num_voting_chains+1)
 
         # Selection of 0 corresponds to adding to proposer tree
         if choice==0:
-            block.set_block_type('proposer')
+            block.set_block_type(BlockType.PROPOSER)
         else:
-            block.set_block_type('voter', choice-1)
+            block.set_block_type(BlockType.VOTER, choice-1)
 
     def add_block_by_parent(self, new_block, parent_block):
-        if new_block.block_type=='proposer':
+        self.num_added+=1
+        if new_block.block_type==BlockType.PROPOSER:
             # If proposer block, call LongestChain's add_block_by_parent
             return super(Prism, self).add_block_by_parent(new_block,
                     parent_block)
         else:
-            # If voting block, call LongestChain's add_block_by_parent
-            # on specified chain
-            choice = np.random.randint(0, self.num_voting_chains)
-            new_block.set_block_type('voter', choice)
+            # Voting blocks are shared between nodes, so the chain and votes
+            # were already chosen by the proposer; attach the block to the
+            # same parent on the specified voting chain
             voting_chain = self.voting_chains[new_block.block_chain]
-            parent_block = voting_chain.add_block_by_fork_choice_rule(new_block)
-
-            voting_chain_genesis = voting_chain.vertex_to_blocks[voting_chain.root]
-
-            # Find max depth voted by parent and have new block vote for all
-            # subsequent depths up to its own
-            if parent_block.id==voting_chain_genesis.id:
-                new_block.set_max_voted_block_depth(0)
-                vote_depth = 1
-            else:
-                new_block.set_max_voted_block_depth(parent_block.max_voted_block_depth)
-                vote_depth = parent_block.max_voted_block_depth+1
-
-            block_depth = voting_chain.depth[voting_chain.block_to_vertices[new_block.id]]
-            # Get depth array
-            depth_array = self.depth.get_array()
-
-            # Find indices where depth is greater than max depth voted by parent
-            while vote_depth<=block_depth:
-                choices = np.where(depth_array==vote_depth)[0]
-                # Exhausted depth of proposer tree
-                if len(choices)==0:
-                    break
-                voted_block = self.vertex_to_blocks[self.tree.vertex(np.random.choice(choices))]
-                new_block.add_referenced_block(voted_block)
-                voted_block.add_referenced_block(new_block)
-                new_block.set_max_voted_block_depth(vote_depth)
-                vote_depth+=1
-
-            return parent_block
+            parent_block = voting_chain.get_block_by_id(new_block.parent_id)
+            return voting_chain.add_block_by_parent(new_block, parent_block)
 
     def add_block_by_fork_choice_rule(self, block):
-        # Choose which type of block
-        self.set_block_chain(block)
+        # Choose which type of block unless it has already been assigned a
+        # voting chain
+        if not hasattr(block, 'block_chain'):
+            self.set_block_chain(block)
 
-        if block.block_type=='proposer':
+        if block.block_type==BlockType.PROPOSER:
             # If proposer block, call LongestChain's add_block_by_fork_choice_rule
             return super(Prism, self).add_block_by_fork_choice_rule(block)
         else:
@@ -223,21 +349,20 @@ class Prism(LongestChain):
             # on specified chain
             voting_chain = self.voting_chains[block.block_chain]
             parent_block = voting_chain.add_block_by_fork_choice_rule(block)
-
-            voting_chain_genesis = voting_chain.vertex_to_blocks[voting_chain.root]
+            self.num_added+=1
 
             # Find max depth voted by parent and have new block vote for all
             # subsequent depths up to its own
-            if parent_block.id==voting_chain_genesis.id:
+            if parent_block.id==voting_chain.genesis.id:
                 block.set_max_voted_block_depth(0)
                 vote_depth = 1
             else:
                 block.set_max_voted_block_depth(parent_block.max_voted_block_depth)
                 vote_depth = parent_block.max_voted_block_depth+1
 
-            block_depth = voting_chain.depth[voting_chain.block_to_vertices[block.id]]
+            block_depth = block.depth
             # Get depth array
-            depth_array = self.depth.get_array()
+            depth_array = self.depth_array()
 
             # Find indices where depth is greater than max depth voted by parent
             while vote_depth<=block_depth:
@@ -245,7 +370,7 @@ class Prism(LongestChain):
                 # Exhausted depth of proposer tree
                 if len(choices)==0:
                     break
-                voted_block = self.vertex_to_blocks[self.tree.vertex(np.random.choice(choices))]
+                voted_block = self.blockstore.get_block(np.random.choice(choices))
                 block.add_referenced_block(voted_block)
                 voted_block.add_referenced_block(block)
                 block.set_max_voted_block_depth(vote_depth)
@@ -264,6 +389,30 @@ class Prism(LongestChain):
             # on specified blocktree
             return self.voting_chains[chain].fork_choice_rule()
 
+    # the proposer chain alone is not the ledger, so moving it leaves the
+    # inclusion counts to included_txs
+    def _include_txs(self, block):
+        pass
+
+    def _exclude_txs(self, block):
+        pass
+
+    def included_txs(self):
+        if self.ledger_num_added!=self.num_added:
+            ledger = self.main_chains()[0]
+            common = 0
+            for old_block, new_block in zip(self.ledger, ledger):
+                if old_block is not new_block:
+                    break
+                common+=1
+            for block in self.ledger[common:]:
+                self._count_txs(block, -1)
+            for block in ledger[common:]:
+                self._count_txs(block, 1)
+            self.ledger = ledger
+            self.ledger_num_added = self.num_added
+        return self.included
+
     def main_chains(self):
         depth = 1
 
@@ -272,17 +421,17 @@ class Prism(LongestChain):
         for voting_chain in self.voting_chains:
             main_voting_chain = voting_chain.main_chains()[0]
             for block in main_voting_chain:
-                if block.id!='Genesis':
+                if block.id!=GENESIS_ID:
                     for voted_block in block.referenced_blocks:
                         if voted_block.id not in vote_dict:
                             vote_dict[voted_block.id]=0
                         vote_dict[voted_block.id]+=1
 
         # Get depth array
-        depth_array = self.depth.get_array()
+        depth_array = self.depth_array()
         depth = 1
 
-        main_chains = [[self.vertex_to_blocks[self.root]]]
+        main_chains = [[self.genesis]]
         while True:
             vertices_at_depth = np.where(depth_array==depth)[0]
             # Exhausted depth of proposer tree
@@ -291,13 +440,14 @@ class Prism(LongestChain):
             max_votes = 0
             max_voted_block = None
             for vertex in vertices_at_depth:
-                if self.vertex_to_blocks[vertex].id in vote_dict:
-                    votes = vote_dict[self.vertex_to_blocks[vertex].id]
+                block = self.blockstore.get_block(vertex)
+                if block.id in vote_dict:
+                    votes = vote_dict[block.id]
                 else:
                     votes = 0
                 if votes>=max_votes:
                     max_votes = votes
-                    max_voted_block = self.vertex_to_blocks[vertex]
+                    max_voted_block = block
 
             main_chains[0]+=list(max_voted_block.referenced_blocks)
             main_chains[0].append(max_voted_block)
@@ -305,8 +455,8 @@ class Prism(LongestChain):
         return main_chains
             
 class LongestChainWithPool(LongestChain):
-    def __init__(self, block_size=50):
-        super(LongestChainWithPool, self).__init__()
+    def __init__(self, blockstore=None, block_size=50):
+        super(LongestChainWithPool, self).__init__(blockstore)
         self.pool_blocks = np.array([])
         self.max_referenced_blocks = 10*block_size
 
@@ -326,10 +476,15 @@ class LongestChainWithPool(LongestChain):
 
             self.pool_blocks = np.array([])
 
+    def ledger_blocks(self, block):
+        if block is self.genesis:
+            return [block]
+        return list(block.referenced_blocks)+[block]
+
     def add_block_by_fork_choice_rule(self, new_block):
-        if new_block.block_type=='pool':
+        if new_block.block_type==BlockType.POOL:
             self.add_pool_block(new_block)
-        elif new_block.block_type=='tree':
+        elif new_block.block_type==BlockType.TREE:
             self.add_tree_block(new_block)
 
     def main_chains(self):
@@ -340,7 +495,7 @@ class LongestChainWithPool(LongestChain):
         for main_chain in tree_main_chains:
             main_chains.append([])
             for tree_block in main_chain:
-                if self.block_to_vertices[tree_block.id]!=self.root:
+                if tree_block is not self.genesis:
                     main_chains[-1]+=list(tree_block.referenced_blocks)
                 main_chains[-1].append(tree_block)
 
@@ -348,63 +503,113 @@ class LongestChainWithPool(LongestChain):
 
 
 class GHOST(Algorithm):
-    def __init__(self, validate_length=False):
-        super(GHOST, self).__init__()
-        self.subtree_size = self.tree.new_vertex_property('int')
-        self.subtree_size[self.root] = 0
+    def __init__(self, blockstore=None, validate_length=False):
+        super(GHOST, self).__init__(blockstore)
+        # number of descendants of every vertex, and its child with the most
+        # descendants (-1 for leaves), indexed by store index like seen. On a
+        # tie the current heaviest child is kept, so a child must strictly
+        # overtake it
+        self.subtree_size = np.zeros(self.seen.shape[0], dtype=np.int32)
+        self.heaviest_child = np.full(self.seen.shape[0], -1, dtype=np.int32)
+        # heaviest path from the root, indexed by depth
+        self.heaviest_path = [self.root]
+        # increments of subtree sizes deferred along the heaviest path:
+        # pending[d] is owed to every vertex of the path above depth d
+        self.pending = [0]
+        self.tip = self.root
         self.validate_length = validate_length
 
+    def _grow(self):
+        super(GHOST, self)._grow()
+        n = self.subtree_size.shape[0]
+        subtree_size = np.zeros(self.seen.shape[0], dtype=np.int32)
+        subtree_size[:n] = self.subtree_size
+        self.subtree_size = subtree_size
+        heaviest_child = np.full(self.seen.shape[0], -1, dtype=np.int32)
+        heaviest_child[:n] = self.heaviest_child
+        self.heaviest_child = heaviest_child
+
+    def _on_heaviest_path(self, vertex, depth):
+        return depth<len(self.heaviest_path) and self.heaviest_path[depth]==vertex
+
+    # subtree size of the vertex at depth on the heaviest path, including the
+    # increments deferred below it
+    def _path_subtree_size(self, depth):
+        return self.subtree_size[self.heaviest_path[depth]]+sum(self.pending[depth+1:])
+
+    # switch the heaviest path to go through child of the path vertex at depth
+    def _switch_heaviest_path(self, depth, child):
+        # settle the increments deferred below depth, since the vertices
+        # leaving the path must hold their full subtree sizes
+        owed = 0
+        for d in range(len(self.heaviest_path)-1, depth, -1):
+            self.subtree_size[self.heaviest_path[d]]+=owed
+            owed+=self.pending[d]
+        self.subtree_size[self.heaviest_path[depth]]+=owed
+        self.pending[depth]+=owed
+        del self.heaviest_path[depth+1:]
+        del self.pending[depth+1:]
+
+        self.heaviest_child[self.heaviest_path[depth]] = child
+        while child!=-1:
+            self.heaviest_path.append(child)
+            self.pending.append(0)
+            child = int(self.heaviest_child[child])
+        self.tip = self.heaviest_path[-1]
+
     def main_chains(self):
         # call Algorithm's main_chains function
         main_chains = super(GHOST, self).main_chains()
 
         if self.validate_length:
-            depths = self.depth.get_array()
+            depths = self.depth_array()
             max_depth = np.amax(depths)
             assert max_depth+1==len(main_chains[0]), 'Mismatch between Longest Chain Main Chain and GHOST Main Chain'
 
         return main_chains
 
-    def add_block_by_fork_choice_rule(self, new_block):
-        # call Algorithm's add_block function
-        super(GHOST, self).add_block_by_fork_choice_rule(new_block)
-
-        # set subtree size of leaf vertex to be 0
-        vertex = self.block_to_vertices[new_block.id]
-        self.subtree_size[vertex] = 0
+    def add_block_by_parent(self, new_block, parent_block):
+        # call Algorithm's add_block_by_parent function
+        parent_block = super(GHOST, self).add_block_by_parent(new_block,
+                parent_block)
+
+        child = self.blockstore.index(new_block.id)
+        depth = int(self.blockstore.depths[child])
+        parents = self.blockstore.parents
+        subtree_size = self.subtree_size
+        heaviest_child = self.heaviest_child
+
+        # increment subtree sizes from the new block up to the heaviest path,
+        # switching a vertex's heaviest child when the child on this path
+        # overtakes it. Above the heaviest path the new block lies under every
+        # vertex's heaviest child, so no choice can flip there, and the
+        # increment is deferred instead of walking on to the root
+        while True:
+            vertex = int(parents[child])
+            depth-=1
+            subtree_size[vertex]+=1
+            heaviest = int(heaviest_child[vertex])
+            if self._on_heaviest_path(vertex, depth):
+                if heaviest==-1:
+                    # new block extends the heaviest path
+                    heaviest_child[vertex] = child
+                    self.heaviest_path.append(child)
+                    self.pending.append(0)
+                    self.tip = child
+                elif heaviest!=child and \
+                        subtree_size[child]>=len(self.heaviest_path)-depth-1 and \
+                        subtree_size[child]>self._path_subtree_size(depth+1):
+                    # a heaviest path vertex has at least the path below it
+                    # as descendants, so only a branch as large can overtake
+                    self._switch_heaviest_path(depth, child)
+                self.pending[depth]+=1
+                break
+            if heaviest==-1 or (heaviest!=child and
+                    subtree_size[child]>subtree_size[heaviest]):
+                heaviest_child[vertex] = child
+            child = vertex
 
-        # increment subtree size for all blocks along path from root to new leaf
-        # vertex
-        while vertex!=self.root:
-            block = self.vertex_to_blocks[vertex]
-            vertex = self.block_to_vertices[block.parent_id]
-            self.subtree_size[vertex]+=1
+        return parent_block
 
     def fork_choice_rule(self):
-        # start with root vertex
-        max_subtree_vertices = [self.root]
-        children = []
-        for vertex in max_subtree_vertices:
-            children+=list(self.root.out_edges())
-
-        # search for leaf vertex
-        while len(children)!=0:
-            max_subtree_size = 0
-            max_subtree_vertices = []
-            # search for child with max subtree size
-            for edge in children:
-                target = edge.target()
-                if self.subtree_size[target]>max_subtree_size:
-                    max_subtree_vertices = [target]
-                    max_subtree_size = self.subtree_size[target]
-                elif self.subtree_size[target]==max_subtree_size:
-                    max_subtree_vertices.append(target)
-            children = []
-            for vertex in max_subtree_vertices:
-                children+=list(vertex.out_edges())
-
-        parent_blocks = [self.vertex_to_blocks[vertex] for vertex in
-                max_subtree_vertices]
-
-        return parent_blocks
-
+        return [self.blockstore.get_block(self.tip)]
@@ -0,0 +1,132 @@
+import heapq, numpy as np
+from network import link_delays
+from constants import TX_SIZE
+
+'''
+Arrival times of transactions at every node, for the virtual mempool.
+
+Instead of scheduling one delivery event per transaction and neighbor, the
+time every transaction reaches every node is computed when the transaction
+is generated, in one vectorized pass per batch of transactions. A node's
+mempool at any time is then the transactions that have reached it and are not
+yet included on its main chain, found with a vectorized mask (see
+mempool.VirtualMempool).
+
+Under constant network models the delay from a source to a node is taken to
+be the same for every transaction, that of a transaction of TX_SIZE, so only
+an N x N matrix of per-source offsets (the shortest relay delay from source
+to node) is kept and replayed transaction sizes are not used. Under random models every
+transaction gets its own row of arrival times at all nodes, kept in a float32
+matrix of num_txs x N. Random models need every node to hear transactions
+directly from the source, as in the default complete topology, since relayed
+arrival times would need one shortest path computation per transaction.
+
+Nodes that a transaction never reaches have an arrival time of inf.
+'''
+class TransactionArrivals():
+    def __init__(self, num_nodes, offsets=None, topology=None, model=None,
+            propagation_delays=None, capacity=1024):
+        self.num_nodes = num_nodes
+        self.size = 0
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.sources = np.zeros(capacity, dtype=np.int32)
+
+        # per-source offsets under constant models, otherwise per-tx arrival
+        # times drawn from the model over the links of the topology
+        self.offsets = offsets
+        self.topology = topology
+        self.model = model
+        self.propagation_delays = propagation_delays
+        self.times = None if offsets is not None else \
+                np.zeros((capacity, num_nodes), dtype=np.float32)
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self, capacity):
+        for name in ['timestamps', 'sources', 'times']:
+            column = getattr(self, name)
+            if column is None:
+                continue
+            grown = np.zeros((capacity,)+column.shape[1:], dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    # add the arrivals of txs of sizes generated at timestamps by nodes
+    # sources, which must be the next tx ids
+    def add(self, timestamps, sources, sizes=TX_SIZE):
+        num_txs = len(timestamps)
+        if self.size+num_txs>self.timestamps.shape[0]:
+            self._grow(max(2*self.timestamps.shape[0], self.size+num_txs))
+        ids = np.arange(self.size, self.size+num_txs)
+        self.timestamps[ids] = timestamps
+        self.sources[ids] = sources
+        self.size+=num_txs
+        if self.times is None:
+            return
+
+        # every tx is sent over every link of its source, so gather the links
+        # of all sources in one pass and draw a delay for each
+        sources = self.sources[ids]
+        degrees = self.topology.degrees()[sources]
+        tx_index = np.repeat(np.arange(num_txs), degrees)
+        first_link = np.cumsum(degrees)-degrees
+        links = self.topology.indptr[sources][tx_index]+ \
+                np.arange(tx_index.shape[0])-first_link[tx_index]
+        sizes = np.broadcast_to(sizes, (num_txs,))[tx_index]
+        delays = link_delays(self.model, sizes, links.shape[0],
+                None if self.propagation_delays is None else
+                self.propagation_delays[links])
+
+        rows = np.full((num_txs, self.num_nodes), np.inf, dtype=np.float32)
+        rows[np.arange(num_txs), sources] = self.timestamps[ids]
+        rows[tx_index, self.topology.indices[links]] = self.timestamps[ids][tx_index]+delays
+        self.times[ids] = rows
+
+    # arrival times at node_id of txs start to end
+    def arrival_times(self, node_id, start, end):
+        if self.times is not None:
+            return self.times[start:end, node_id]
+        return self.timestamps[start:end]+self.offsets[self.sources[start:end], node_id]
+
+'''
+Shortest delay from every node to every other over links of the given delays,
+by Dijkstra's algorithm from each source. Delays of links not in the topology
+are inf, and a node reaches itself with no delay.
+'''
+def shortest_delays(topology, delays):
+    num_nodes = topology.num_nodes
+    offsets = np.full((num_nodes, num_nodes), np.inf, dtype=np.float32)
+    indptr = topology.indptr.tolist()
+    indices = topology.indices.tolist()
+    delays = delays.tolist()
+    for source in range(0, num_nodes):
+        distances = [np.inf]*num_nodes
+        heap = [(0.0, source)]
+        while len(heap)>0:
+            distance, node = heapq.heappop(heap)
+            if distance>=distances[node]:
+                continue
+            distances[node] = distance
+            for link in range(indptr[node], indptr[node+1]):
+                if distance+delays[link]<distances[indices[link]]:
+                    heapq.heappush(heap, (distance+delays[link], indices[link]))
+        offsets[source] = distances
+    return offsets
+
+'''
+Offsets of every source and node under a constant network model: the delay of
+the direct link, or of the shortest relay path when nodes relay txs
+'''
+def constant_offsets(topology, model, propagation_delays=None, relay=False):
+    delays = link_delays(model, TX_SIZE, topology.num_links, propagation_delays)
+    delays = np.asarray(delays, dtype=np.float64)
+    if relay:
+        return shortest_delays(topology, delays)
+
+    num_nodes = topology.num_nodes
+    offsets = np.full((num_nodes, num_nodes), np.inf, dtype=np.float32)
+    sources, targets = topology.links()
+    offsets[sources, targets] = delays
+    offsets[np.arange(num_nodes), np.arange(num_nodes)] = 0
+    return offsets
@@ -0,0 +1,51 @@
+import sys, time, numpy as np
+from algorithms import LongestChain
+from block import Block
+
+'''
+Micro-benchmark comparing LongestChain.fork_choice_rule, which keeps the tips
+at max depth up to date as blocks are added, with the previous approach of
+scanning the whole depth array on every call.
+
+    python -m benchmarks.fork_choice [num_blocks]
+'''
+
+# previous fork choice rule: scan depths of all seen blocks
+def scan_fork_choice_rule(blocktree):
+    depth_array = blocktree.depth_array()
+    max_indices = np.where(depth_array==np.amax(depth_array))[0]
+    return [blocktree.blockstore.get_block(i) for i in max_indices]
+
+def build_blocktree(num_blocks, fork_probability=0.1):
+    blocktree = LongestChain()
+    for i in range(0, num_blocks):
+        if np.random.random()<fork_probability:
+            # fork off a recent block
+            parent_block = blocktree.blockstore.get_block(
+                    max(0, len(blocktree.blockstore)-np.random.randint(1, 10)))
+        else:
+            parent_block = blocktree.fork_choice_rule()[0]
+        blocktree.add_block_by_parent(Block(), parent_block)
+    return blocktree
+
+def time_calls(f, blocktree, num_calls):
+    start = time.perf_counter()
+    for i in range(0, num_calls):
+        f(blocktree)
+    return (time.perf_counter()-start)/num_calls
+
+if __name__=='__main__':
+    num_blocks = int(sys.argv[1]) if len(sys.argv)>1 else 100000
+    num_calls = 1000
+    np.random.seed(0)
+
+    blocktree = build_blocktree(num_blocks)
+    assert scan_fork_choice_rule(blocktree)==blocktree.fork_choice_rule()
+
+    incremental = time_calls(lambda b: b.fork_choice_rule(), blocktree, num_calls)
+    scan = time_calls(scan_fork_choice_rule, blocktree, num_calls)
+
+    print(f'Blocks,{num_blocks}')
+    print(f'Incremental fork choice (usec/call),{incremental*1e6}')
+    print(f'Full scan fork choice (usec/call),{scan*1e6}')
+    print(f'Speedup,{scan/incremental}')
@@ -0,0 +1,343 @@
+import sys, os, json, time, random, resource, tempfile, numpy as np
+import multiprocessing
+from optparse import OptionParser
+from block import Block, LinkedBlock, PrismBlock, BlockType
+from blockstore import BlockStore
+from events import Proposal
+from node import Node
+from global_chain import GlobalMainChain
+from finalization import FinalizationTracker
+from transactions import TransactionTable
+
+'''
+Benchmarks of the simulator's hot paths at increasing scale.
+
+Each benchmark runs one subsystem for each fork choice rule it applies to and
+reports events/sec, where an event is
+
+    fork_choice       - a block added by the fork choice rule
+    fork_choice_depth - a block added by the fork choice rule on top of a
+                        chain num_blocks deep, so a cost growing with chain
+                        depth shows as events/sec dropping with scale
+    process_buffer    - a proposal delivered to and processed by a node
+    propose           - a transaction included in a proposed block
+    global_main_chain - a proposal followed by a global main chain update
+    finalization      - a global main chain block arrived and finalized
+    set_timestamps    - a Prism ledger block given its timestamps
+    log_txs           - a transaction row written to transactions.csv
+    log_blocks        - a block row written to blocks.csv
+
+Every case runs in a fresh process, so its peak memory (maximum resident set
+size) is measured in isolation. Once a case takes longer than max_seconds,
+larger scales of the same benchmark and rule are skipped.
+
+Results are written to a JSON baseline with --save. Without --save, they are
+compared against the stored baseline, flagging cases whose events/sec dropped
+or whose peak memory grew by more than the tolerance.
+
+    python -m benchmarks.suite [--quick] [--save] [-b baseline.json]
+'''
+
+RULES = ['longest-chain', 'GHOST', 'longest-chain-with-pool', 'Prism']
+# rules whose main chain is a path in the block tree
+TREE_RULES = ['longest-chain', 'GHOST', 'longest-chain-with-pool']
+
+NODES = [10, 100, 1000]
+BLOCKS = [10**3, 10**4, 10**5]
+TXS = [10**4, 10**5, 10**6]
+
+MAX_BLOCK_SIZE = 50
+
+def create_block(rule, txs=None, proposal_timestamp=0):
+    if rule=='longest-chain' or rule=='GHOST':
+        return Block(txs=txs, proposal_timestamp=proposal_timestamp)
+    elif rule=='longest-chain-with-pool':
+        return LinkedBlock(txs=txs, proposal_timestamp=proposal_timestamp,
+                block_type=BlockType.TREE)
+    elif rule=='Prism':
+        return PrismBlock(txs=txs, proposal_timestamp=proposal_timestamp)
+
+def create_node(rule, blockstore, node_id=0):
+    return Node(node_id, rule, 'FIFO', MAX_BLOCK_SIZE, blockstore)
+
+# add a block by fork choice, or for tree rules fork off a recent block with
+# probability fork_probability
+def add_block(rule, blocktree, block, fork_probability=0.1):
+    if rule in TREE_RULES and np.random.random()<fork_probability:
+        store = blocktree.blockstore
+        parent_block = store.get_block(max(0, len(store)-np.random.randint(1, 10)))
+        blocktree.add_block_by_parent(block, parent_block)
+    else:
+        blocktree.add_block_by_fork_choice_rule(block)
+
+def bench_fork_choice(rule, num_blocks):
+    blocktree = create_node(rule, BlockStore()).local_blocktree
+    blocks = [create_block(rule) for i in range(0, num_blocks)]
+
+    start = time.perf_counter()
+    for block in blocks:
+        add_block(rule, blocktree, block)
+    return num_blocks, time.perf_counter()-start
+
+def bench_fork_choice_depth(rule, num_blocks, num_added=1000):
+    blocktree = create_node(rule, BlockStore()).local_blocktree
+    for i in range(0, num_blocks):
+        add_block(rule, blocktree, create_block(rule))
+    blocks = [create_block(rule) for i in range(0, num_added)]
+
+    start = time.perf_counter()
+    for block in blocks:
+        add_block(rule, blocktree, block)
+    return num_added, time.perf_counter()-start
+
+def bench_process_buffer(rule, num_blocks):
+    store = BlockStore()
+    proposer = create_node(rule, store, 0)
+    proposals = []
+    for i in range(0, num_blocks):
+        block = create_block(rule, proposal_timestamp=i)
+        add_block(rule, proposer.local_blocktree, block)
+        proposal = Proposal(i)
+        proposal.set_block(block)
+        proposals.append(proposal)
+    # network delays reorder nearby deliveries
+    order = np.argsort(np.arange(num_blocks)+np.random.uniform(0, 10, num_blocks))
+
+    receiver = create_node(rule, store, 1)
+    start = time.perf_counter()
+    for i, index in enumerate(order.tolist()):
+        receiver.receive(proposals[index])
+        # a node processes its buffer when it proposes
+        if i%100==99:
+            receiver.process_buffer()
+    receiver.process_buffer()
+    return num_blocks, time.perf_counter()-start
+
+def bench_propose(rule, num_txs):
+    node = create_node(rule, BlockStore())
+    for tx in range(0, num_txs):
+        node.add_tx(tx)
+
+    start = time.perf_counter()
+    num_included = 0
+    for i in range(0, num_txs//MAX_BLOCK_SIZE):
+        proposal = node.propose(Proposal(i), MAX_BLOCK_SIZE, rule, 'Zero')
+        num_included+=proposal.block.num_txs
+    return num_included, time.perf_counter()-start
+
+def bench_global_main_chain(rule, num_nodes, num_blocks, num_proposals=1000):
+    store = BlockStore()
+    nodes = [create_node(rule, store, node_id) for node_id in range(0, num_nodes)]
+    # every node has seen a common chain of num_blocks blocks
+    parent_block = nodes[0].local_blocktree.genesis
+    for i in range(0, num_blocks):
+        block = create_block(rule, proposal_timestamp=i)
+        for node in nodes:
+            node.local_blocktree.add_block_by_parent(block, parent_block)
+        parent_block = block
+    global_chain = GlobalMainChain(store, num_nodes)
+    tracker = FinalizationTracker(TransactionTable(), 6)
+
+    start = time.perf_counter()
+    for i in range(0, num_proposals):
+        node = nodes[np.random.randint(num_nodes)]
+        node.local_blocktree.add_block_by_fork_choice_rule(create_block(rule,
+            proposal_timestamp=num_blocks+i))
+        global_chain.update_node(node.node_id, node.local_blocktree)
+        tracker.update(global_chain, global_chain.update())
+    return num_proposals, time.perf_counter()-start
+
+# chain of num_blocks blocks with txs_per_block txs each, and its txs
+def build_chain(rule, num_blocks, txs_per_block=10):
+    txs = TransactionTable(num_blocks*txs_per_block)
+    txs.append(np.arange(0, num_blocks*txs_per_block)/txs_per_block,
+            np.zeros(num_blocks*txs_per_block, dtype=np.int32))
+    store = BlockStore()
+    blocktree = create_node(rule, store).local_blocktree
+    parent_block = blocktree.genesis
+    blocks = []
+    for i in range(0, num_blocks):
+        block = create_block(rule, np.arange(i*txs_per_block,
+            (i+1)*txs_per_block), proposal_timestamp=i+1)
+        blocktree.add_block_by_parent(block, parent_block)
+        blocks.append(block)
+        parent_block = block
+    return txs, blocktree, blocks
+
+def bench_finalization(rule, num_blocks):
+    txs, blocktree, blocks = build_chain(rule, num_blocks)
+    global_chain = GlobalMainChain(blocktree.blockstore, 0)
+    tracker = FinalizationTracker(txs, 6)
+
+    start = time.perf_counter()
+    for block in blocks:
+        fork_depth = global_chain._move_to(blocktree.blockstore.index(block.id))
+        tracker.update(global_chain, fork_depth)
+    return num_blocks, time.perf_counter()-start
+
+def bench_set_timestamps(rule, num_blocks):
+    from coordinator import Coordinator
+    txs, blocktree, blocks = build_chain(rule, num_blocks)
+    c = Coordinator({'tx_error_prob': 0.1, 'num_nodes': 10, 'num_adversaries': 1,
+        'fork_choice_rule': rule})
+    c.set_transactions(txs)
+
+    start = time.perf_counter()
+    c.set_timestamps(blocks)
+    return num_blocks, time.perf_counter()-start
+
+def bench_log_txs(rule, num_txs):
+    import logger
+    txs = TransactionTable(num_txs)
+    txs.append(np.sort(np.random.uniform(0, 1000, num_txs)),
+            np.random.randint(100, size=num_txs))
+    txs.main_chain_timestamps[:num_txs] = txs.timestamps[:num_txs]+10
+    txs.finalization_timestamps[:num_txs//2] = txs.timestamps[:num_txs//2]+60
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        logger.log_txs({'log_dir': directory}, txs)
+        return num_txs, time.perf_counter()-start
+
+def bench_log_blocks(rule, num_blocks):
+    import logger
+    txs, blocktree, blocks = build_chain(rule, num_blocks)
+    proposals = []
+    for block in blocks:
+        proposal = Proposal(block.proposal_timestamp)
+        proposal.set_block(block)
+        proposals.append(proposal)
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        logger.log_blocks({'log_dir': directory}, proposals)
+        return num_blocks, time.perf_counter()-start
+
+# benchmark name -> (function, rules, scales as keyword arguments)
+BENCHMARKS = {
+    'fork_choice': (bench_fork_choice, RULES,
+        [{'num_blocks': n} for n in BLOCKS]),
+    'fork_choice_depth': (bench_fork_choice_depth, TREE_RULES,
+        [{'num_blocks': n} for n in BLOCKS]),
+    'process_buffer': (bench_process_buffer, RULES,
+        [{'num_blocks': n} for n in BLOCKS]),
+    'propose': (bench_propose, RULES,
+        [{'num_txs': n} for n in TXS]),
+    'global_main_chain': (bench_global_main_chain, TREE_RULES,
+        [{'num_nodes': n, 'num_blocks': BLOCKS[0]} for n in NODES]+
+        [{'num_nodes': NODES[0], 'num_blocks': n} for n in BLOCKS[1:]]),
+    'finalization': (bench_finalization, TREE_RULES,
+        [{'num_blocks': n} for n in BLOCKS]),
+    'set_timestamps': (bench_set_timestamps, ['Prism'],
+        [{'num_blocks': n} for n in BLOCKS]),
+    'log_txs': (bench_log_txs, ['longest-chain'],
+        [{'num_txs': n} for n in TXS]),
+    'log_blocks': (bench_log_blocks, RULES,
+        [{'num_blocks': n} for n in BLOCKS]),
+}
+
+def case_key(name, rule, scale):
+    return '/'.join([name, rule]+[f'{key}={value}' for key, value in
+        sorted(scale.items())])
+
+# run one case in the current process and send its result to results
+def run_case(name, rule, scale, seed, results):
+    np.random.seed(seed)
+    random.seed(seed)
+    function = BENCHMARKS[name][0]
+    num_events, seconds = function(rule, **scale)
+    results.put({'events': num_events,
+        'seconds': seconds,
+        'events_per_sec': num_events/seconds if seconds>0 else float('inf'),
+        # maximum resident set size, reported in KB on Linux
+        'peak_memory_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0})
+
+def run_suite(names, quick=False, max_seconds=120, seed=0):
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for name in names:
+        function, rules, scales = BENCHMARKS[name]
+        if quick:
+            scales = scales[:1]
+        for rule in rules:
+            skip = False
+            for scale in scales:
+                key = case_key(name, rule, scale)
+                if skip:
+                    print(f'{key}: skipped')
+                    continue
+                queue = context.Queue()
+                process = context.Process(target=run_case, args=(name, rule,
+                    scale, seed, queue))
+                process.start()
+                try:
+                    result = queue.get(timeout=max_seconds)
+                except Exception:
+                    result = None
+                process.join(1)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+                if result is None:
+                    print(f'{key}: no result within {max_seconds} sec')
+                    skip = True
+                    continue
+                results[key] = result
+                print(f'{key}: {result["events_per_sec"]:.1f} events/sec, '
+                        f'{result["peak_memory_mb"]:.1f} MB')
+                skip = result['seconds']>max_seconds
+    return results
+
+# cases whose events/sec or peak memory regressed by more than tolerance
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        base = baseline[key]
+        if result['events_per_sec']<(1-tolerance)*base['events_per_sec']:
+            regressions.append(f'{key}: {result["events_per_sec"]:.1f} events/sec, '
+                    f'baseline {base["events_per_sec"]:.1f}')
+        if result['peak_memory_mb']>(1+tolerance)*base['peak_memory_mb']:
+            regressions.append(f'{key}: {result["peak_memory_mb"]:.1f} MB, '
+                    f'baseline {base["peak_memory_mb"]:.1f}')
+    return regressions
+
+if __name__=='__main__':
+    usage = 'usage: python -m benchmarks.suite [options] [benchmark ...]'
+    parser = OptionParser(usage=usage)
+
+    parser.add_option('-b', '--baseline', type='string',
+            action='store', dest='baseline',
+            default=os.path.join(os.path.dirname(__file__), 'baseline.json'),
+            help='baseline file; default is benchmarks/baseline.json')
+    parser.add_option('--save', action='store_true', dest='save',
+            default=False, help='save the results as the new baseline')
+    parser.add_option('--quick', action='store_true', dest='quick',
+            default=False, help='only run the smallest scale')
+    parser.add_option('-t', '--tolerance', type='float',
+            action='store', dest='tolerance', default=0.25,
+            help='relative slowdown or memory growth flagged as a regression')
+    parser.add_option('-m', '--max-seconds', type='float',
+            action='store', dest='max_seconds', default=120,
+            help='skip larger scales once a case takes longer than this')
+
+    (options, args) = parser.parse_args(sys.argv[1:])
+    names = args if len(args)>0 else list(BENCHMARKS.keys())
+
+    results = run_suite(names, options.quick, options.max_seconds)
+
+    if options.save:
+        with open(options.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Saved baseline to {options.baseline}')
+    elif os.path.exists(options.baseline):
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, options.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if len(regressions)>0:
+            sys.exit(1)
+        print('No regressions')
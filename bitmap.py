@@ -0,0 +1,21 @@
+'''
+Growable bitmap of dense integer ids, one bit per id.
+
+Nodes keep the txs and proposals they have seen in bitmaps indexed by tx id
+and proposal id, which are assigned densely from 0. A node that has seen T
+txs then holds T/8 bytes instead of a Python set entry of tens of bytes per
+tx, which is what lets relay and compact block runs scale to many nodes.
+'''
+class Bitmap():
+    def __init__(self, capacity=1024):
+        self.bits = bytearray((capacity+7)//8)
+
+    def add(self, id):
+        byte = id>>3
+        if byte>=len(self.bits):
+            self.bits+=bytearray(max(len(self.bits), byte+1-len(self.bits)))
+        self.bits[byte]|=1<<(id&7)
+
+    def __contains__(self, id):
+        byte = id>>3
+        return byte<len(self.bits) and (self.bits[byte]>>(id&7))&1==1
@@ -1,29 +1,63 @@
-import numpy as np, uuid
-
+import numpy as np
+from enum import IntEnum
+
+class BlockType(IntEnum):
+    TREE = 0
+    POOL = 1
+    PROPOSER = 2
+    VOTER = 3
+
+# id shared by the genesis block of every block store
+GENESIS_ID = 0
+
+'''
+Blocks are slotted, so they carry no per-instance __dict__. Ids are sequential
+integers; the next id is kept on the class so it can be saved and restored
+along with a simulation. Transaction ids live in a preallocated int32 buffer of
+which the first num_txs entries are used; the buffer grows by doubling when a
+tx is added to a full block.
+'''
 class Block():
+    __slots__ = ['_txs', 'num_txs', 'id', 'proposal_timestamp', 'parent_id',
+            'finalization_timestamp', 'depth', 'block_type']
+
+    next_id = GENESIS_ID+1
+
     def __init__(self, txs=None, id=None, parent_id=None, proposal_timestamp=0,
-            block_type = 'tree', depth=0):
-        if txs is None:
-            self.txs = np.array([])
-        else:
-            self.txs = txs.copy()
+            block_type=BlockType.TREE, depth=0, capacity=0):
+        # ids of transactions in the transaction table
+        num_txs = 0 if txs is None else len(txs)
+        self._txs = np.empty(max(num_txs, capacity), dtype=np.int32)
+        if txs is not None:
+            self._txs[:num_txs] = txs
+        self.num_txs = num_txs
         if id is None:
-            self.id = uuid.uuid4().hex[0:5] 
+            self.id = Block.next_id
+            Block.next_id+=1
         else:
             self.id = id
 
         self.proposal_timestamp = proposal_timestamp
-        self.parent_id = parent_id 
+        self.parent_id = parent_id
         self.finalization_timestamp = None
         self.depth = depth
 
-        self.block_type = block_type 
+        self.block_type = block_type
+
+    @property
+    def txs(self):
+        return self._txs[:self.num_txs]
 
     def set_depth(self, depth):
-        self.depth = depth 
+        self.depth = depth
 
     def add_tx(self, tx):
-        self.txs = np.append(self.txs, tx)
+        if self.num_txs==self._txs.shape[0]:
+            txs = np.empty(max(1, 2*self.num_txs), dtype=np.int32)
+            txs[:self.num_txs] = self._txs
+            self._txs = txs
+        self._txs[self.num_txs] = tx
+        self.num_txs+=1
 
     def set_parent_id(self, parent_id):
         self.parent_id = parent_id
@@ -33,10 +67,12 @@ class Block():
 
 
 class LinkedBlock(Block):
+    __slots__ = ['referenced_blocks']
+
     def __init__(self, txs=None, id=None, parent_id=None, proposal_timestamp=0,
-            block_type = 'tree', referenced_blocks=None):
+            block_type=BlockType.TREE, referenced_blocks=None, capacity=0):
         super(LinkedBlock, self).__init__(txs, id, parent_id, proposal_timestamp,
-                block_type)
+                block_type, capacity=capacity)
 
         if referenced_blocks is None:
             self.referenced_blocks = np.array([])
@@ -48,18 +84,21 @@ class LinkedBlock(Block):
                 referenced_block)
 
 class PrismBlock(LinkedBlock):
+    # block_chain is only set on voter blocks
+    __slots__ = ['max_voted_block_depth', 'block_chain']
+
     def __init__(self, txs=None, id=None, parent_id=None, proposal_timestamp=0,
-            block_type = 'proposer', referenced_blocks=None,
-            max_voted_block_depth=0):
+            block_type=BlockType.PROPOSER, referenced_blocks=None,
+            max_voted_block_depth=0, capacity=0):
 
         super(PrismBlock, self).__init__(txs, id, parent_id, proposal_timestamp,
-                block_type, referenced_blocks)
+                block_type, referenced_blocks, capacity=capacity)
 
         self.max_voted_block_depth = max_voted_block_depth
 
     def set_block_type(self, block_type, chain=0):
         self.block_type = block_type
-        if self.block_type=='voter':
+        if self.block_type==BlockType.VOTER:
             self.block_chain = chain
 
     def set_max_voted_block_depth(self, max_voted_block_depth):
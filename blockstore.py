@@ -0,0 +1,129 @@
+import numpy as np
+from block import Block, GENESIS_ID
+
+'''
+Append-only store holding every block proposed during a simulation.
+
+The store is owned by the Coordinator and shared by all nodes, so each block is
+kept exactly once no matter how many nodes receive it. Blocks are addressed by
+a dense integer index; the tree structure lives in flat parent/depth columns.
+Per-node views of the store (see algorithms.Algorithm) only track which
+indices they have seen.
+'''
+class BlockStore():
+    def __init__(self, capacity=1024):
+        # index -> block
+        self.blocks = []
+        # block id -> index
+        self.block_to_index = {}
+        # index -> indices of children
+        self.children = []
+        self.parents = np.full(capacity, -1, dtype=np.int32)
+        self.depths = np.zeros(capacity, dtype=np.int32)
+        # skip pointers to an ancestor of each block, chosen by depth alone
+        # (skew-binary jump pointers), giving O(log depth) ancestor queries
+        self.jumps = np.zeros(capacity, dtype=np.int32)
+
+        # stores for auxiliary chains (e.g. Prism voting chains), shared
+        # in the same way as the main store
+        self.substores = {}
+
+        # add genesis block
+        self.root = self.add_block(Block(id=GENESIS_ID))
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def capacity(self):
+        return self.parents.shape[0]
+
+    def _grow(self):
+        capacity = 2*self.capacity()
+        parents = np.full(capacity, -1, dtype=np.int32)
+        parents[:len(self)] = self.parents[:len(self)]
+        depths = np.zeros(capacity, dtype=np.int32)
+        depths[:len(self)] = self.depths[:len(self)]
+        jumps = np.zeros(capacity, dtype=np.int32)
+        jumps[:len(self)] = self.jumps[:len(self)]
+        self.parents = parents
+        self.depths = depths
+        self.jumps = jumps
+
+    def substore(self, key):
+        if key not in self.substores:
+            self.substores[key] = BlockStore()
+        return self.substores[key]
+
+    def index(self, block_id):
+        return self.block_to_index.get(block_id)
+
+    def get_block(self, index):
+        return self.blocks[index]
+
+    # add a block to the store given the index of its parent; a block that is
+    # already stored (e.g. received by a second node) is not added again
+    def add_block(self, block, parent_index=None):
+        if block.id in self.block_to_index:
+            return self.block_to_index[block.id]
+
+        index = len(self)
+        if index==self.capacity():
+            self._grow()
+
+        self.blocks.append(block)
+        self.children.append([])
+        self.block_to_index[block.id] = index
+
+        if parent_index is None:
+            self.jumps[index] = index
+        else:
+            parent_block = self.blocks[parent_index]
+            self.parents[index] = parent_index
+            self.depths[index] = self.depths[parent_index]+1
+            self.children[parent_index].append(index)
+            block.set_parent_id(parent_block.id)
+            block.set_depth(parent_block.depth+1)
+
+            # jump over two equal-length jumps of the parent if possible,
+            # otherwise jump to the parent
+            jump = self.jumps[parent_index]
+            depths = self.depths
+            if depths[parent_index]-depths[jump]==depths[jump]-depths[self.jumps[jump]]:
+                self.jumps[index] = self.jumps[jump]
+            else:
+                self.jumps[index] = parent_index
+
+        return index
+
+    def ancestor_at_depth(self, index, depth):
+        if depth>self.depths[index] or depth<0:
+            return None
+        while self.depths[index]>depth:
+            jump = self.jumps[index]
+            if self.depths[jump]>=depth:
+                index = jump
+            else:
+                index = self.parents[index]
+        return index
+
+    def is_ancestor(self, ancestor_index, index):
+        return self.ancestor_at_depth(index, self.depths[ancestor_index])==ancestor_index
+
+    # lowest common ancestor of two blocks; returns None for blocks in
+    # different trees
+    def lca(self, a, b):
+        if self.depths[a]>self.depths[b]:
+            a = self.ancestor_at_depth(a, self.depths[b])
+        else:
+            b = self.ancestor_at_depth(b, self.depths[a])
+        # blocks at equal depth have jumps to equal depths
+        while a!=b:
+            if self.jumps[a]!=self.jumps[b]:
+                a = self.jumps[a]
+                b = self.jumps[b]
+            elif self.parents[a]==-1:
+                return None
+            else:
+                a = self.parents[a]
+                b = self.parents[b]
+        return a
@@ -0,0 +1,37 @@
+import os, gzip, pickle, random, numpy as np
+from block import Block
+from events import Proposal
+
+'''
+Checkpoints of a running simulation.
+
+A checkpoint holds the whole Coordinator (event queue, shared block store,
+every node's blocktree view, mempool, buffer and orphans, transaction table
+and finalization state) together with the state of the random number
+generators and the next block and proposal ids, so a resumed run continues
+exactly as the original would have. It is a gzip-compressed pickle written
+with the highest protocol, which stores NumPy columns as raw buffers, and is
+replaced atomically so an interrupted write never corrupts the last
+checkpoint.
+'''
+
+def save(coordinator, filename, compresslevel=3):
+    state = {'coordinator': coordinator,
+            'numpy_random': np.random.get_state(),
+            'random': random.getstate(),
+            'block_next_id': Block.next_id,
+            'proposal_next_id': Proposal.next_id}
+    partial_filename = f'{filename}.partial'
+    with gzip.open(partial_filename, 'wb', compresslevel=compresslevel) as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(partial_filename, filename)
+
+# restore the random number generators and ids and return the coordinator
+def load(filename):
+    with gzip.open(filename, 'rb') as f:
+        state = pickle.load(f)
+    np.random.set_state(state['numpy_random'])
+    random.setstate(state['random'])
+    Block.next_id = state['block_next_id']
+    Proposal.next_id = state['proposal_next_id']
+    return state['coordinator']
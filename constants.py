@@ -28,3 +28,28 @@ TX_RATE = 1
 Transaction size used for computing network latency when broadcasting transactions 
 '''
 TX_SIZE = 1
+
+'''
+Bytes in a transaction of TX_SIZE, the unit message sizes are measured in;
+transaction sizes in bytes, as in traces, are divided by it
+'''
+TX_BYTES = 500.0
+
+'''
+Mean radius of the earth in km, for great-circle distances between node
+locations
+'''
+EARTH_RADIUS = 6371.0
+
+'''
+Signal speed in optical fiber in km/sec, about 2/3 of the speed of light, used
+for the propagation delay of geographic network models
+'''
+SIGNAL_SPEED = 200000.0
+
+'''
+Sizes in compact block relay, in transactions (of 500 bytes): a block header
+is 80 bytes and every transaction is announced by a 6 byte short id
+'''
+BLOCK_HEADER_SIZE = 80/TX_BYTES
+SHORT_ID_SIZE = 6/TX_BYTES
@@ -1,202 +1,451 @@
 import random, csv, os, numpy as np, time
-import logger
+import logger, checkpoint
 from node import Node
-from events import Proposal
+from events import Proposal, CompactBlock, FetchedBlock
+from block import BlockType
 from algorithms import *
+from blockstore import BlockStore
+from scheduler import EventQueue
+from transactions import TransactionTable
+from constants import TX_SIZE
+from global_chain import GlobalMainChain
+from finalization import FinalizationTracker
+from instrumentation import Instrumentation
+from generate_tx_dataset import poisson_timestamps, TransactionStream
 
 class Coordinator():
     def __init__(self, params):
         self.proposals = np.array([])
-        self.nodes = np.array([])
-        self.txs = np.array([])
+        self.nodes = []
+        self.txs = TransactionTable()
+        self.tx_stream = None
+        # arrival times of txs at every node when nodes have virtual mempools,
+        # in which case txs are never scheduled as events
+        self.arrivals = None
+
+        # blocks proposed by any node are stored once and shared by all nodes
+        self.blockstore = BlockStore()
+
+        # pending transactions, proposals and deliveries in time order
+        self.event_queue = EventQueue()
+
+        # blocks on the main chain of every node, kept up to date as nodes
+        # propose
+        self.global_chain = GlobalMainChain(self.blockstore)
 
         self.params = params
 
-    def add_node(self, node):
-        self.nodes = np.append(self.nodes, node)
+        # progress of the run, kept so a run resumed from a checkpoint
+        # continues where it stopped
+        self.started = False
+        self.processed = 0
+        self.elapsed = 0
+        self.next_checkpoint = None
 
-    def generate_proposals(self):
-        timestamp = 0
+        # phase timers, counters and progress reports of the run
+        self.instrumentation = Instrumentation(params.get('instrumentation', False),
+                params.get('report_interval', 5))
 
-        proposals = []
+        # arrival and finalization of blocks and txs on the global main chain,
+        # tracked as it grows
+        self.finalization = FinalizationTracker(self.txs,
+                compute_finalization_depth(params['tx_error_prob'],
+                    params['num_nodes'], params['num_adversaries']))
 
-        # generate tree proposal events
-        while timestamp<self.params['duration']: 
-            timestamp = timestamp + np.random.exponential(1.0/self.params['tree_proposal_rate'])
-            proposal = Proposal(timestamp, proposal_type='tree') 
-            proposals.append(proposal)
+    def add_node(self, node):
+        self.nodes.append(node)
+        self.global_chain.add_node()
 
-        del proposals[-1]
-        last_proposal = Proposal(self.params['duration'], proposal_type='tree')
-        proposals.append(last_proposal)
+    def generate_proposals(self):
+        duration = self.params['duration']
 
+        # generate tree proposal events, the last one at the end of the
+        # simulation
+        timestamps = np.append(poisson_timestamps(self.params['tree_proposal_rate'],
+            0, duration), duration)
+        proposals = [Proposal(timestamp, proposal_type=BlockType.TREE) for
+                timestamp in timestamps.tolist()]
 
         if self.params['fork_choice_rule']=='longest-chain-with-pool' and self.params['pool_proposal_rate']>0:
-            timestamp = 0
             # generate pool proposal events
-            while timestamp<self.params['duration']: 
-                timestamp = timestamp + np.random.exponential(1.0/self.params['pool_proposal_rate'])
-                proposal = Proposal(timestamp, proposal_type='pool') 
-                proposals.append(proposal)
+            pool_timestamps = poisson_timestamps(self.params['pool_proposal_rate'],
+                    0, duration)
+            proposals+=[Proposal(timestamp, proposal_type=BlockType.POOL) for
+                    timestamp in pool_timestamps.tolist()]
 
         self.proposals = np.asarray(sorted(proposals, key = lambda
             proposal: proposal.timestamp))
 
+    # set the transaction workload, either a TransactionTable generated in
+    # full or a TransactionStream generated one window at a time during run
     def set_transactions(self, dataset):
-        self.txs = np.asarray(dataset)
+        if isinstance(dataset, TransactionStream):
+            self.tx_stream = dataset
+        else:
+            self.txs = dataset
+            self.finalization.txs = dataset
+            if self.arrivals is not None:
+                self.arrivals.add(dataset.timestamps[:len(dataset)],
+                        dataset.sources[:len(dataset)], dataset.sizes[:len(dataset)])
+
+    # generate the next window of a streamed workload and schedule its
+    # transactions, followed by the generation of the window after it
+    def schedule_tx_window(self):
+        instrumentation = self.instrumentation
+        if instrumentation.enabled:
+            started = instrumentation.start()
+        try:
+            timestamps, sources, sizes = next(self.tx_stream)
+        except StopIteration:
+            return
+        ids = self.txs.append(timestamps, sources, sizes)
+        if self.arrivals is None:
+            self.event_queue.extend(timestamps.tolist(), ids.tolist())
+        else:
+            self.arrivals.add(timestamps, sources, sizes)
+        self.event_queue.schedule(self.tx_stream.next_start_time, self.tx_stream)
+        if instrumentation.enabled:
+            instrumentation.stop('workload generation', started)
 
+    # set timestamps of the Prism ledger after the simulation; a block is
+    # finalized by the earliest common block at least finalization depth
+    # deeper
     def set_timestamps(self, global_main_chain):
         finalization_depth = compute_finalization_depth(self.params['tx_error_prob'],
                 self.params['num_nodes'], self.params['num_adversaries'])
 
-        # For each common block
-        # iterate through all transactions and set to complete and add
-        # finalization, main chain arrival timestamps
-        for common_block in global_main_chain:
-            # finalized blocks are finalization depth above common block
-            finalized_blocks = filter(lambda block:
-                 block.depth<=common_block.depth-finalization_depth,
-                global_main_chain)
-            for finalized_block in finalized_blocks:
-                finalized_block.set_finalization_timestamp(common_block.proposal_timestamp)
-                for tx in finalized_block.txs:
-                    # transaction arrives to main chain when finalized block
-                    # is proposed
-                    tx.set_main_chain_arrival_timestamp(finalized_block.proposal_timestamp)
-                    # transaction is finalized when common block is proposed
-                    tx.set_complete()
-                    tx.add_finalization_timestamp(common_block.proposal_timestamp)
-                if hasattr(finalized_block, 'referenced_blocks'):
-                    # referenced blocks have a finalization timestamp and
-                    # proposal timestamp equal
-                    # to the finalized block on the main chain
-                    for ref_block in finalized_block.referenced_blocks:
-                        ref_block.set_finalization_timestamp(finalized_block.finalization_timestamp)
-                        for tx in ref_block.txs:
-                            tx.set_main_chain_arrival_timestamp(finalized_block.proposal_timestamp)
-                            tx.add_finalization_timestamp(finalized_block.finalization_timestamp)
+        main_chain_timestamps = self.txs.main_chain_timestamps
+        finalization_timestamps = self.txs.finalization_timestamps
 
+        # earliest proposal timestamp among common blocks at or below each
+        # depth, by sorting on depth and taking suffix minima
+        depths = np.array([block.depth for block in global_main_chain])
+        proposal_timestamps = np.array([block.proposal_timestamp for block in
+            global_main_chain])
+        order = np.argsort(depths, kind='stable')
+        sorted_depths = depths[order]
+        suffix_min = np.minimum.accumulate(proposal_timestamps[order][::-1])[::-1]
+
+        for finalized_block in global_main_chain:
+            position = np.searchsorted(sorted_depths,
+                    finalized_block.depth+finalization_depth)
+            if position==sorted_depths.shape[0]:
+                continue
+            finalization_timestamp = suffix_min[position]
+            if finalized_block.finalization_timestamp is None or \
+                    finalization_timestamp<finalized_block.finalization_timestamp:
+                finalized_block.set_finalization_timestamp(finalization_timestamp)
+            finalization_timestamp = finalized_block.finalization_timestamp
+            txs = finalized_block.txs
+            # transaction arrives to main chain when finalized block
+            # is proposed
+            main_chain_timestamps[txs] = finalized_block.proposal_timestamp
+            finalization_timestamps[txs] = np.fmin(finalization_timestamps[txs],
+                    finalization_timestamp)
+            if hasattr(finalized_block, 'referenced_blocks'):
+                # referenced blocks have a finalization timestamp and
+                # proposal timestamp equal
+                # to the finalized block on the main chain
+                for ref_block in finalized_block.referenced_blocks:
+                    ref_block.set_finalization_timestamp(finalization_timestamp)
+                    txs = ref_block.txs
+                    main_chain_timestamps[txs] = finalized_block.proposal_timestamp
+                    finalization_timestamps[txs] = np.fmin(finalization_timestamps[txs],
+                            finalization_timestamp)
+
+    # update the global main chain after node_ids changed their blocktrees
+    def update_global_main_chain(self, node_ids):
+        instrumentation = self.instrumentation
+        if instrumentation.enabled:
+            length = len(self.global_chain)
+        for node_id in node_ids:
+            self.global_chain.update_node(node_id,
+                    self.nodes[node_id].local_blocktree)
+        fork_depth = self.global_chain.update()
+        self.finalization.update(self.global_chain, fork_depth)
+        if instrumentation.enabled:
+            instrumentation.global_chain_updated(fork_depth, length,
+                    len(self.global_chain))
 
     def global_main_chain(self):
-        main_chains = []
-        main_chain_ids = []
+        if self.params['fork_choice_rule']!='Prism':
+            self.update_global_main_chain(range(0, len(self.nodes)))
+            return self.global_chain.blocks()
 
-        # Get block ids in all main chains
+        # Prism has unique protocol: its ledger is decided by votes, so the
+        # common blocks are those on every node's ledger, in ledger order
+        main_chains = []
         for node in self.nodes:
             main_chain = node.local_blocktree.random_main_chain()
-            # Prism has unique protocol 
             # exclusively add non voter blocks
-            if self.params['fork_choice_rule']=='Prism':
-                main_chain = list(filter(lambda block:
-                block.block_type!='voter', main_chain))
-            main_chains.append(main_chain)
-            main_chain_ids.append(list(map(lambda block: block.id,
-                main_chains[-1])))
+            main_chains.append(list(filter(lambda block:
+                block.block_type!=BlockType.VOTER, main_chain)))
 
         # Find blocks common to all main chains
-        common_block_ids = set(main_chain_ids[0])
-        for blocks in main_chain_ids[1:]:
-            common_block_ids.intersection_update(blocks)
-
-        common_blocks = []
-        for common_block_id in common_block_ids:
-            common_block = next(filter(lambda block: block.id==common_block_id,
-                    main_chains[0]))
-            common_blocks.append(common_block)
-
-        # In Prism, once we have common proposer blocks, add ALL referenced
-        # blocks
-        if self.params['fork_choice_rule']=='Prism':
-            updated_common_blocks = []
-            for common_block in common_blocks:
-                for node in self.nodes:
-                    referenced_blocks = node.local_blocktree.get_referenced_blocks(common_block.id)
-                    updated_common_blocks+=list(referenced_blocks)
-                updated_common_blocks+=[common_block]
-            common_blocks = updated_common_blocks
+        common_block_ids = set(map(lambda block: block.id, main_chains[0]))
+        for main_chain in main_chains[1:]:
+            common_block_ids.intersection_update(map(lambda block: block.id,
+                main_chain))
+        common_blocks = [block for block in main_chains[0] if block.id in
+                common_block_ids]
+
+        # once we have common proposer blocks, add ALL referenced blocks
+        updated_common_blocks = []
+        for common_block in common_blocks:
+            for node in self.nodes:
+                referenced_blocks = node.local_blocktree.get_referenced_blocks(common_block.id)
+                updated_common_blocks+=list(referenced_blocks)
+            updated_common_blocks+=[common_block]
+        return updated_common_blocks 
+
+    # schedule all transactions (by id) and proposals; a streamed workload is
+    # scheduled one window at a time
+    def schedule_events(self):
+        if self.arrivals is None:
+            self.event_queue.extend(self.txs.timestamps[:len(self.txs)].tolist(),
+                    self.txs.ids().tolist())
+        self.event_queue.extend([proposal.timestamp for proposal in
+            self.proposals], self.proposals)
+        if self.tx_stream is not None:
+            self.event_queue.schedule(self.tx_stream.next_start_time,
+                    self.tx_stream)
+
+    # deliver a broadcasted event to a node, which relays it on sparse
+    # topologies
+    # request the evicted orphans of a node once their parent block_id has
+    # reached it, along with the requests of orphans whose parent connected
+    # when the node processed its buffer. The parent connects the next time
+    # the node processes its buffer, so the orphans are fetched by then
+    # instead of after it
+    def fetch_evicted(self, node, block_id, timestamp, instrumented):
+        if block_id is not None:
+            node.requests+=node.orphans.pop_evicted(block_id)
+        for block in node.requests:
+            self.event_queue.schedule(timestamp+node.fetch_delay(
+                self.params['max_block_size'], self.params['model']),
+                FetchedBlock(block), node.node_id)
+        if instrumented:
+            self.instrumentation.count('fetched orphans', len(node.requests))
+        node.requests = []
 
-        return common_blocks 
+    def deliver(self, timestamp, node_id, event, sender, instrumented):
+        node = self.nodes[node_id]
+        instrumentation = self.instrumentation
+        if instrumented:
+            instrumentation.count('deliveries')
+
+        # a fetched block is only wanted by the node that requested it, which
+        # has already relayed it when it first arrived
+        if isinstance(event, FetchedBlock):
+            node.buffer.append(event)
+            self.fetch_evicted(node, event.block.id, timestamp, instrumented)
+            return
+
+        if isinstance(event, CompactBlock):
+            # announcements of a proposal the node has seen or is already
+            # fetching txs for are dropped before fetching anything
+            if node.has_seen(event.proposal) or event.proposal.id in node.fetching:
+                if instrumented:
+                    instrumentation.count('duplicate deliveries')
+                return
+            # the node rebuilds the block from the txs it has seen, after
+            # fetching the txs it has not seen from the sender
+            missing = node.missing_txs(event, timestamp)
+            if instrumented:
+                instrumentation.count('compact blocks')
+                instrumentation.count('missing txs', len(missing))
+            if len(missing)>0:
+                node.fetching.add(event.proposal.id)
+                self.event_queue.schedule(timestamp+node.round_trip_delay(len(missing),
+                    float(self.txs.sizes[missing].sum()), self.nodes[event.sender],
+                    self.params['model']), event.proposal, node_id, event.sender)
+                return
+            event = event.proposal
+        elif node.compact_blocks and isinstance(event, Proposal):
+            # with compact blocks, a full proposal is only delivered once its
+            # missing txs are fetched
+            node.fetching.discard(event.id)
+
+        if node.receive(event):
+            if isinstance(event, Proposal):
+                self.fetch_evicted(node, event.block.id, timestamp, instrumented)
+            # pass the event on to the next hop, except for the neighbor it
+            # came from
+            if node.relay:
+                tx_size = TX_SIZE if isinstance(event, Proposal) else \
+                        float(self.txs.sizes[event])
+                node.broadcast(event, timestamp, self.params['max_block_size'],
+                        self.params['model'], self.event_queue, tx_size, sender)
+        elif instrumented:
+            instrumentation.count('duplicate deliveries')
 
     '''
     Main simulation function
-    Coordinator checks head of proposal and tx queue and processes earlier
-    occurring event
-        - Coordinator moves global clock to next event timestamp
+    Coordinator pops the earliest event from the event queue
+        - Coordinator moves global clock to the event timestamp
+        - If event is a delivery to a node
+            - Node adds the event to its buffer, which it processes the next
+              time it proposes
+            - On sparse topologies, the node relays the first delivery of an
+              event to its neighbors other than the sender and drops duplicates
+            - With compact blocks, a block announcement is delivered as the
+              block once the node has fetched the txs it has not seen
         - If event is a proposal
             - Choose a node uniformly at random
             - Chosen node calls propose()
+            - Proposal is broadcast, scheduling one delivery per neighbor
+            - Global main chain is updated, arriving and finalizing its
+              blocks and txs
         - If event is a tx
             - Broadcast tx from source node
+            - With virtual mempools, txs are not events; nodes find the txs
+              that reached them when they propose
+        - If event is the start of a window of a streamed workload
+            - Generate and schedule the txs of the window
+        - Every params['checkpoint_interval'] simulated seconds, the state
+          of the simulation is saved to params['checkpoint_file']
+        - Progress is reported every params['report_interval'] wall seconds
+        - With params['instrumentation'], phase timers and counters are
+          exported to instrumentation.json in the log directory
         - After main loop, loop over all all nodes and process buffer
+    A coordinator loaded from a checkpoint continues where it was saved
     '''
     def run(self):
         start = time.time()
+        instrumentation = self.instrumentation
+        instrumented = instrumentation.enabled
+        duration = self.params['duration']
+        # progress is reported against the events, simulated time and wall
+        # time of this call; start is reset at every checkpoint for
+        # self.elapsed, so reports keep their own wall clock origin
+        run_started = start
+        run_processed = self.processed
+        run_timestamp = 0
+        if self.started and len(self.event_queue)>0:
+            run_timestamp = self.event_queue.peek_timestamp()
+        instrumentation.last_report = None
+
+        if not self.started:
+            self.schedule_events()
+            self.started = True
 
-        tx_i = 0
-        p_i = 0
+        checkpoint_interval = self.params.get('checkpoint_interval')
+        if checkpoint_interval is not None and self.next_checkpoint is None:
+            self.next_checkpoint = checkpoint_interval
+
+        if instrumented:
+            loop_started = instrumentation.start()
 
         # run main loop
-        while tx_i<self.txs.shape[0] or p_i<self.proposals.shape[0]:
-            if (tx_i+p_i)%100==0:
-                print(float(tx_i+p_i)/(self.txs.shape[0]+self.proposals.shape[0]))
-            # still have valid txs and proposals
-            if tx_i<self.txs.shape[0] and p_i<self.proposals.shape[0]:
-                # transaction before proposal
-                if self.txs[tx_i].timestamp < self.proposals[p_i].timestamp:
-                    # transaction processing occurs when a node is selected to
-                    # be a proposer, so don't do anything but increment
-                    # transaction index and move global clock
-                    tx = self.txs[tx_i]
-                    source_node = tx.source
-
-                    source_node.local_txs[source_node.local_tx_i] = tx
-                    source_node.local_tx_i+=1
-                    source_node.broadcast(tx, self.params['max_block_size'],
-                            self.params['model'])
-                    tx_i+=1
-                # proposal before transaction
-                else:
-                    # choose proposer uniformly at random
-                    proposer = random.choice(self.nodes)
-                    proposal = proposer.propose(self.proposals[p_i],
-                        self.params['max_block_size'],
-                        self.params['fork_choice_rule'],
-                        self.params['model'])
-                    # broadcast to rest of network
-                    proposer.broadcast(proposal, self.params['max_block_size'],
-                            self.params['model'])
-                    p_i+=1
-            # out of all proposals
-            elif p_i==self.proposals.shape[0]:
-                tx = self.txs[tx_i]
-                source_node = tx.source
-                source_node.broadcast(tx, self.params['max_block_size'],
-                        self.params['model'])
-                tx_i+=1
-            # out of all transactions
-            elif tx_i==self.txs.shape[0]:
+        while len(self.event_queue)>0:
+            # save the state before processing the first event at or after
+            # the next checkpoint time
+            if self.next_checkpoint is not None and \
+                    self.event_queue.peek_timestamp()>=self.next_checkpoint:
+                while self.next_checkpoint<=self.event_queue.peek_timestamp():
+                    self.next_checkpoint+=checkpoint_interval
+                self.elapsed+=time.time()-start
+                start = time.time()
+                checkpoint.save(self, self.params['checkpoint_file'])
+
+            timestamp, node_id, event, sender = self.event_queue.pop_delivery()
+
+            # delivery of a broadcasted event
+            if node_id is not None:
+                # events delivered after the end of the simulation are never
+                # processed
+                if timestamp<=duration:
+                    self.deliver(timestamp, node_id, event, sender, instrumented)
+                continue
+
+            if isinstance(event, TransactionStream):
+                self.schedule_tx_window()
+                continue
+
+            self.processed+=1
+            # checking the clock every 1024 events keeps reports cheap
+            if self.processed&1023==0:
+                instrumentation.report(timestamp, duration,
+                        self.processed-run_processed, time.time()-run_started,
+                        run_timestamp)
+
+            if not isinstance(event, Proposal):
+                # transaction processing occurs when a node is selected to
+                # be a proposer, so just add to source node and broadcast
+                source_node = self.nodes[self.txs.sources[event]]
+                source_node.add_tx(event)
+                source_node.broadcast(event, timestamp,
+                        self.params['max_block_size'], self.params['model'],
+                        self.event_queue, float(self.txs.sizes[event]))
+                if instrumented:
+                    instrumentation.count('txs')
+            else:
                 # choose proposer uniformly at random
                 proposer = random.choice(self.nodes)
-                proposal = proposer.propose(self.proposals[p_i], 
+                proposal = proposer.propose(event,
                     self.params['max_block_size'],
                     self.params['fork_choice_rule'],
-                    self.params['model'])
+                    self.params['model'],
+                    instrumentation if instrumented else None)
+                # fetch the evicted orphans whose parent the proposer
+                # connected from its orphans
+                self.fetch_evicted(proposer, None, timestamp, instrumented)
                 # broadcast to rest of network
-                proposer.broadcast(proposal, self.params['max_block_size'],
-                        self.params['model'])
-                p_i+=1
+                proposer.broadcast(proposal, timestamp,
+                        self.params['max_block_size'], self.params['model'],
+                        self.event_queue)
+                # only the proposer's blocktree changed
+                if self.params['fork_choice_rule']!='Prism':
+                    if instrumented:
+                        started = instrumentation.start()
+                    self.update_global_main_chain([proposer.node_id])
+                    if instrumented:
+                        instrumentation.stop('global chain', started)
+                if instrumented:
+                    instrumentation.count('proposals')
+
+        if instrumented:
+            instrumentation.stop('event loop', loop_started)
+            started = instrumentation.start()
 
         for node in self.nodes:
-            node.process_buffer(self.params['duration'])
+            if instrumented:
+                instrumentation.buffer_processed(len(node.buffer), len(node.orphans))
+            node.process_buffer()
+
+        if instrumented:
+            instrumentation.stop('buffer processing', started)
+            started = instrumentation.start()
 
         common_blocks = self.global_main_chain() 
-        self.set_timestamps(common_blocks)
+        if self.params['fork_choice_rule']=='Prism':
+            self.set_timestamps(common_blocks)
+
+        if instrumented:
+            instrumentation.stop('global chain', started)
+            instrumentation.counters['events'] = self.processed
+            instrumentation.counters['orphans'] = sum(len(node.orphans) for
+                    node in self.nodes)
+            instrumentation.counters['evicted orphans'] = sum(node.orphans.num_evicted
+                    for node in self.nodes)
+            instrumentation.counters['queueing delay'] = float(sum(node.queueing_delay
+                for node in self.nodes))
+            instrumentation.counters['global chain length'] = len(common_blocks)
 
-        end = time.time()
+        self.elapsed+=time.time()-start
         if self.params['logging']:
-            logger.log_txs(self.txs)
+            if instrumented:
+                started = instrumentation.start()
+            logger.log_txs(self.params, self.txs)
             logger.log_blocks(self.params, self.proposals)
-            logger.log_statistics(self.params, common_blocks, self.proposals, end-start)
+            logger.log_statistics(self.params, common_blocks, self.proposals, self.elapsed)
             logger.draw_blocktree(self.params, self.proposals, common_blocks)
+            if instrumented:
+                instrumentation.stop('logging', started)
+
+            with open(logger.log_path(self.params, 'stats.csv')) as f:
+                print(f.read(), end='')
 
-            os.system('cat ./logs/stats.csv')
+        if instrumented:
+            instrumentation.export(logger.log_path(self.params,
+                'instrumentation.json'))
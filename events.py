@@ -1,31 +1,33 @@
-import uuid 
+from block import BlockType
 
-class Transaction():
-    def __init__(self, timestamp, source):
-        self.timestamp = timestamp
-        self.source = source
-        self.id = uuid.uuid4().hex[0:10]
-
-        self.complete = False
-        self.main_chain_timestamp = None
-        self.finalization_timestamps = None
-
-    def set_complete(self):
-        self.complete = True
-
-    def set_main_chain_arrival_timestamp(self, main_chain_timestamp):
-        self.main_chain_timestamp = main_chain_timestamp
+class Proposal():
+    __slots__ = ['timestamp', 'id', 'proposal_type', 'block']
 
-    def add_finalization_timestamp(self, finalization_timestamp):
-        if self.finalization_timestamps is None:
-            self.finalization_timestamps = []
-        self.finalization_timestamps.append(finalization_timestamp)
+    next_id = 0
 
-class Proposal():
-    def __init__(self, timestamp, proposal_type ='normal'):
+    def __init__(self, timestamp, proposal_type=BlockType.TREE):
         self.timestamp = timestamp
-        self.id = uuid.uuid4().hex[0:6]
+        self.id = Proposal.next_id
+        Proposal.next_id+=1
         self.proposal_type = proposal_type
+        self.block = None
 
     def set_block(self, block):
         self.block = block
+
+# block a node fetches again from a neighbor after evicting it as an orphan,
+# once its parent has connected
+class FetchedBlock():
+    __slots__ = ['block']
+
+    def __init__(self, block):
+        self.block = block
+
+# announcement of a proposal by a node in compact block relay, which carries
+# the ids of the block's txs rather than the txs themselves
+class CompactBlock():
+    __slots__ = ['proposal', 'sender']
+
+    def __init__(self, proposal, sender):
+        self.proposal = proposal
+        self.sender = sender
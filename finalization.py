@@ -0,0 +1,107 @@
+import numpy as np
+from collections import deque
+
+'''
+Online finalization tracking.
+
+The tracker follows the global main chain as it grows during the simulation.
+When a block joins the global main chain, it and its transactions arrive on the
+main chain at the block's proposal timestamp. When the global main chain
+reaches finalization_depth blocks past a block, the block and its
+transactions are finalized at the proposal timestamp of the block at that
+depth. Each block is arrived and finalized once, so the work per block is
+O(1) amortized and only blocks that are not yet finalized are kept.
+
+Arrivals are tentative: blocks that leave the global main chain before they
+are finalized have their arrival undone. Finalized blocks are final: a reorg
+of the global main chain below the finalized blocks is a finality violation,
+which cannot be undone, and raises a ValueError.
+
+Transaction timestamps are written to the main chain arrival and finalization
+columns of the transaction table, and running latency sums are kept so the
+average latencies are available at any time.
+'''
+class FinalizationTracker():
+    def __init__(self, txs, finalization_depth):
+        self.txs = txs
+        self.finalization_depth = finalization_depth
+        # global main chain blocks that arrived but are not yet finalized, in
+        # chain order
+        self.pending = deque()
+        # number of finalized blocks, which are the global main chain up to
+        # depth num_finalized-1
+        self.num_finalized = 0
+
+        self.num_arrived_txs = 0
+        self.arrival_latency = 0.0
+        self.num_finalized_txs = 0
+        self.finalization_latency = 0.0
+
+    def __len__(self):
+        return self.num_finalized+len(self.pending)
+
+    # transactions confirmed by a main chain block, without duplicates
+    def _ledger_txs(self, block):
+        txs = [block.txs]
+        if hasattr(block, 'referenced_blocks'):
+            txs+=[ref_block.txs for ref_block in block.referenced_blocks]
+        return np.unique(np.concatenate(txs))
+
+    def _arrive(self, block):
+        txs = self._ledger_txs(block)
+        timestamps = self.txs.main_chain_timestamps
+        new_txs = txs[np.isnan(timestamps[txs])]
+        timestamps[new_txs] = block.proposal_timestamp
+        self.num_arrived_txs+=new_txs.shape[0]
+        self.arrival_latency+=np.sum(block.proposal_timestamp-self.txs.timestamps[new_txs])
+        self.pending.append(block)
+
+    def _retract(self, block):
+        txs = self._ledger_txs(block)
+        timestamps = self.txs.main_chain_timestamps
+        arrived_txs = txs[(timestamps[txs]==block.proposal_timestamp) &
+                np.isnan(self.txs.finalization_timestamps[txs])]
+        timestamps[arrived_txs] = np.nan
+        self.num_arrived_txs-=arrived_txs.shape[0]
+        self.arrival_latency-=np.sum(block.proposal_timestamp-self.txs.timestamps[arrived_txs])
+
+    def _finalize(self, block, timestamp):
+        block.set_finalization_timestamp(timestamp)
+        if hasattr(block, 'referenced_blocks'):
+            for ref_block in block.referenced_blocks:
+                ref_block.set_finalization_timestamp(timestamp)
+
+        txs = self._ledger_txs(block)
+        timestamps = self.txs.finalization_timestamps
+        new_txs = txs[np.isnan(timestamps[txs])]
+        timestamps[new_txs] = timestamp
+        self.num_finalized_txs+=new_txs.shape[0]
+        self.finalization_latency+=np.sum(timestamp-self.txs.main_chain_timestamps[new_txs])
+
+    # follow the global main chain after an update that left it unchanged up
+    # to fork_depth
+    def update(self, global_chain, fork_depth):
+        if fork_depth<self.num_finalized-1:
+            raise ValueError(f'global main chain reorganized at depth '
+                    f'{fork_depth+1}, below {self.num_finalized} finalized blocks')
+
+        # undo arrivals of blocks that left the chain
+        while len(self.pending)>0 and len(self)-1>fork_depth:
+            self._retract(self.pending.pop())
+
+        for depth in range(len(self), len(global_chain)):
+            self._arrive(global_chain.get_block(depth))
+
+        while len(self.pending)>0 and self.num_finalized+self.finalization_depth<len(global_chain):
+            finalizing_block = global_chain.get_block(self.num_finalized+self.finalization_depth)
+            self._finalize(self.pending.popleft(), finalizing_block.proposal_timestamp)
+            self.num_finalized+=1
+
+    # average main chain arrival latency (from generation) and finalization
+    # latency (from main chain arrival) of the transactions so far, as in
+    # metrics.latencies
+    def latencies(self):
+        arrival = 0 if self.num_arrived_txs==0 else self.arrival_latency/self.num_arrived_txs
+        finalization = 0 if self.num_finalized_txs==0 else \
+                self.finalization_latency/self.num_finalized_txs
+        return float(arrival), float(finalization)
@@ -1,24 +1,192 @@
-import random, time, numpy as np
-from events import Transaction
+import sys, csv, itertools, numpy as np
+from optparse import OptionParser
+from transactions import TransactionTable
+from constants import TX_SIZE, TX_BYTES
 
-def poisson(rate, duration, start_time, nodes):
-    data = []
-    timestamp = start_time
+'''
+Workload generation.
+
+Arrival timestamps are built with vectorized NumPy calls rather than one draw
+per event, and source nodes are drawn for all transactions at once. A workload
+is either generated in full as a TransactionTable (poisson, deterministic) or
+streamed in fixed-size time windows (PoissonStream, DeterministicStream,
+TraceStream), so only the transactions of the current window are pending at
+any time.
+'''
+
+# timestamps of a poisson process with rate events/sec in [start_time,
+# end_time), built from one cumulative sum of exponential inter-arrival times
+def poisson_timestamps(rate, start_time, end_time):
+    # draw a few standard deviations more than the expected number of events,
+    # and top up in the rare case this falls short
+    expected = rate*(end_time-start_time)
+    num_draws = int(expected+5*np.sqrt(expected))+16
+    timestamps = start_time+np.cumsum(np.random.exponential(1.0/rate, num_draws))
+    while timestamps[-1]<end_time:
+        timestamps = np.concatenate([timestamps, timestamps[-1]+
+            np.cumsum(np.random.exponential(1.0/rate, num_draws))])
+    return timestamps[:np.searchsorted(timestamps, end_time)]
 
-    while timestamp<duration+start_time: 
-        timestamp = timestamp + np.random.exponential(1.0/rate)
-        tx = Transaction(timestamp, np.random.choice(nodes))
-        data.append(tx)
+# timestamps every interval seconds after origin in [start_time, end_time)
+def deterministic_timestamps(interval, start_time, end_time, origin=None):
+    origin = start_time if origin is None else origin
+    first = max(1, int(np.ceil((start_time-origin)/interval)))
+    last = int(np.ceil((end_time-origin)/interval))
+    return origin+interval*np.arange(first, max(first, last))
 
+def random_sources(num_nodes, num_txs):
+    return np.random.randint(num_nodes, size=num_txs)
+
+def create_table(timestamps, num_nodes):
+    data = TransactionTable(max(1, timestamps.shape[0]))
+    data.append(timestamps, random_sources(num_nodes, timestamps.shape[0]))
     return data
 
+def poisson(rate, duration, start_time, nodes):
+    timestamps = poisson_timestamps(rate, start_time, start_time+duration)
+    return create_table(timestamps, len(nodes))
+
 def deterministic(rate, duration, start_time, nodes):
-    data = []
-    timestamp = start_time
+    timestamps = deterministic_timestamps(rate, start_time, start_time+duration)
+    return create_table(timestamps, len(nodes))
 
-    while timestamp<duration+start_time: 
-        timestamp = timestamp + rate
-        tx = Transaction(timestamp, np.random.choice(nodes))
-        data.append(tx)
+'''
+Iterator over the transactions of a workload, one window of window seconds at
+a time. Each step yields the timestamps, source nodes and sizes of the
+transactions generated in the next window; the iterator is exhausted after
+duration seconds. Subclasses define the arrival process in timestamps.
+'''
+class TransactionStream():
+    def __init__(self, rate, duration, start_time, num_nodes, window=100):
+        self.rate = rate
+        self.start_time = start_time
+        self.end_time = start_time+duration
+        self.num_nodes = num_nodes
+        self.window = window
+        # start of the next window
+        self.next_start_time = start_time
 
-    return data
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.next_start_time>=self.end_time:
+            raise StopIteration
+        start_time = self.next_start_time
+        end_time = min(start_time+self.window, self.end_time)
+        self.next_start_time = end_time
+
+        timestamps = self.timestamps(start_time, end_time)
+        return timestamps, random_sources(self.num_nodes, timestamps.shape[0]), \
+                np.full(timestamps.shape[0], TX_SIZE, dtype=np.float32)
+
+    def timestamps(self, start_time, end_time):
+        pass
+
+class PoissonStream(TransactionStream):
+    # poisson arrivals are memoryless, so each window is drawn independently
+    def timestamps(self, start_time, end_time):
+        return poisson_timestamps(self.rate, start_time, end_time)
+
+class DeterministicStream(TransactionStream):
+    def timestamps(self, start_time, end_time):
+        return deterministic_timestamps(self.rate, start_time, end_time,
+                origin=self.start_time)
+
+def stream(dataset, rate, duration, start_time, nodes, window):
+    if dataset=='poisson':
+        return PoissonStream(rate, duration, start_time, len(nodes), window)
+    elif dataset=='deterministic':
+        return DeterministicStream(rate, duration, start_time, len(nodes), window)
+
+'''
+Transaction traces.
+
+A trace is a binary file of fixed-width little-endian records (timestamp,
+source node, size in bytes) sorted by timestamp, with no header. Sizes are
+streamed in transactions of TX_BYTES bytes, the unit of network message
+sizes. It is opened with
+np.memmap, so opening a trace and streaming it one window at a time takes the
+same time and memory regardless of its length.
+'''
+TRACE_DTYPE = np.dtype([('timestamp', '<f8'), ('source', '<i4'), ('size', '<i4')])
+
+def read_trace(filename):
+    return np.memmap(filename, dtype=TRACE_DTYPE, mode='r')
+
+'''
+Streams the records of a trace in windows of window seconds, up to duration
+seconds after start_time. The trace is memory mapped on first use and not
+pickled with the stream.
+'''
+class TraceStream(TransactionStream):
+    def __init__(self, filename, duration, start_time, num_nodes, window=100):
+        super(TraceStream, self).__init__(None, duration, start_time,
+                num_nodes, window)
+        self.filename = filename
+        self.trace = None
+        # first record not yet streamed
+        self.position = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['trace'] = None
+        return state
+
+    def __next__(self):
+        if self.trace is None:
+            self.trace = read_trace(self.filename)
+        if self.position is None:
+            self.position = int(np.searchsorted(self.trace['timestamp'],
+                self.start_time))
+        if self.next_start_time>=self.end_time:
+            raise StopIteration
+        end_time = min(self.next_start_time+self.window, self.end_time)
+        self.next_start_time = end_time
+
+        # records are sorted, so the window is a contiguous slice
+        end = self.position+int(np.searchsorted(
+            self.trace['timestamp'][self.position:], end_time))
+        records = np.array(self.trace[self.position:end])
+        self.position = end
+        if records.shape[0]>0 and records['source'].max()>=self.num_nodes:
+            raise ValueError(f'{self.filename} has transactions from nodes '
+                    f'outside the {self.num_nodes} simulated nodes')
+        return records['timestamp'], records['source'], \
+                (records['size']/TX_BYTES).astype(np.float32)
+
+# convert a csv file with timestamp, source node and (optionally) size in bytes
+# columns to a trace, reading chunk_size rows at a time; records are sorted by
+# timestamp
+def csv_to_trace(csv_filename, trace_filename, chunk_size=1000000,
+        columns=('timestamp', 'source node', 'size')):
+    timestamp_column, source_column, size_column = columns
+    num_records = 0
+    with open(csv_filename, newline='') as f, open(trace_filename, 'wb') as trace:
+        reader = csv.DictReader(f)
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if len(rows)==0:
+                break
+            records = np.zeros(len(rows), dtype=TRACE_DTYPE)
+            records['timestamp'] = [float(row[timestamp_column]) for row in rows]
+            records['source'] = [int(row[source_column]) for row in rows]
+            records['size'] = [int(row[size_column]) if size_column in row
+                    else int(TX_BYTES) for row in rows]
+            records.tofile(trace)
+            num_records+=len(rows)
+
+    if num_records>0:
+        records = np.memmap(trace_filename, dtype=TRACE_DTYPE, mode='r+')
+        if np.any(np.diff(records['timestamp'])<0):
+            records.sort(order='timestamp', kind='stable')
+        records.flush()
+    return num_records
+
+if __name__=='__main__':
+    usage = 'usage: python %prog CSV_FILE TRACE_FILE'
+    parser = OptionParser(usage=usage)
+    (options, args) = parser.parse_args(sys.argv[1:])
+    if len(args)!=2:
+        parser.error('expected a csv file and a trace file')
+    print(f'Wrote {csv_to_trace(args[0], args[1])} records to {args[1]}')
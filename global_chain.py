@@ -0,0 +1,73 @@
+import numpy as np
+
+'''
+Global main chain: the blocks on the main chain of every node.
+
+A node's main chains run from genesis to the leaves chosen by its fork choice
+rule, so the blocks common to all main chains of all nodes are exactly the
+ancestors of the lowest common ancestor of all leaves. Each node is summarized
+by the LCA of its own leaves (its tip), and the global chain is kept as an
+array of store indices by depth, ending at the LCA of all tips. Updating after
+a node's leaves change costs one LCA query per node plus the blocks that join
+or leave the global chain.
+'''
+class GlobalMainChain():
+    def __init__(self, blockstore, num_nodes=0):
+        self.blockstore = blockstore
+        # per node LCA of its leaves, by node id
+        self.tips = [blockstore.root]*num_nodes
+        self.chain = np.zeros(64, dtype=np.int32)
+        self.chain[0] = blockstore.root
+        self.length = 1
+
+    def __len__(self):
+        return self.length
+
+    # nodes start out with only the genesis block
+    def add_node(self):
+        self.tips.append(self.blockstore.root)
+
+    def update_node(self, node_id, blocktree):
+        leaf_blocks = blocktree.fork_choice_rule()
+        tip = self.blockstore.index(leaf_blocks[0].id)
+        for leaf_block in leaf_blocks[1:]:
+            tip = self.blockstore.lca(tip, self.blockstore.index(leaf_block.id))
+        self.tips[node_id] = tip
+
+    # move the chain to the LCA of all tips, returning the depth up to which
+    # the chain is unchanged
+    def update(self):
+        common = self.tips[0]
+        for tip in self.tips[1:]:
+            if common==self.blockstore.root:
+                break
+            if tip!=common:
+                common = self.blockstore.lca(common, tip)
+        return self._move_to(common)
+
+    # walk up from the new end of the chain until reaching the current chain,
+    # then replace everything below that point
+    def _move_to(self, index):
+        path = []
+        depth = self.blockstore.depths[index]
+        while depth>=self.length or self.chain[depth]!=index:
+            path.append(index)
+            index = self.blockstore.parents[index]
+            depth-=1
+
+        length = depth+1+len(path)
+        if length>self.chain.shape[0]:
+            chain = np.zeros(2*length, dtype=np.int32)
+            chain[:self.length] = self.chain[:self.length]
+            self.chain = chain
+        self.chain[depth+1:length] = path[::-1]
+        self.length = length
+        return depth
+
+    def get_block(self, depth):
+        return self.blockstore.get_block(self.chain[depth])
+
+    # global main chain blocks in chain order, starting at genesis
+    def blocks(self):
+        return [self.blockstore.get_block(index) for index in
+                self.chain[:self.length]]
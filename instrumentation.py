@@ -0,0 +1,88 @@
+import json, time
+from collections import defaultdict
+
+'''
+Instrumentation of a simulation run.
+
+Phase timers accumulate the wall time spent in each part of the simulator:
+
+    workload generation - generating transactions and proposals
+    event loop          - the main loop of Coordinator.run, including the
+                          phases below that run inside it
+    buffer processing   - proposers adding delivered blocks and txs
+    block assembly      - proposers updating their mempool and selecting txs
+    fork choice         - proposers adding their block by the fork choice rule
+    global chain        - updating the global main chain and finalization
+    logging             - writing the logs of the run
+
+Counters track the events processed, the depth of node buffers when they are
+processed, orphan blocks, reorgs of node main chains and of the global main
+chain, and the length of the global main chain.
+
+Timers and counters are only updated when enabled; callers check enabled once
+and skip instrumentation otherwise, so a disabled instance costs next to
+nothing. Progress reports are printed at most once every report_interval wall
+seconds whether or not instrumentation is enabled.
+'''
+class Instrumentation():
+    def __init__(self, enabled=False, report_interval=5):
+        self.enabled = enabled
+        self.report_interval = report_interval
+        # wall seconds per phase
+        self.phases = defaultdict(float)
+        self.counters = defaultdict(int)
+        # wall time of the last progress report
+        self.last_report = None
+
+    def start(self):
+        return time.perf_counter()
+
+    # add the time since started to phase
+    def stop(self, phase, started):
+        self.phases[phase]+=time.perf_counter()-started
+
+    def count(self, counter, value=1):
+        self.counters[counter]+=value
+
+    def maximum(self, counter, value):
+        if value>self.counters[counter]:
+            self.counters[counter] = value
+
+    # record the depth of a node buffer and orphans when it is processed
+    def buffer_processed(self, buffer_depth, num_orphans):
+        self.count('buffers processed')
+        self.count('buffered events', buffer_depth)
+        self.maximum('max buffer depth', buffer_depth)
+        self.maximum('max orphans', num_orphans)
+
+    # record a global main chain update that kept the chain up to fork_depth
+    # and changed its length from length to new_length
+    def global_chain_updated(self, fork_depth, length, new_length):
+        if fork_depth<length-1:
+            self.count('global reorgs')
+            self.maximum('max global reorg depth', length-1-fork_depth)
+        self.counters['global chain length'] = new_length
+
+    # print progress at most once every report_interval wall seconds;
+    # processed and elapsed are the events and wall time of the run since it
+    # started at simulated time start_timestamp, which is 0 unless resumed
+    def report(self, timestamp, duration, processed, elapsed, start_timestamp=0):
+        now = time.monotonic()
+        if self.last_report is not None and now-self.last_report<self.report_interval:
+            return
+        self.last_report = now
+        events_per_sec = processed/elapsed if elapsed>0 else 0
+        remaining = max(duration-timestamp, 0)
+        # assume the rest of the run proceeds at the same simulated speed
+        simulated = timestamp-start_timestamp
+        eta = elapsed*remaining/simulated if simulated>0 else float('nan')
+        print(f'{timestamp/duration:.1%} simulated, {processed} events, '
+                f'{events_per_sec:.0f} events/sec, {remaining:.1f} simulated '
+                f'sec and {eta:.1f} wall sec remaining', flush=True)
+
+    def to_dict(self):
+        return {'phases': dict(self.phases), 'counters': dict(self.counters)}
+
+    def export(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
@@ -1,11 +1,16 @@
-import csv, json
+import os, csv, json, numpy as np
 from algorithms import compute_finalization_depth
 from graph_tool.all import *
 from network import constant_decker_wattenhorf
 from constants import TX_SIZE
+from block import BlockType, GENESIS_ID
+
+# path of a log file in the log directory of a run
+def log_path(params, filename):
+    return os.path.join(params.get('log_dir', './logs'), filename)
 
 def log_blocks(params, proposals):
-    with open('./logs/blocks.csv', 'w', newline='') as csvfile:
+    with open(log_path(params, 'blocks.csv'), 'w', newline='') as csvfile:
         fieldnames = ['id', 
                     'parent id', 
                     'block type',
@@ -18,13 +23,13 @@ def log_blocks(params, proposals):
         writer.writeheader()
         for proposal in proposals:
             block = proposal.block
-            tx_str = ';'.join(tx.id for tx in block.txs)
+            tx_str = ';'.join(map(str, block.txs.tolist()))
             depth = block.depth
             is_finalized = False if block.finalization_timestamp==None else True
             writer.writerow({
                 'id': f'{block.id}', 
                 'parent id': f'{block.parent_id}', 
-                'block type': f'{block.block_type}', 
+                'block type': f'{block.block_type.name.lower()}', 
                 'proposal timestamp': f'{block.proposal_timestamp}', 
                 'finalization timestamp': f'{block.finalization_timestamp}', 
                 'depth': f'{depth}',
@@ -32,7 +37,7 @@ def log_blocks(params, proposals):
                 'transactions': f'{tx_str}'})
             if hasattr(block, 'referenced_blocks'):
                 for ref_block in block.referenced_blocks:
-                    ref_block_tx_str = ';'.join(tx.id for tx in ref_block.txs)
+                    ref_block_tx_str = ';'.join(map(str, ref_block.txs.tolist()))
                     writer.writerow({
                         'id': f'{ref_block.id}', 
                         'parent id': f'{ref_block.parent_id}', 
@@ -43,29 +48,27 @@ def log_blocks(params, proposals):
                         'transactions': f'{ref_block_tx_str}'
                         })
 
-def log_txs(txs):
-    with open('./logs/transactions.csv', 'w', newline='') as csvfile:
-        fieldnames = ['id', 'source node', 'generated timestamp', 'complete', 
-                'main chain arrival timestamp', 
-                'finalization timestamps']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for tx in txs:
-            if tx.finalization_timestamps is None:
-                finalization_timestamp_str = None
-            else:
-                finalization_timestamp_str = ';'.join(str(t) for t in
-                        tx.finalization_timestamps)
-            writer.writerow({'id': f'{tx.id}', 'source node':
-                f'{tx.source.node_id}', 'generated timestamp':
-                f'{tx.timestamp}', 'complete': f'{tx.complete}',
-                'main chain arrival timestamp':
-                f'{tx.main_chain_timestamp}',
-                f'finalization timestamps':
-                f'{finalization_timestamp_str}'})
+def log_txs(params, txs):
+    # write all columns of the transaction table at once; nan marks
+    # transactions that never arrived on the main chain or were never
+    # finalized
+    num_txs = len(txs)
+    finalization_timestamps = txs.finalization_timestamps[:num_txs]
+    columns = np.column_stack([txs.ids(),
+        txs.sources[:num_txs],
+        txs.timestamps[:num_txs],
+        ~np.isnan(finalization_timestamps),
+        txs.main_chain_timestamps[:num_txs],
+        finalization_timestamps])
+    fieldnames = ['id', 'source node', 'generated timestamp', 'complete', 
+            'main chain arrival timestamp', 
+            'finalization timestamp']
+    np.savetxt(log_path(params, 'transactions.csv'), columns, delimiter=',',
+            fmt=['%d', '%d', '%.12g', '%d', '%.12g', '%.12g'],
+            header=','.join(fieldnames), comments='')
 
 def log_statistics(params, global_main_chain, proposals, time_elapsed):
-    with open('./logs/stats.csv', 'w+') as csvfile:
+    with open(log_path(params, 'stats.csv'), 'w+') as csvfile:
         csvfile.write(json.dumps(params)+'\n')
         csvfile.write(f'Time elapsed,{time_elapsed}\n')
 
@@ -86,11 +89,11 @@ def log_statistics(params, global_main_chain, proposals, time_elapsed):
 
         # log main chain information blocks
         num_blocks = len(list(filter(lambda proposal:
-            proposal.block.block_type=='tree' or
-            proposal.block.block_type=='proposer', proposals)))
+            proposal.block.block_type==BlockType.TREE or
+            proposal.block.block_type==BlockType.PROPOSER, proposals)))
         # filter main chain to only have tree blocks
-        main_chain = list(filter(lambda block: block.block_type=='tree' or
-            block.block_type=='proposer',
+        main_chain = list(filter(lambda block: block.block_type==BlockType.TREE or
+            block.block_type==BlockType.PROPOSER,
             global_main_chain))
         main_chain_length = len(main_chain)
         num_orphan_blocks = num_blocks - main_chain_length 
@@ -133,15 +136,17 @@ def draw_blocktree(params, proposals, main_chain):
     text_vp[genesis] = 'Genesis'
 
     if params['fork_choice_rule']=='Prism':
-        main_chain = list(filter(lambda block: block.block_type!='voter', main_chain))
+        main_chain = list(filter(lambda block: block.block_type!=BlockType.VOTER, main_chain))
         main_chain = sorted(main_chain, key=lambda block: block.depth)
         added_parent = genesis
         added_depths = 0
 
     main_chain_ids = list(map(lambda block: block.id, main_chain))
 
-    type_filter = lambda proposal: proposal.block.block_type=='tree' or proposal.block.block_type=='proposer'
-    added_filter = lambda proposal: not proposal.added 
+    type_filter = lambda proposal: proposal.block.block_type==BlockType.TREE or proposal.block.block_type==BlockType.PROPOSER
+    # ids of proposals whose block has been added to the graph
+    added = set()
+    added_filter = lambda proposal: proposal.id not in added
 
     filtered_proposals = list(filter(type_filter, proposals))
     while len(filtered_proposals)>0:
@@ -155,31 +160,29 @@ def draw_blocktree(params, proposals, main_chain):
                 else:
                     color_vp[v] = 1
                     shape_vp[v] = 1
-                text_vp[v] = block.id
+                text_vp[v] = str(block.id)
                 block_to_vertices[block.id] = v
             if hasattr(block, 'referenced_blocks'):
                 for ref_block in block.referenced_blocks:
                     ref_vertex = g.add_vertex()
                     color_vp[ref_vertex] = 0.5
                     shape_vp[ref_vertex] = 0.5
-                    text_vp[ref_vertex] = ref_block.id
+                    text_vp[ref_vertex] = str(ref_block.id)
                     g.add_edge(v, ref_vertex)
             if params['fork_choice_rule']=='Prism':
                 # if Prism, main chain chooses one from each depth 
                 if block.id in main_chain_ids:
                     g.add_edge(added_parent, v)
                     added_parent = v
-                proposal.added = True
+                added.add(proposal.id)
             else:
                 if block.parent_id in block_to_vertices:
                     w = block_to_vertices[block.parent_id]
                     g.add_edge(v, w)
-                    proposal.added = True
-                elif block.parent_id=='Genesis':
+                    added.add(proposal.id)
+                elif block.parent_id==GENESIS_ID:
                     g.add_edge(v, genesis)
-                    proposal.added = True
-                else:
-                    proposal.added = False
+                    added.add(proposal.id)
         filtered_proposals = list(filter(added_filter, filtered_proposals))
 
     pos = fruchterman_reingold_layout(g, n_iter=1)
@@ -191,5 +194,5 @@ def draw_blocktree(params, proposals, main_chain):
             vertex_fill_color =color_vp,
             vertex_font_size=15, output_size=(4200, 4200),
             edge_pen_width=1.0,
-            output="./logs/blocktree.png")
+            output=log_path(params, "blocktree.png"))
 
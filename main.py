@@ -1,99 +1,164 @@
-import sys, os, shutil, json, numpy as np
+import sys, os, json, random, numpy as np
 from optparse import OptionParser
-from topology_reader import get_topology
+from topology_reader import get_topology, read_locations
 from coordinator import Coordinator
 from node import Node
 from constants import TX_RATE
-import generate_tx_dataset
+from arrivals import TransactionArrivals, constant_offsets
+import generate_tx_dataset, checkpoint, topology, network
 
 def get_params(filename):
-    params = {}
     with open(filename) as f:
         contents = json.load(f)
         setting_name = contents['setting-name']
-        d = contents[setting_name]
-        params['num_nodes'] = d['Number of nodes'] 
-        params['num_adversaries'] = d['Number of adversaries']
-        params['max_block_size'] = d['Block size (txs)']
-        params['tx_error_prob'] = d['Probability of error in transaction confirmation']
-        params['fork_choice_rule'] = d['Fork choice rule']
-        # if the fork choice rule is longest chain with pool, we should have 2
-        # proposal rates f_t for the tree and f_p for the pool
-        if d['Fork choice rule']=='longest-chain-with-pool':
-            params['tree_proposal_rate'] = d['Block tree proposal rate parameter']
-            params['pool_proposal_rate'] = d['Block pool proposal rate parameter']
-        else:
-            params['tree_proposal_rate'] = d['Block proposal rate parameter']
-        if 'Transaction rate parameter' in d:
-            params['transaction_rate'] = d['Transaction rate parameter']
-        params['transaction_schedule'] = d['Transaction scheduling rule']
-        params['dataset'] = d['Transaction dataset']
-        params['model'] = d['Network model']
-        params['duration'] = d['Duration (sec)']
-        params['logging'] = d['Logging enabled']
-        if 'Topology file' in d:
-            params['topology'] = d['Topology file']
-        if 'Locations file' in d:
-            params['locations'] = d['Locations file']
-    return params
+        return setting_to_params(contents[setting_name])
 
-if __name__=='__main__':
-    usage = 'usage: python %prog [options]'
-    parser = OptionParser(usage=usage)
-
-    parser.add_option('-f', '--filename', type='string',
-            action='store', dest='filename', default='params.json',
-            help='filename to set parameters; default parameters are in params.json')
-
-    (options, args) = parser.parse_args(sys.argv[1:])
+# convert a setting of a parameters file to simulation parameters
+def setting_to_params(d):
+    params = {}
+    params['num_nodes'] = d['Number of nodes'] 
+    params['num_adversaries'] = d['Number of adversaries']
+    params['max_block_size'] = d['Block size (txs)']
+    params['tx_error_prob'] = d['Probability of error in transaction confirmation']
+    params['fork_choice_rule'] = d['Fork choice rule']
+    # if the fork choice rule is longest chain with pool, we should have 2
+    # proposal rates f_t for the tree and f_p for the pool
+    if d['Fork choice rule']=='longest-chain-with-pool':
+        params['tree_proposal_rate'] = d.get('Block tree proposal rate parameter',
+                d.get('Block proposal rate parameter'))
+        params['pool_proposal_rate'] = d.get('Block pool proposal rate parameter', 0)
+    else:
+        params['tree_proposal_rate'] = d['Block proposal rate parameter']
+    if 'Transaction rate parameter' in d:
+        params['transaction_rate'] = d['Transaction rate parameter']
+    params['transaction_schedule'] = d['Transaction scheduling rule']
+    params['dataset'] = d['Transaction dataset']
+    params['model'] = d['Network model']
+    params['duration'] = d['Duration (sec)']
+    params['logging'] = d['Logging enabled']
+    if 'Transaction trace file' in d:
+        params['trace'] = d['Transaction trace file']
+    if 'Transaction window (sec)' in d:
+        params['tx_window'] = d['Transaction window (sec)']
+    if 'Topology file' in d:
+        params['topology'] = d['Topology file']
+    if 'Locations file' in d:
+        params['locations'] = d['Locations file']
+    if 'Topology' in d:
+        params['network_topology'] = d['Topology']
+    if 'Topology degree' in d:
+        params['topology_degree'] = d['Topology degree']
+    if 'Topology probability' in d:
+        params['topology_probability'] = d['Topology probability']
+    if 'Relay' in d:
+        params['relay'] = d['Relay']
+    if 'Upload bandwidth (txs/sec)' in d:
+        params['upload_bandwidth'] = d['Upload bandwidth (txs/sec)']
+    if 'Compact blocks' in d:
+        params['compact_blocks'] = d['Compact blocks']
+    if 'Virtual mempool' in d:
+        params['virtual_mempool'] = d['Virtual mempool']
+    if 'Maximum orphan blocks' in d:
+        params['max_orphans'] = d['Maximum orphan blocks']
+    return params
 
-    params = get_params(options.filename)
+# set up nodes, network and workload for params and run the simulation,
+# logging to params['log_dir']; returns the coordinator after the run
+def simulate(params):
+    if 'seed' in params:
+        np.random.seed(params['seed'])
+        random.seed(params['seed'])
 
-    # Setup logging directory 
-    shutil.rmtree('./logs')
-    os.mkdir('./logs')
+    # Setup logging directory; every run logs to its own directory
+    params.setdefault('log_dir', './logs')
+    os.makedirs(params['log_dir'], exist_ok=True)
 
     c = Coordinator(params) 
 
-    nodes = np.empty(params['num_nodes'], dtype=Node)
-
+    # network topology, by default a complete graph
+    num_nodes = params['num_nodes']
+    locations = [None]*num_nodes
     if 'topology' in params and 'locations' in params:
-        num_nodes, locations, G = get_topology(params['locations'],
+        num_nodes, locations, network_topology = get_topology(params['locations'],
         params['topology'])
         if num_nodes!=params['num_nodes']:
             print('Invalid number of nodes provided')
             sys.exit()
-        # generate num_nodes nodes
-        for node_id in range(0, num_nodes): 
-            n = Node(node_id, params['fork_choice_rule'],
-                    params['transaction_schedule'], params['max_block_size'], locations[node_id])
-            nodes[node_id] = n
-            c.add_node(n)
-
-        # add nodes to network based on graph topology
-        for node_id in range(0, num_nodes):
-            for neighbor in G[node_id]:
-                n.add_neighbor(nodes[neighbor])
     else:
-        # generate num_nodes nodes
-        num_nodes = params['num_nodes']
-        for node_id in range(0, num_nodes): 
-            n = Node(node_id, params['fork_choice_rule'],
-                    params['transaction_schedule'],
-                    params['max_block_size'])
-            nodes[node_id] = n
-            c.add_node(n)
-        
-        # every node is a neighbor of the other for right now
-        for i in range (0, len(nodes)): 
-            for j in range(0, len(nodes)):
-                if i!=j:
-                    nodes[i].add_neighbor(nodes[j])
+        network_topology = topology.create(params.get('network_topology', 'complete'),
+                num_nodes, params.get('topology_degree'),
+                params.get('topology_probability'))
+
+    # geographic network models delay every link by the distance between
+    # its ends, from the locations file or random locations
+    link_propagation = None
+    if params['model'] in network.GEOGRAPHIC_MODELS:
+        if 'locations' in params and locations[0] is None:
+            locations = read_locations(params['locations'])
+        elif locations[0] is None:
+            locations = network.random_locations(num_nodes)
+        if len(locations)!=num_nodes:
+            print('Invalid number of locations provided')
+            sys.exit()
+        link_propagation = network.propagation_delays(locations, network_topology)
+
+    # with limited bandwidth, sending a message replaces the size-dependent
+    # delay of the network model, so only Zero and the propagation delay of
+    # geographic models can be combined with it
+    if params.get('upload_bandwidth') is not None and params['model']!='Zero' \
+            and params['model'] not in network.GEOGRAPHIC_MODELS:
+        print('Upload bandwidth needs the Zero or a geographic network model')
+        sys.exit()
+
+    # relay events over multiple hops unless every node is a neighbor of
+    # every other
+    complete = network_topology.num_links==num_nodes*(num_nodes-1)
+    relay = params.get('relay', not complete)
+
+    # arrival times of txs at every node for virtual mempools: offsets from
+    # the source under constant models, otherwise drawn per tx
+    tx_arrivals = None
+    if params.get('virtual_mempool', False):
+        if params['model'] in network.CONSTANT_MODELS:
+            tx_arrivals = TransactionArrivals(num_nodes,
+                    constant_offsets(network_topology, params['model'],
+                        link_propagation, relay))
+        elif relay:
+            print('Virtual mempools need a constant network model when txs are relayed')
+            sys.exit()
+        else:
+            tx_arrivals = TransactionArrivals(num_nodes, topology=network_topology,
+                    model=params['model'], propagation_delays=link_propagation)
+        c.arrivals = tx_arrivals
+
+    # generate num_nodes nodes, each with its row of the topology as
+    # neighbors
+    for node_id in range(0, num_nodes): 
+        n = Node(node_id, params['fork_choice_rule'],
+                params['transaction_schedule'], params['max_block_size'],
+                c.blockstore, locations[node_id], params.get('max_orphans'),
+                relay, params.get('upload_bandwidth'),
+                params.get('compact_blocks', False), tx_arrivals)
+        start, end = network_topology.indptr[node_id:node_id+2]
+        n.set_neighbors(network_topology.indices[start:end],
+                None if link_propagation is None else link_propagation[start:end])
+        c.add_node(n)
+
+    instrumentation = c.instrumentation
+    if instrumentation.enabled:
+        started = instrumentation.start()
 
     tx_rate = TX_RATE if 'transaction_rate' not in params else params['transaction_rate']
     
-    # generate mock poisson dataset
-    if params['dataset']=='poisson':
+    # replay a transaction trace, or generate mock dataset, streamed in
+    # windows if a window is set
+    if params['dataset']=='trace':
+        tx_dataset = generate_tx_dataset.TraceStream(params['trace'],
+                params['duration'], 0, num_nodes, params.get('tx_window', 100))
+    elif 'tx_window' in params:
+        tx_dataset = generate_tx_dataset.stream(params['dataset'], tx_rate,
+                params['duration'], 0, c.nodes, params['tx_window'])
+    elif params['dataset']=='poisson':
         tx_dataset = generate_tx_dataset.poisson(tx_rate, params['duration'], 0, c.nodes)
     elif params['dataset']=='deterministic':
         tx_dataset = generate_tx_dataset.deterministic(tx_rate,
@@ -105,10 +170,59 @@ if __name__=='__main__':
     # set transaction dataset
     c.set_transactions(tx_dataset)
 
-    # create arrays to store proposals and transactions
-    for node_id in range(0, num_nodes):
-        nodes[node_id].create_arrays(len(tx_dataset))
-
+    if instrumentation.enabled:
+        instrumentation.stop('workload generation', started)
 
     # run simulation
     c.run()
+    return c
+
+if __name__=='__main__':
+    usage = 'usage: python %prog [options]'
+    parser = OptionParser(usage=usage)
+
+    parser.add_option('-f', '--filename', type='string',
+            action='store', dest='filename', default='params.json',
+            help='filename to set parameters; default parameters are in params.json')
+    parser.add_option('-o', '--output', type='string',
+            action='store', dest='log_dir', default='./logs',
+            help='directory to write logs to; default is ./logs')
+    parser.add_option('-s', '--seed', type='int',
+            action='store', dest='seed', default=None,
+            help='seed of the random number generators')
+    parser.add_option('-c', '--checkpoint', type='string',
+            action='store', dest='checkpoint_file', default=None,
+            help='file to periodically save the state of the simulation to')
+    parser.add_option('-i', '--checkpoint-interval', type='float',
+            action='store', dest='checkpoint_interval', default=100,
+            help='simulated seconds between checkpoints; default is 100')
+    parser.add_option('-r', '--resume', type='string',
+            action='store', dest='resume', default=None,
+            help='checkpoint file to resume a simulation from')
+    parser.add_option('-t', '--instrument', action='store_true',
+            dest='instrumentation', default=False,
+            help='time the phases of the simulation and export them with '
+            'counters to instrumentation.json in the log directory')
+    parser.add_option('-p', '--report-interval', type='float',
+            action='store', dest='report_interval', default=5,
+            help='wall seconds between progress reports; default is 5')
+
+    (options, args) = parser.parse_args(sys.argv[1:])
+
+    if options.resume is not None:
+        # the parameters are restored with the rest of the simulation
+        c = checkpoint.load(options.resume)
+        c.run()
+        sys.exit()
+
+    params = get_params(options.filename)
+    params['log_dir'] = options.log_dir
+    if options.seed is not None:
+        params['seed'] = options.seed
+    params['instrumentation'] = options.instrumentation
+    params['report_interval'] = options.report_interval
+    if options.checkpoint_file is not None:
+        params['checkpoint_file'] = options.checkpoint_file
+        params['checkpoint_interval'] = options.checkpoint_interval
+
+    simulate(params)
@@ -0,0 +1,179 @@
+import heapq, random, numpy as np
+
+'''
+Per-node pools of outstanding transactions.
+
+Transactions are kept in a heap ordered by the key of the scheduling rule,
+with lazy deletion: removing a transaction only forgets it, and stale heap
+entries are skipped (and periodically compacted away). Transactions leave the
+pool once they are included on the node's main chain and return to it when a
+reorg disconnects the block including them, so the pool only holds
+outstanding transactions.
+
+Scheduling rules subclass Mempool and define key (the order candidates are
+considered in) and optionally accept.
+'''
+class Mempool():
+    def __init__(self):
+        # (key, sequence number, tx) entries, possibly stale
+        self.heap = []
+        # tx -> sequence number of its live heap entry
+        self.entries = {}
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, tx):
+        return tx in self.entries
+
+    def key(self, tx):
+        pass
+
+    # scheduling rule deciding whether a candidate goes into the block
+    def accept(self, tx):
+        return True
+
+    def add(self, tx):
+        if tx in self.entries:
+            return
+        heapq.heappush(self.heap, (self.key(tx), self.seq, tx))
+        self.entries[tx] = self.seq
+        self.seq+=1
+
+    def remove(self, tx):
+        if self.entries.pop(tx, None) is not None and len(self.heap)>2*len(self.entries)+64:
+            self._compact()
+
+    def _compact(self):
+        self.heap = [entry for entry in self.heap if self.entries.get(entry[2])==entry[1]]
+        heapq.heapify(self.heap)
+
+    def _pop(self):
+        while len(self.heap)>0:
+            key, seq, tx = heapq.heappop(self.heap)
+            if self.entries.get(tx)==seq:
+                del self.entries[tx]
+                return tx
+        return None
+
+    # remove and return up to max_block_size txs in rule order, dropping txs
+    # already included on the main chain, whose inclusion counts by tx id are
+    # included_txs; candidates rejected by the rule stay in the pool. The pool
+    # holds txs delivered up to timestamp
+    def select(self, max_block_size, included_txs, timestamp=None):
+        selected = []
+        rejected = []
+        while len(selected)<max_block_size:
+            tx = self._pop()
+            if tx is None:
+                break
+            if tx<included_txs.shape[0] and included_txs[tx]>0:
+                continue
+            if self.accept(tx):
+                selected.append(tx)
+            else:
+                rejected.append(tx)
+
+        for tx in rejected:
+            self.add(tx)
+
+        return selected
+
+'''
+First in, first out by generation timestamp; transaction ids are assigned in
+generation order
+'''
+class FIFOMempool(Mempool):
+    def key(self, tx):
+        return tx
+
+'''
+FIFO order where each candidate is accepted with probability 1/m. m should
+range from f*delta (block proposal rate * block delay) to 10*f*delta
+'''
+class RandomAcceptanceMempool(FIFOMempool):
+    def __init__(self, m=2*2.3333):
+        super(RandomAcceptanceMempool, self).__init__()
+        self.m = m
+
+    def accept(self, tx):
+        return random.random()<1.0/self.m
+
+'''
+Priority rule scheduling the most recently generated transaction first
+'''
+class LIFOMempool(Mempool):
+    def key(self, tx):
+        return -tx
+
+'''
+Virtual mempool, holding the txs that have reached the node by the time it
+proposes according to precomputed arrival times (arrivals.TransactionArrivals)
+instead of txs delivered by events. The node's pool is a bitmap of the txs it
+has taken out of the pool (included on its main chain or in its own blocks);
+add and remove only flip bits. Selecting txs masks the arrival times of the
+txs generated so far, starting from the oldest tx still in the pool, so the
+work per proposal is vectorized over the backlog rather than per tx.
+
+The scheduling rule is applied to the candidates as a whole: FIFO takes the
+oldest, LIFO the newest, and 1/m accepts each candidate, oldest first, with
+probability 1/m.
+'''
+class VirtualMempool():
+    def __init__(self, arrivals, node_id, tx_rule, m=2*2.3333):
+        self.arrivals = arrivals
+        self.node_id = node_id
+        self.tx_rule = tx_rule
+        self.m = m
+        self.removed = np.zeros(1024, dtype=bool)
+        # every tx below first is out of the pool
+        self.first = 0
+
+    # removed bitmap covering at least num_txs txs
+    def _removed(self, num_txs):
+        if num_txs>self.removed.shape[0]:
+            removed = np.zeros(max(2*self.removed.shape[0], num_txs), dtype=bool)
+            removed[:self.removed.shape[0]] = self.removed
+            self.removed = removed
+        return self.removed
+
+    # return a tx disconnected from the main chain to the pool
+    def add(self, tx):
+        self._removed(tx+1)[tx] = False
+        self.first = min(self.first, tx)
+
+    def remove(self, tx):
+        self._removed(tx+1)[tx] = True
+
+    def select(self, max_block_size, included_txs, timestamp=None):
+        arrivals = self.arrivals
+        # txs generated after timestamp cannot have arrived
+        end = np.searchsorted(arrivals.timestamps[:len(arrivals)], timestamp,
+                side='right')
+        removed = self._removed(end)
+        start = self.first
+        pending = ~removed[start:end]
+        candidates = start+np.flatnonzero(pending&
+                (arrivals.arrival_times(self.node_id, start, end)<=timestamp))
+
+        if self.tx_rule=='LIFO':
+            candidates = candidates[::-1]
+        elif self.tx_rule=='1/m':
+            candidates = candidates[np.random.random(candidates.shape[0])<1.0/self.m]
+        selected = candidates[:max_block_size]
+        removed[selected] = True
+
+        # move past txs out of the pool at the front of the window
+        pending[selected-start] = False
+        remaining = np.flatnonzero(pending)
+        self.first = end if remaining.shape[0]==0 else start+remaining[0]
+        return selected.tolist()
+
+def create_mempool(tx_rule):
+    if tx_rule=='FIFO':
+        return FIFOMempool()
+    elif tx_rule=='1/m':
+        return RandomAcceptanceMempool()
+    elif tx_rule=='LIFO':
+        return LIFOMempool()
@@ -1,4 +1,4 @@
-import sys, re, json, pprint, csv, glob
+import sys, re, json, pprint, csv, glob, numpy as np
 from constants import TX_RATE
 
 def dump_params(filename='params.json'):
@@ -12,47 +12,57 @@ def dump_params(filename='params.json'):
     pp.pprint(d)
     print('\n')
 
+def read_txs(foldername='logs'):
+    # columns of transactions.csv, see logger.log_txs
+    return np.loadtxt(f'{foldername}/transactions.csv', delimiter=',',
+            skiprows=1, ndmin=2)
+
 def compute_throughputs(foldername='logs', filename='params.json'):
     with open(f'{filename}') as f:
         contents = json.load(f)
         setting_name = contents['setting-name']
         d = contents[setting_name]
         duration = d['Duration (sec)']
-    with open(f'{foldername}/transactions.csv', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        num_transactions_finalized = 0
-        num_unique_transactions_finalized = 0
-        for row in reader:
-            if row['finalization timestamps']!='None':
-                num_unique_transactions_finalized+=1
-                if ';' in row['finalization timestamps']:
-                    num_transactions_finalized+=len(row['finalization timestamps'].split(';'))
-                else:
-                    num_transactions_finalized+=1
+    return throughputs(read_txs(foldername)[:, 5], duration)
+
+def throughputs(finalization_timestamps, duration):
+    # every transaction has a single (earliest) finalization timestamp, so
+    # the total and unique finalized counts coincide
+    num_transactions_finalized = np.count_nonzero(~np.isnan(finalization_timestamps))
+    num_unique_transactions_finalized = num_transactions_finalized
 
     return float(num_transactions_finalized)/duration, float(num_unique_transactions_finalized)/duration
 
 def compute_latency(foldername='logs'):
-    with open(f'{foldername}/transactions.csv', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        main_chain_arrival_sum = 0
-        main_chain_arrival_count = 0
-        finalization_sum = 0
-        finalization_count = 0
-        for row in reader:
-            if row['main chain arrival timestamp']!='None' and row['generated timestamp']!='None':
-                main_chain_arrival_sum += float(row['main chain arrival timestamp']) - float(row['generated timestamp'])
-                main_chain_arrival_count += 1
-            if row['finalization timestamps']!='None':
-                max_finalization_timestamp = min(list(map(lambda t: float(t),
-                    row['finalization timestamps'].split(';')))) 
-                finalization_sum += max_finalization_timestamp - float(row['main chain arrival timestamp'])
-                finalization_count += 1
+    txs = read_txs(foldername)
+    return latencies(txs[:, 2], txs[:, 4], txs[:, 5])
+
+def latencies(generated_timestamps, main_chain_timestamps, finalization_timestamps):
+    main_chain_arrival_latencies = (main_chain_timestamps-generated_timestamps)[~np.isnan(main_chain_timestamps)]
+    finalization_latencies = (finalization_timestamps-main_chain_timestamps)[~np.isnan(finalization_timestamps)]
 
-    avg_main_chain_arrival_latency = 0 if main_chain_arrival_count==0 else main_chain_arrival_sum/main_chain_arrival_count
-    avg_finalization_latency = 0 if finalization_count==0 else finalization_sum/finalization_count
+    avg_main_chain_arrival_latency = 0 if main_chain_arrival_latencies.shape[0]==0 else float(np.mean(main_chain_arrival_latencies))
+    avg_finalization_latency = 0 if finalization_latencies.shape[0]==0 else float(np.mean(finalization_latencies))
     return avg_main_chain_arrival_latency, avg_finalization_latency
 
+# two-sided 95% critical values of Student's t distribution by degrees of
+# freedom, from 1 to 30
+T_CRITICAL_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+        2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093,
+        2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045,
+        2.042]
+
+# mean of independent samples and half-width of its 95% confidence interval
+# (nan for a single sample)
+def confidence_interval(values):
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[0]
+    mean = float(np.mean(values))
+    if n<2:
+        return mean, float('nan')
+    t = T_CRITICAL_95[n-2] if n-1<=len(T_CRITICAL_95) else 1.96
+    return mean, float(t*np.std(values, ddof=1)/np.sqrt(n))
+
 def dump_results(foldername='logs'):
     print('Results:')
     avg_main_chain_arrival_latency, avg_finalization_latency = compute_latency(foldername) 
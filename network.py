@@ -1,10 +1,18 @@
 import numpy as np
 
+'''
+Network models return the delay of a message of msg_size transactions. When
+size is given, a vector of size independent per-link delays is drawn in one
+NumPy call, one entry per neighbor the message is sent to.
+'''
+
 '''
 Simple model of simple latency of 0 sec
 '''
-def zero_latency():
-    return 0
+def zero_latency(msg_size=0, size=None):
+    if size is None:
+        return 0
+    return np.zeros(size)
 '''
 An approximation of network latency in the Bitcoin network based on the
 following paper: https://ieeexplore.ieee.org/document/6688704/.
@@ -18,15 +26,75 @@ From the green line in Fig 1, we can approximate the function as:
 
 We use this as a parameter into our exponential delay
 '''
-def decker_wattenhorf(msg_size):
+def decker_wattenhorf(msg_size, size=None):
     from constants import SEC_PER_TRANSACTION
     delta = SEC_PER_TRANSACTION * msg_size
-    return np.random.exponential(delta)
+    return np.random.exponential(delta, size)
 
 '''
 A constant delta value used for testing purposes
 '''
-def constant_decker_wattenhorf(msg_size):
+def constant_decker_wattenhorf(msg_size, size=None):
     from constants import SEC_PER_TRANSACTION
     delta = SEC_PER_TRANSACTION * msg_size
-    return delta
+    if size is None:
+        return delta
+    return np.full(size, delta)
+
+'''
+Geographic models add a fixed propagation delay per link, from the
+great-circle distance between the locations of its ends, to the
+transmission delay of the model they are named after. The propagation delays
+of all links are computed once, when the network is set up.
+'''
+GEOGRAPHIC_MODELS = {
+    'Geographic-Decker-Wattenhorf': decker_wattenhorf,
+    'Geographic-Constant-Decker-Wattenhorf': constant_decker_wattenhorf,
+}
+
+# models whose delay depends only on the link and message size
+CONSTANT_MODELS = ['Zero', 'Constant-Decker-Wattenhorf',
+        'Geographic-Constant-Decker-Wattenhorf']
+
+MODELS = {
+    'Zero': zero_latency,
+    'Decker-Wattenhorf': decker_wattenhorf,
+    'Constant-Decker-Wattenhorf': constant_decker_wattenhorf,
+    **GEOGRAPHIC_MODELS,
+}
+
+'''
+Per-link delays for sending a message of msg_size transactions over num_links
+links under the named network model, plus the propagation delays of the links
+under geographic models
+'''
+def link_delays(model, msg_size, num_links, propagation_delays=None):
+    delays = MODELS[model](msg_size, num_links)
+    if propagation_delays is not None:
+        delays = delays+propagation_delays
+    return delays
+
+'''
+Propagation delay in sec of every link of a topology, over the great-circle
+(haversine) distance between the (latitude, longitude) locations of its ends.
+Returned as a float32 array aligned with topology.indices, so the delays of
+a node's links are the slice of its row.
+'''
+def propagation_delays(locations, topology):
+    from constants import EARTH_RADIUS, SIGNAL_SPEED
+    latitudes, longitudes = np.radians(np.asarray(locations, dtype=np.float64)).T
+    sources, targets = topology.links()
+    a = np.sin((latitudes[targets]-latitudes[sources])/2)**2+ \
+            np.cos(latitudes[sources])*np.cos(latitudes[targets])* \
+            np.sin((longitudes[targets]-longitudes[sources])/2)**2
+    distances = 2*EARTH_RADIUS*np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return (distances/SIGNAL_SPEED).astype(np.float32)
+
+'''
+Locations spread uniformly over the surface of the earth, for geographic
+models without a locations file
+'''
+def random_locations(num_nodes):
+    latitudes = np.degrees(np.arcsin(np.random.uniform(-1, 1, num_nodes)))
+    longitudes = np.random.uniform(-180, 180, num_nodes)
+    return np.column_stack([latitudes, longitudes])
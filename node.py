@@ -1,22 +1,29 @@
 import logging, copy, json, numpy as np
 from block import *
-import graph_tool.all as gt
-from network import zero_latency, decker_wattenhorf, constant_decker_wattenhorf
+from network import link_delays
 from algorithms import *
-from constants import TX_SIZE
+from mempool import create_mempool, VirtualMempool
+from events import Proposal, CompactBlock, FetchedBlock
+from constants import TX_SIZE, BLOCK_HEADER_SIZE, SHORT_ID_SIZE
+from orphans import OrphanPool
+from bitmap import Bitmap
 
 class Node():
-    def __init__(self, node_id, algorithm, tx_rule, max_block_size, location=None):
+    def __init__(self, node_id, algorithm, tx_rule, max_block_size, blockstore,
+            location=None, max_orphans=None, relay=False, upload_bandwidth=None,
+            compact_blocks=False, arrivals=None):
         self.node_id = node_id
 
+        # every node views the same shared block store
         if algorithm=='longest-chain-with-pool':
-            self.local_blocktree = LongestChainWithPool(block_size=max_block_size) 
+            self.local_blocktree = LongestChainWithPool(blockstore,
+                    block_size=max_block_size) 
         elif algorithm=='longest-chain':
-            self.local_blocktree = LongestChain()
+            self.local_blocktree = LongestChain(blockstore)
         elif algorithm=='GHOST':
-            self.local_blocktree = GHOST()
+            self.local_blocktree = GHOST(blockstore)
         elif algorithm=='Prism':
-            self.local_blocktree = Prism()
+            self.local_blocktree = Prism(blockstore)
 
         self.algorithm = algorithm
 
@@ -24,146 +31,275 @@ class Node():
 
         self.location=location
 
-        self.orphans = np.array([])
-        self.neighbors = np.array([])
-
-    def create_arrays(self, num_txs):
-        self.local_tx_i = 0
-        self.local_txs = np.empty(num_txs, dtype=object)
+        # outstanding transactions ordered by the scheduling rule, either
+        # delivered by events or, given tx arrival times, virtual
+        if arrivals is None:
+            self.mempool = create_mempool(tx_rule)
+        else:
+            self.mempool = VirtualMempool(arrivals, node_id, tx_rule)
 
         # this is an event buffer containing broadcasted both block proposals and
-        # transactions
-        self.buffer = np.array([])
+        # transactions, in order of delivery
+        self.buffer = []
+
+        # received blocks whose parent has not been received yet, by parent
+        self.orphans = OrphanPool(max_orphans)
+        # evicted orphans whose parent connected, to be fetched again
+        self.requests = []
+        # node ids of neighbors, and the propagation delay of the link to
+        # each under geographic network models
+        self.neighbors = np.array([], dtype=np.int64)
+        self.propagation_delays = None
+
+        # whether received events are relayed to neighbors, for topologies
+        # where not every node is a neighbor of the source; relaying nodes
+        # remember the events they have seen to drop duplicates
+        self.relay = relay
+
+        # whether blocks are announced by the ids of their txs, which
+        # receivers look up among the txs they have seen
+        self.compact_blocks = compact_blocks
+        # ids of announced proposals whose missing txs are being fetched;
+        # further announcements of them are duplicates
+        self.fetching = set()
+
+        # txs and proposals seen, by id, in bitmaps of one bit per id
+        self.seen_txs = None
+        self.seen_proposals = None
+        if relay or compact_blocks:
+            self.seen_txs = Bitmap()
+            self.seen_proposals = Bitmap()
+
+        # upload bandwidth in txs/sec, shared equally by the outgoing links
+        # busy when a message starts, or None for unlimited bandwidth. Each
+        # link sends its messages in FIFO order, so it is kept as the time it
+        # finishes sending its queued messages. Sending then takes the place
+        # of the size-dependent delay of the network model, and only the
+        # propagation delays of geographic models are added to it
+        self.upload_bandwidth = upload_bandwidth
+        self.link_free_times = np.zeros(0)
+        # total time messages waited for their link
+        self.queueing_delay = 0.0
 
     def add_neighbor(self, neighbor_node):
-        self.neighbors = np.append(self.neighbors, neighbor_node)
-
-    def add_block_by_tx_rule(self, new_block, tx):
-        if self.tx_rule=='FIFO':
-            new_block.add_tx(tx)
-        # m should range from f*delta (block proposal rate * block delay)
-        # to 10*f*delta
-        elif self.tx_rule=='1/m' and random.random()<1.0/(2*2.3333):
-            new_block.add_tx(tx)
-
-    def broadcast(self, event, max_block_size, delay_model):
-        if event.__class__.__name__=='Transaction':
-            msg_size = TX_SIZE
-        elif event.__class__.__name__=='Proposal':
-            msg_size = max_block_size
-
-        # add network delay
-        if delay_model=='Decker-Wattenhorf':
-            delay = decker_wattenhorf(msg_size)
-        elif delay_model=='Constant-Decker-Wattenhorf':
-            delay = constant_decker_wattenhorf(msg_size)
-        elif delay_model=='Zero':
-            delay = zero_latency()
-
-        event.timestamp+=delay
-
-        for neighbor in self.neighbors:
-            neighbor.buffer = np.append(neighbor.buffer, event)
-
-    def process_buffer(self, timestamp):
-        b_i = 0 
-        while b_i<len(self.buffer):
-            if self.buffer[b_i].timestamp>timestamp:
-                break
-            event = self.buffer[b_i]
-            if event.__class__.__name__=='Transaction':
-                # transactions should be added to local transaction queue
-                self.local_txs[self.local_tx_i] = event
-                self.local_tx_i+=1
-            elif event.__class__.__name__=='Proposal':
+        self.neighbors = np.append(self.neighbors, neighbor_node.node_id)
+        self.link_free_times = np.append(self.link_free_times, 0)
+
+    # set all neighbors at once, e.g. to a row of a Topology
+    def set_neighbors(self, node_ids, propagation_delays=None):
+        self.neighbors = node_ids
+        self.propagation_delays = propagation_delays
+        self.link_free_times = np.zeros(node_ids.shape[0])
+
+    def add_tx(self, tx):
+        self.mempool.add(tx)
+
+    # remove txs included on the main chain from the mempool and return txs
+    # of blocks disconnected by a reorg to it; returns the number of blocks
+    # disconnected
+    def update_mempool(self):
+        disconnected, connected = self.local_blocktree.main_chain_delta()
+        included_txs = self.local_blocktree.included_txs()
+        for block in disconnected:
+            for ledger_block in self.local_blocktree.ledger_blocks(block):
+                for tx in ledger_block.txs.tolist():
+                    if tx>=included_txs.shape[0] or included_txs[tx]==0:
+                        self.mempool.add(tx)
+        for block in connected:
+            for ledger_block in self.local_blocktree.ledger_blocks(block):
+                for tx in ledger_block.txs.tolist():
+                    self.mempool.remove(tx)
+        return len(disconnected)
+
+    def has_seen(self, event):
+        if isinstance(event, Proposal):
+            return event.id in self.seen_proposals
+        return event in self.seen_txs
+
+    def mark_seen(self, event):
+        if isinstance(event, Proposal):
+            self.seen_proposals.add(event.id)
+        else:
+            self.seen_txs.add(event)
+
+    # tx_size is the size of the event when it is a tx. A relaying node
+    # excludes the neighbor it received the event from
+    def broadcast(self, event, timestamp, max_block_size, delay_model,
+            event_queue, tx_size=TX_SIZE, exclude=None):
+        if self.seen_txs is not None:
+            self.mark_seen(event)
+        sender = self.node_id
+
+        # transactions are broadcast as their id
+        if isinstance(event, Proposal):
+            if self.compact_blocks:
+                # announce the block by the short ids of its txs
+                msg_size = BLOCK_HEADER_SIZE+SHORT_ID_SIZE*event.block.num_txs
+                event = CompactBlock(event, sender)
+            else:
+                msg_size = max_block_size
+        else:
+            msg_size = tx_size
+
+        links = slice(None)
+        if exclude is not None:
+            links = np.flatnonzero(self.neighbors!=exclude)
+        neighbors = self.neighbors[links]
+
+        if self.upload_bandwidth is None:
+            # draw an independent network delay for every link at once
+            delivery_times = timestamp+link_delays(delay_model, msg_size,
+                    neighbors.shape[0], None if self.propagation_delays is None
+                    else self.propagation_delays[links])
+        else:
+            # the message starts on each link once the messages queued before
+            # it are sent, and takes its size over the link's share of the
+            # bandwidth to send: the bandwidth is shared by these links and
+            # the other links still sending, and the message keeps that share
+            # after they finish. delay_model is not used; only the
+            # propagation delay of geographic models is added
+            start_times = np.maximum(self.link_free_times[links], timestamp)
+            self.queueing_delay+=np.sum(start_times)-timestamp*start_times.shape[0]
+            busy_links = np.count_nonzero(self.link_free_times>timestamp)- \
+                    np.count_nonzero(self.link_free_times[links]>timestamp)+ \
+                    neighbors.shape[0]
+            free_times = start_times+msg_size*busy_links/self.upload_bandwidth
+            self.link_free_times[links] = free_times
+            delivery_times = free_times
+            if self.propagation_delays is not None:
+                delivery_times = delivery_times+self.propagation_delays[links]
+
+        # schedule one delivery per neighbor; the event itself is left
+        # untouched and the delivery time is kept in the event queue
+        event_queue.schedule_deliveries(delivery_times, event, neighbors, sender)
+
+    # called by the coordinator when a broadcasted event is delivered; the
+    # event is processed the next time this node acts. Returns False for
+    # duplicates of events a relaying node has already seen
+    def receive(self, event):
+        if self.seen_txs is not None:
+            if self.has_seen(event):
+                return False
+            self.mark_seen(event)
+        self.buffer.append(event)
+        return True
+
+    # txs of a compact block announcement this node has not seen by timestamp
+    def missing_txs(self, compact_block, timestamp):
+        txs = compact_block.proposal.block.txs
+        if isinstance(self.mempool, VirtualMempool):
+            arrivals = self.mempool.arrivals
+            return [tx for tx in txs.tolist() if
+                    arrivals.arrival_times(self.node_id, tx, tx+1)[0]>timestamp]
+        seen_txs = self.seen_txs
+        return [tx for tx in txs.tolist() if tx not in seen_txs]
+
+    # delay of fetching num_missing txs of missing_size in total of a compact
+    # block from its sender: a request by short ids, followed by the txs, over
+    # the link between them
+    def round_trip_delay(self, num_missing, missing_size, sender, delay_model):
+        delays = link_delays(delay_model, SHORT_ID_SIZE*num_missing, 1)+ \
+                link_delays(delay_model, missing_size, 1)
+        if sender.propagation_delays is not None:
+            link = np.flatnonzero(sender.neighbors==self.node_id)[0]
+            delays = delays+2*sender.propagation_delays[link]
+        return float(delays[0])
+
+    def process_buffer(self):
+        # deliveries are made in time order, so the buffer is already sorted
+        for event in self.buffer:
+            if not isinstance(event, (Proposal, FetchedBlock)):
+                # transactions should be added to local mempool
+                self.add_tx(event)
+            else:
+                # blocks are shared between nodes, so the proposed block is
+                # added to the local blocktree by reference
                 proposal_block = event.block
-                if self.algorithm=='longest-chain' or self.algorithm=='GHOST':
-                    copied_block = Block(txs=proposal_block.txs,
-                            id=proposal_block.id, parent_id=proposal_block.parent_id,
-                            proposal_timestamp=proposal_block.proposal_timestamp)
-                elif self.algorithm=='longest-chain-with-pool':
-                    copied_block = LinkedBlock(txs=proposal_block.txs,
-                            id=proposal_block.id, parent_id=proposal_block.parent_id,
-                            proposal_timestamp=proposal_block.proposal_timestamp,
-                            referenced_blocks=proposal_block.referenced_blocks,
-                            block_type=proposal_block.block_type) 
-                elif self.algorithm=='Prism':
-                    copied_block = PrismBlock(txs=proposal_block.txs,
-                            id=proposal_block.id, parent_id=proposal_block.parent_id,
-                            proposal_timestamp=proposal_block.proposal_timestamp,
-                            referenced_blocks=proposal_block.referenced_blocks,
-                            block_type=proposal_block.block_type,
-                            max_voted_block_depth=proposal_block.max_voted_block_depth) 
                 # check if parent block is acquired yet
                 # if parent block is found, then we can add to node's local
                 # blocktree
                 # if parent block is not found, then the block is deemed an
                 # orphan
-                parent_block = self.local_blocktree.get_block_by_id(copied_block.parent_id)
+                parent_block = self.local_blocktree.get_block_by_id(proposal_block.parent_id)
                 if parent_block==None:
-                    self.orphans = np.append(self.orphans, copied_block)
+                    self.orphans.add(proposal_block)
                 else:
-                    self.local_blocktree.add_block_by_parent(parent_block=parent_block,
-                            new_block=copied_block)
-            b_i+=1
+                    self.connect_block(proposal_block, parent_block)
 
         # remove already processed items in buffer
-        self.buffer = self.buffer[b_i:]
-        self.buffer_i = 0 
-
-        # loop over orphans repeatedly while we added an orphan block
-        added_orphan_block = True
-        while added_orphan_block:
-            # assume we did not add an orphan block
-            added_orphan_block = False
-            # loop over orphans and update remaining orphans
-            remaining_orphans = np.zeros(self.orphans.shape, dtype=bool)
-            for i, block in enumerate(self.orphans):
-                parent_block = self.local_blocktree.get_block_by_id(block.parent_id)
-                if parent_block==None:
-                    # cannot add orphan block, block remains as orphan
-                    remaining_orphans[i] = True
-                else:
-                    # we can add an orphan block
-                    parent_block = self.local_blocktree.add_block_by_parent(parent_block=parent_block,
-                            new_block=block)
-                    added_orphan_block = True
-            self.orphans = self.orphans[remaining_orphans]
+        self.buffer = []
+        self.orphans.trim()
+
+    # add a block to the local blocktree, followed by the orphans waiting on
+    # it and, in turn, the orphans waiting on those
+    def connect_block(self, new_block, parent_block):
+        stack = [(new_block, parent_block)]
+        while len(stack)>0:
+            new_block, parent_block = stack.pop()
+            self.local_blocktree.add_block_by_parent(parent_block=parent_block,
+                    new_block=new_block)
+            for orphan in self.orphans.pop_children(new_block.id):
+                stack.append((orphan, new_block))
+            self.requests+=self.orphans.pop_evicted(new_block.id)
+
+    # delay of fetching a block of max_block_size again from a neighbor: a
+    # request by its id, followed by the block
+    def fetch_delay(self, max_block_size, delay_model):
+        delays = link_delays(delay_model, SHORT_ID_SIZE, 1)+ \
+                link_delays(delay_model, max_block_size, 1)
+        if self.propagation_delays is not None and self.propagation_delays.shape[0]>0:
+            link = np.random.randint(self.propagation_delays.shape[0])
+            delays = delays+2*self.propagation_delays[link]
+        return float(delays[0])
 
+    # instrumentation, if given, times the phases of the proposal
+    def propose(self, proposal, max_block_size, fork_choice_rule, delay_model,
+            instrumentation=None):
+        if instrumentation is not None:
+            instrumentation.buffer_processed(len(self.buffer), len(self.orphans))
+            started = instrumentation.start()
 
-    def propose(self, proposal, max_block_size, fork_choice_rule, delay_model):
         # process proposer's buffer
-        self.process_buffer(proposal.timestamp)
+        self.process_buffer()
+
+        if instrumentation is not None:
+            instrumentation.stop('buffer processing', started)
+            started = instrumentation.start()
+
+        disconnected = self.update_mempool()
+
+        # take txs not yet in main chain from the mempool in the order of the
+        # scheduling rule
+        txs = self.mempool.select(max_block_size,
+                self.local_blocktree.included_txs(), proposal.timestamp)
 
         # append new block to appropriate chain
         if self.algorithm=='longest-chain' or self.algorithm=='GHOST':
-            new_block = Block(proposal_timestamp=proposal.timestamp)
+            new_block = Block(txs=txs, proposal_timestamp=proposal.timestamp)
         elif self.algorithm=='longest-chain-with-pool':
-            new_block = LinkedBlock(proposal_timestamp=proposal.timestamp,
+            new_block = LinkedBlock(txs=txs, proposal_timestamp=proposal.timestamp,
                     block_type=proposal.proposal_type)
         elif self.algorithm=='Prism':
-            new_block = PrismBlock(proposal_timestamp=proposal.timestamp)
-
-        # find all txs in main chain
-        main_chain = self.local_blocktree.random_main_chain()
-        main_chain_txs = np.concatenate([b.txs for b in main_chain]).ravel()
-
-        added_txs = 0
-        if self.local_tx_i>0:
-            for elem in np.nditer(self.local_txs[:self.local_tx_i],
-                    flags=['refs_ok']):
-                tx = elem.item()
-                if tx.timestamp>proposal.timestamp:
-                    # no potential txs left
-                    break
-                if new_block.txs.shape[0]>max_block_size:
-                    # there are potential txs left on the table
-                    continue
-                if tx not in main_chain_txs:
-                    self.add_block_by_tx_rule(new_block, tx)
-                    added_txs+=1
+            new_block = PrismBlock(txs=txs, proposal_timestamp=proposal.timestamp)
 
         proposal.set_block(new_block)
+
+        if instrumentation is not None:
+            instrumentation.stop('block assembly', started)
+            started = instrumentation.start()
+
         self.local_blocktree.add_block_by_fork_choice_rule(new_block)
+
+        if instrumentation is not None:
+            instrumentation.stop('fork choice', started)
+            started = instrumentation.start()
+
+        disconnected+=self.update_mempool()
+
+        if instrumentation is not None:
+            instrumentation.stop('block assembly', started)
+            if disconnected>0:
+                instrumentation.count('node reorgs')
+                instrumentation.count('disconnected blocks', disconnected)
     
         return proposal
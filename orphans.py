@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+'''
+Per-node pool of orphan blocks, whose parent the node has not received yet.
+
+Orphans are indexed by the id of their missing parent, so when a block is
+added to the node's blocktree the orphans waiting on it are found in O(1) and
+connected in one cascade, instead of rescanning every orphan until a pass
+connects nothing.
+
+Orphans are evicted oldest first when the pool holds more than max_orphans
+blocks (no limit by default) after the node has processed its buffer, so
+blocks delivered together connect regardless of their order. Evicting an orphan also evicts the orphans
+waiting on it, since they can no longer connect either. Nothing would deliver
+an evicted block again, so a node that evicted a block of the main chain
+would stall; evicted blocks are therefore remembered by the id of their
+parent, and once the parent reaches the node or connects from the pool,
+the node requests them again (see pop_evicted).
+'''
+class OrphanPool():
+    def __init__(self, max_orphans=None):
+        if max_orphans is not None and max_orphans<0:
+            raise ValueError('maximum number of orphans must not be negative')
+        self.max_orphans = max_orphans
+        # missing parent id -> orphans waiting on it
+        self.waiting = {}
+        # orphan id -> orphan, in arrival order
+        self.blocks = OrderedDict()
+        # parent id -> evicted blocks to request again once it connects
+        self.evicted = {}
+        self.num_evicted = 0
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, block_id):
+        return block_id in self.blocks
+
+    def add(self, block):
+        self.waiting.setdefault(block.parent_id, []).append(block)
+        self.blocks[block.id] = block
+
+    # evict the oldest orphans beyond max_orphans
+    def trim(self):
+        while self.max_orphans is not None and len(self.blocks)>self.max_orphans:
+            self.evict(next(iter(self.blocks.values())))
+
+    # remove and return the orphans waiting on block_id, which can now be
+    # connected
+    def pop_children(self, block_id):
+        children = self.waiting.pop(block_id, [])
+        for child in children:
+            del self.blocks[child.id]
+        return children
+
+    # remove an orphan and the orphans waiting on it
+    def evict(self, block):
+        siblings = self.waiting[block.parent_id]
+        siblings.remove(block)
+        if len(siblings)==0:
+            del self.waiting[block.parent_id]
+        del self.blocks[block.id]
+
+        stack = [block]
+        while len(stack)>0:
+            block = stack.pop()
+            self.evicted.setdefault(block.parent_id, []).append(block)
+            self.num_evicted+=1
+            stack+=self.pop_children(block.id)
+
+    # remove and return the evicted blocks whose parent block_id connected,
+    # and the evicted blocks waiting on those, parents first; the node
+    # requests them again all at once
+    def pop_evicted(self, block_id):
+        evicted = self.evicted.pop(block_id, [])
+        i = 0
+        while i<len(evicted):
+            evicted+=self.evicted.pop(evicted[i].id, [])
+            i+=1
+        return evicted
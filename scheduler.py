@@ -0,0 +1,48 @@
+import heapq
+
+'''
+Discrete-event queue driving the simulation.
+
+Entries are (timestamp, sequence number, node id, event, sender) tuples kept
+in a binary heap. Source events (transactions being generated, proposal
+slots) are scheduled with node id None; deliveries of a broadcasted event to
+a node carry that node's id and the id of the node that sent it, if any. The sequence number breaks ties between equal timestamps in
+scheduling order, so events themselves never need to be comparable.
+'''
+class EventQueue():
+    def __init__(self):
+        self.heap = []
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, timestamp, event, node_id=None, sender=None):
+        heapq.heappush(self.heap, (timestamp, self.seq, node_id, event, sender))
+        self.seq+=1
+
+    # schedule many source events at once in O(n)
+    def extend(self, timestamps, events):
+        for timestamp, event in zip(timestamps, events):
+            self.heap.append((timestamp, self.seq, None, event, None))
+            self.seq+=1
+        heapq.heapify(self.heap)
+
+    # schedule the delivery of one event from sender to many nodes, one
+    # delivery time per node
+    def schedule_deliveries(self, timestamps, event, node_ids, sender=None):
+        for timestamp, node_id in zip(timestamps.tolist(), node_ids.tolist()):
+            heapq.heappush(self.heap, (timestamp, self.seq, node_id, event, sender))
+            self.seq+=1
+
+    def peek_timestamp(self):
+        return self.heap[0][0]
+
+    def pop(self):
+        timestamp, node_id, event, _ = self.pop_delivery()
+        return timestamp, node_id, event
+
+    # pop the next event along with the node that sent it
+    def pop_delivery(self):
+        timestamp, _, node_id, event, sender = heapq.heappop(self.heap)
+        return timestamp, node_id, event, sender
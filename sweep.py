@@ -0,0 +1,158 @@
+import sys, os, csv, json, itertools, contextlib, traceback, numpy as np
+from multiprocessing import Pool
+from optparse import OptionParser
+from main import setting_to_params, simulate
+import metrics
+
+'''
+Parallel parameter sweeps.
+
+A sweep file names a setting of a parameters file, a grid of values for some
+of its parameters and a number of seeds, e.g.
+
+    {
+      "Parameters file": "params.json",
+      "Setting": "longest-chain",
+      "Grid": {
+        "Number of nodes": [10, 100],
+        "Block proposal rate parameter": [0.05, 0.1],
+        "Block size (txs)": [50],
+        "Network model": ["Decker-Wattenhorf"],
+        "Fork choice rule": ["longest-chain", "GHOST"]
+      },
+      "Seeds": 5,
+      "Seed": 0,
+      "Processes": 4,
+      "Output directory": "sweeps/example"
+    }
+
+Every combination of grid values is run once per seed in a pool of worker
+processes (Processes, or the number of CPUs). Each run logs to its own
+directory, which also holds the parameters file of the run, and gets a seed
+spawned from the sweep seed, so runs use independent random streams and can
+be reproduced with main.py -f DIR/params.json -s SEED -o DIR. The throughput
+and latencies of all runs are written to runs.csv and aggregated over seeds,
+with 95% confidence intervals, to summary.csv.
+
+    python sweep.py -f sweep.json [-p processes]
+'''
+
+RESULTS = ['throughput', 'main chain arrival latency', 'finalization latency']
+
+# parameters file, log directory and seed of every run of a sweep
+def plan_runs(sweep):
+    with open(sweep['Parameters file']) as f:
+        contents = json.load(f)
+    setting_name = sweep.get('Setting', contents['setting-name'])
+    setting = contents[setting_name]
+
+    grid = sweep.get('Grid', {})
+    names = list(grid.keys())
+    points = list(itertools.product(*[grid[name] for name in names]))
+    num_seeds = sweep.get('Seeds', 1)
+
+    # independent seeds for every run, spawned from the sweep seed
+    seeds = np.random.SeedSequence(sweep.get('Seed')).spawn(len(points)*num_seeds)
+
+    runs = []
+    for i, point in enumerate(points):
+        run_setting = dict(setting)
+        run_setting.update(zip(names, point))
+        for j in range(0, num_seeds):
+            log_dir = os.path.join(sweep['Output directory'], f'{i:04d}', f'seed{j}')
+            runs.append({'point': i,
+                'values': dict(zip(names, point)),
+                'setting': run_setting,
+                'log_dir': log_dir,
+                'seed': int(seeds[i*num_seeds+j].generate_state(1)[0])})
+    return names, runs
+
+# run one simulation in a worker, returning its results or the error it
+# raised; output of the run goes to out.txt in its log directory
+def run_simulation(run):
+    os.makedirs(run['log_dir'], exist_ok=True)
+    with open(os.path.join(run['log_dir'], 'params.json'), 'w') as f:
+        json.dump({'setting-name': 'sweep', 'sweep': run['setting']}, f, indent=2)
+
+    params = setting_to_params(run['setting'])
+    params['log_dir'] = run['log_dir']
+    params['seed'] = run['seed']
+    result = {'point': run['point'], 'seed': run['seed'], 'log_dir': run['log_dir']}
+    with open(os.path.join(run['log_dir'], 'out.txt'), 'w') as out, \
+            contextlib.redirect_stdout(out):
+        try:
+            c = simulate(params)
+        except Exception:
+            traceback.print_exc(file=out)
+            result['error'] = traceback.format_exc().splitlines()[-1]
+            return result
+
+    num_txs = len(c.txs)
+    result['throughput'] = metrics.throughputs(c.txs.finalization_timestamps[:num_txs],
+            params['duration'])[0]
+    result['main chain arrival latency'], result['finalization latency'] = \
+            metrics.latencies(c.txs.timestamps[:num_txs],
+                    c.txs.main_chain_timestamps[:num_txs],
+                    c.txs.finalization_timestamps[:num_txs])
+    return result
+
+def write_results(output_directory, names, runs, results):
+    with open(os.path.join(output_directory, 'runs.csv'), 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(names+['seed', 'log directory']+RESULTS+['error'])
+        for run, result in zip(runs, results):
+            writer.writerow([run['values'][name] for name in names]+
+                    [run['seed'], run['log_dir']]+
+                    [result.get(field, '') for field in RESULTS]+
+                    [result.get('error', '')])
+
+    with open(os.path.join(output_directory, 'summary.csv'), 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(names+['runs', 'failed runs']+
+                [f'{field} {stat}' for field in RESULTS for stat in ['mean', '95% CI']])
+        for point in sorted(set(run['point'] for run in runs)):
+            point_runs = [run for run in runs if run['point']==point]
+            point_results = [result for result in results if result['point']==point
+                    and 'error' not in result]
+            row = [point_runs[0]['values'][name] for name in names]
+            row+=[len(point_results), len(point_runs)-len(point_results)]
+            for field in RESULTS:
+                if len(point_results)==0:
+                    row+=['', '']
+                else:
+                    row+=list(metrics.confidence_interval([result[field] for
+                        result in point_results]))
+            writer.writerow(row)
+
+def sweep(filename, processes=None):
+    with open(filename) as f:
+        config = json.load(f)
+    names, runs = plan_runs(config)
+    os.makedirs(config['Output directory'], exist_ok=True)
+
+    if processes is None:
+        processes = config.get('Processes')
+    with Pool(processes=processes) as pool:
+        results = []
+        for result in pool.imap(run_simulation, runs):
+            results.append(result)
+            status = result['error'] if 'error' in result else 'done'
+            print(f'{len(results)}/{len(runs)} {result["log_dir"]}: {status}')
+
+    write_results(config['Output directory'], names, runs, results)
+    return results
+
+if __name__=='__main__':
+    usage = 'usage: python %prog [options]'
+    parser = OptionParser(usage=usage)
+
+    parser.add_option('-f', '--filename', type='string',
+            action='store', dest='filename', default='sweep.json',
+            help='filename of the sweep to run')
+    parser.add_option('-p', '--processes', type='int',
+            action='store', dest='processes', default=None,
+            help='number of worker processes; default is the number of CPUs')
+
+    (options, args) = parser.parse_args(sys.argv[1:])
+
+    sweep(options.filename, options.processes)
@@ -1,23 +1,38 @@
-import unittest
+import unittest, os, tempfile, importlib.util
 from algorithms import *
 from block import *
+from events import *
+from scheduler import EventQueue
+from network import link_delays, propagation_delays
+from constants import SEC_PER_TRANSACTION
+from mempool import create_mempool, VirtualMempool
+from arrivals import TransactionArrivals, constant_offsets
+from transactions import TransactionTable
+import generate_tx_dataset, metrics, checkpoint, topology, random
+from global_chain import GlobalMainChain
+from finalization import FinalizationTracker
+from instrumentation import Instrumentation
+from blockstore import BlockStore
+from node import Node
+from orphans import OrphanPool
+from bitmap import Bitmap
 
 class TestBlockchainSimulator(unittest.TestCase):
     def test_longest_chain(self):
         l = LongestChain()
 
         # create our own tree 
-        block_a = Block(id='a', parent_id='Genesis')
-        l.add_block(parent_block=l.vertex_to_blocks[l.root], new_block=block_a) 
+        block_a = Block(id='a', parent_id=GENESIS_ID)
+        l.add_block_by_parent(parent_block=l.genesis, new_block=block_a) 
 
-        block_b = Block(id='b', parent_id='Genesis')
-        l.add_block(parent_block=block_a, new_block=block_b) 
+        block_b = Block(id='b', parent_id=GENESIS_ID)
+        l.add_block_by_parent(parent_block=l.genesis, new_block=block_b) 
 
         block_c = Block(id='c', parent_id='b')
-        l.add_block(parent_block=block_b, new_block=block_c) 
+        l.add_block_by_parent(parent_block=block_b, new_block=block_c) 
 
         block_d = Block(id='d', parent_id='b')
-        l.add_block(parent_block=block_b, new_block=block_d) 
+        l.add_block_by_parent(parent_block=block_b, new_block=block_d) 
 
         parent_blocks = l.fork_choice_rule()
 
@@ -32,75 +47,189 @@ class TestBlockchainSimulator(unittest.TestCase):
                 chains[1]))
 
 
-        self.assertListEqual(block_chain_1, ['Genesis', block_b.id, block_c.id]) 
-        self.assertListEqual(block_chain_2, ['Genesis', block_b.id, block_d.id]) 
+        self.assertListEqual(block_chain_1, [GENESIS_ID, block_b.id, block_c.id]) 
+        self.assertListEqual(block_chain_2, [GENESIS_ID, block_b.id, block_d.id]) 
 
     def test_GHOST(self):
         g = GHOST()
 
         # create our own tree 
-        block_a = Block(id='a', parent_id='Genesis')
-        g.add_block(parent_block=g.vertex_to_blocks[g.root], new_block=block_a) 
+        block_a = Block(id='a', parent_id=GENESIS_ID)
+        g.add_block_by_parent(parent_block=g.genesis, new_block=block_a) 
 
-        block_b = Block(id='b', parent_id='Genesis')
-        g.add_block(parent_block=g.vertex_to_blocks[g.root], new_block=block_b) 
+        block_b = Block(id='b', parent_id=GENESIS_ID)
+        g.add_block_by_parent(parent_block=g.genesis, new_block=block_b) 
 
         block_c = Block(id='c', parent_id='b')
-        g.add_block(parent_block=block_b, new_block=block_c) 
+        g.add_block_by_parent(parent_block=block_b, new_block=block_c) 
 
         block_d= Block(id='d', parent_id='b')
-        g.add_block(parent_block=block_b, new_block=block_d) 
+        g.add_block_by_parent(parent_block=block_b, new_block=block_d) 
 
+        # c and d tie, and the heaviest child c is kept
         parent_blocks = g.fork_choice_rule()
 
-        self.assertIn(block_c, parent_blocks)
-        self.assertIn(block_d, parent_blocks)
+        self.assertListEqual(parent_blocks, [block_c])
 
         chains = g.main_chains()
 
         block_chain_1 = list(map(lambda block: block.id,
                 chains[0]))
-        block_chain_2 = list(map(lambda block: block.id,
-                chains[1]))
 
-        self.assertListEqual(block_chain_1, ['Genesis', block_b.id, block_c.id]) 
-        self.assertListEqual(block_chain_2, ['Genesis', block_b.id,block_d.id]) 
+        self.assertEqual(len(chains), 1)
+        self.assertListEqual(block_chain_1, [GENESIS_ID, block_b.id, block_c.id]) 
 
-    def test_common_prefix(self):
-        g = GHOST()
+        # grow the subtree under a past the subtree under b
+        block_e = Block(id='e', parent_id='a')
+        g.add_block_by_parent(parent_block=block_a, new_block=block_e) 
+        block_f = Block(id='f', parent_id='a')
+        g.add_block_by_parent(parent_block=block_a, new_block=block_f) 
+        self.assertListEqual(g.fork_choice_rule(), [block_c])
 
-        # create our own tree 
-        block_a = Block(id='a', parent_id='Genesis')
-        g.add_block(parent_block=g.vertex_to_blocks[g.root], new_block=block_a) 
+        block_g = Block(id='g', parent_id='f')
+        g.add_block_by_parent(parent_block=block_f, new_block=block_g) 
+        self.assertListEqual(g.fork_choice_rule(), [block_g])
 
-        block_b = Block(id='b', parent_id='Genesis')
-        g.add_block(parent_block=g.vertex_to_blocks[g.root], new_block=block_b) 
+        # a block off the heaviest path leaves the tip unchanged
+        block_h = Block(id='h', parent_id='c')
+        g.add_block_by_parent(parent_block=block_c, new_block=block_h) 
+        self.assertListEqual(g.fork_choice_rule(), [block_g])
+
+        # b overtakes a again, the tip is the leaf under b's heaviest child
+        block_i = Block(id='i', parent_id='d')
+        g.add_block_by_parent(parent_block=block_d, new_block=block_i) 
+        self.assertListEqual(g.fork_choice_rule(), [block_h])
+
+    def test_GHOST_ties(self):
+        g = GHOST()
+        block_a = Block(id='a', parent_id=GENESIS_ID)
+        g.add_block_by_parent(parent_block=g.genesis, new_block=block_a)
+        block_b = Block(id='b', parent_id=GENESIS_ID)
+        g.add_block_by_parent(parent_block=g.genesis, new_block=block_b)
+        # a tie with the child seen first keeps it
+        self.assertListEqual(g.fork_choice_rule(), [block_a])
 
         block_c = Block(id='c', parent_id='b')
-        g.add_block(parent_block=block_b, new_block=block_c) 
+        g.add_block_by_parent(parent_block=block_b, new_block=block_c)
+        self.assertListEqual(g.fork_choice_rule(), [block_c])
+
+        # a catches up with b: the current heaviest child b is kept even
+        # though a was seen first, and only a strictly heavier a switches
+        block_d = Block(id='d', parent_id='a')
+        g.add_block_by_parent(parent_block=block_a, new_block=block_d)
+        self.assertListEqual(g.fork_choice_rule(), [block_c])
+        block_e = Block(id='e', parent_id='d')
+        g.add_block_by_parent(parent_block=block_d, new_block=block_e)
+        self.assertListEqual(g.fork_choice_rule(), [block_e])
+
+        # b catches up with a in turn and a is kept, until b overtakes it
+        block_f = Block(id='f', parent_id='c')
+        g.add_block_by_parent(parent_block=block_c, new_block=block_f)
+        self.assertListEqual(g.fork_choice_rule(), [block_e])
+        block_g = Block(id='g', parent_id='f')
+        g.add_block_by_parent(parent_block=block_f, new_block=block_g)
+        self.assertListEqual(g.fork_choice_rule(), [block_g])
 
-        block_d= Block(id='d', parent_id='b')
-        g.add_block(parent_block=block_b, new_block=block_d) 
+    def test_common_prefix(self):
+        # GHOST breaks the tie between c and d in favor of the child seen
+        # first, while LongestChain keeps both as tips
+        for g, expected in [(GHOST(), [GENESIS_ID, 'b', 'c']),
+                (LongestChain(), [GENESIS_ID, 'b'])]:
+            # create our own tree 
+            block_a = Block(id='a', parent_id=GENESIS_ID)
+            g.add_block_by_parent(parent_block=g.genesis, new_block=block_a) 
+
+            block_b = Block(id='b', parent_id=GENESIS_ID)
+            g.add_block_by_parent(parent_block=g.genesis, new_block=block_b) 
 
-        common_prefix = list(map(lambda block: block.id,
-            g.common_prefix()))
+            block_c = Block(id='c', parent_id='b')
+            g.add_block_by_parent(parent_block=block_b, new_block=block_c) 
 
-        self.assertListEqual(common_prefix, ['Genesis', block_b.id])
+            block_d= Block(id='d', parent_id='b')
+            g.add_block_by_parent(parent_block=block_b, new_block=block_d) 
+
+            common_prefix = list(map(lambda block: block.id,
+                g.common_prefix()))
+
+            self.assertListEqual(common_prefix, expected)
+
+    def test_main_chain_delta(self):
+        l = LongestChain()
+
+        block_a = Block(id='a', parent_id=GENESIS_ID)
+        l.add_block_by_parent(parent_block=l.genesis, new_block=block_a) 
+        block_b = Block(id='b', parent_id='a')
+        l.add_block_by_parent(parent_block=block_a, new_block=block_b) 
+
+        disconnected, connected = l.main_chain_delta()
+        self.assertListEqual(disconnected, [])
+        self.assertListEqual(connected, [block_a, block_b])
+
+        # fork off genesis and overtake the current chain
+        block_c = Block(id='c', parent_id=GENESIS_ID)
+        l.add_block_by_parent(parent_block=l.genesis, new_block=block_c) 
+        block_d = Block(id='d', parent_id='c')
+        l.add_block_by_parent(parent_block=block_c, new_block=block_d) 
+        self.assertEqual(l.main_chain_delta(), ([], []))
+        block_e = Block(id='e', parent_id='d')
+        l.add_block_by_parent(parent_block=block_d, new_block=block_e) 
+
+        disconnected, connected = l.main_chain_delta()
+        self.assertListEqual(disconnected, [block_a, block_b])
+        self.assertListEqual(connected, [block_c, block_d, block_e])
+        self.assertListEqual(l.main_chain_blocks(), [l.genesis, block_c,
+            block_d, block_e])
+
+    def test_included_txs(self):
+        l = LongestChain()
+
+        block_a = Block(txs=np.array([1, 2]), id='a', parent_id=GENESIS_ID)
+        l.add_block_by_parent(parent_block=l.genesis, new_block=block_a) 
+        self.assertSetEqual(set(np.flatnonzero(l.included_txs()).tolist()), {1, 2})
+
+        # competing branch including tx 2 and 3 overtakes block a
+        block_b = Block(txs=np.array([2, 3]), id='b', parent_id=GENESIS_ID)
+        l.add_block_by_parent(parent_block=l.genesis, new_block=block_b) 
+        block_c = Block(txs=np.array([4]), id='c', parent_id='b')
+        l.add_block_by_parent(parent_block=block_b, new_block=block_c) 
+        self.assertSetEqual(set(np.flatnonzero(l.included_txs()).tolist()), {2, 3, 4})
+
+    def test_ancestor_index(self):
+        l = LongestChain()
+
+        # chain of 100 blocks on genesis, with block x forking off the 50th
+        blocks = [l.genesis]
+        for i in range(0, 100):
+            block = Block()
+            l.add_block_by_parent(parent_block=blocks[-1], new_block=block)
+            blocks.append(block)
+        block_x = Block(id='x')
+        l.add_block_by_parent(parent_block=blocks[50], new_block=block_x)
+
+        self.assertTrue(l.is_ancestor(blocks[10], blocks[100]))
+        self.assertTrue(l.is_ancestor(blocks[50], block_x))
+        self.assertFalse(l.is_ancestor(blocks[51], block_x))
+        self.assertFalse(l.is_ancestor(blocks[100], blocks[10]))
+        self.assertIs(l.lca(blocks[100], block_x), blocks[50])
+        self.assertIs(l.lca(blocks[30], blocks[70]), blocks[30])
+        self.assertIs(l.ancestor_at_depth(blocks[100], 37), blocks[37])
+        self.assertIs(l.ancestor_at_depth(block_x, 0), l.genesis)
+        self.assertIsNone(l.ancestor_at_depth(blocks[10], 11))
 
     def test_longest_chain_with_pool(self):
         l = LongestChainWithPool()
         # create our own tree 
-        block_a= LinkedBlock(id='a', parent_id='Genesis', block_type='tree')
-        l.add_block(parent_block=l.vertex_to_blocks[l.root], new_block=block_a) 
+        block_a= LinkedBlock(id='a', parent_id=GENESIS_ID, block_type=BlockType.TREE)
+        l.add_block_by_parent(parent_block=l.genesis, new_block=block_a) 
 
         # create two pool blocks
-        block_1 = LinkedBlock(id='1', block_type='pool')
-        block_2 = LinkedBlock(id='2', block_type='pool')
+        block_1 = LinkedBlock(id='1', block_type=BlockType.POOL)
+        block_2 = LinkedBlock(id='2', block_type=BlockType.POOL)
 
         l.add_pool_block(block_1)
         l.add_pool_block(block_2)
 
-        block_b = LinkedBlock(id='b', block_type='tree')
+        block_b = LinkedBlock(id='b', block_type=BlockType.TREE)
         l.add_block_by_fork_choice_rule(block_b)
 
         chains = l.main_chains()
@@ -109,48 +238,583 @@ class TestBlockchainSimulator(unittest.TestCase):
                 chains[0]))
 
         # block b should refer to block 1 and block 2
-        self.assertListEqual(block_chain_1, ['Genesis', block_a.id, block_1.id,
+        self.assertListEqual(block_chain_1, [GENESIS_ID, block_a.id, block_1.id,
             block_2.id, block_b.id])
 
     def test_prism(self):
         p = Prism(num_voting_chains = 2)
         # create our own tree 
-        block_a = PrismBlock(id='a', parent_id='Genesis', block_type='proposer')
-        p.add_block(parent_block=p.vertex_to_blocks[p.root], new_block=block_a) 
+        block_a = PrismBlock(id='a', parent_id=GENESIS_ID, block_type=BlockType.PROPOSER)
+        p.add_block_by_parent(parent_block=p.genesis, new_block=block_a) 
 
         # add some blocks to block tree 1
-        block_a_1 = PrismBlock(id = 'a1', parent_id='Genesis', block_type='voter')
+        block_a_1 = PrismBlock(id = 'a1', parent_id=GENESIS_ID, block_type=BlockType.VOTER)
         block_a_1.block_chain = 0
         p.add_block_by_fork_choice_rule(block_a_1)
-        block_b_1 = PrismBlock(id = 'b1', parent_id='a1', block_type='voter')
+        block_b_1 = PrismBlock(id = 'b1', parent_id='a1', block_type=BlockType.VOTER)
         block_b_1.block_chain = 0
         p.add_block_by_fork_choice_rule(block_b_1)
 
         # add some blocks to block tree 2
-        block_a_2 = PrismBlock(id = 'a2', parent_id='Genesis', block_type='voter')
+        block_a_2 = PrismBlock(id = 'a2', parent_id=GENESIS_ID, block_type=BlockType.VOTER)
         block_a_2.block_chain = 1
         p.add_block_by_fork_choice_rule(block_a_2)
-        block_b_2 = PrismBlock(id = 'b2', parent_id='a2', block_type='voter')
+        block_b_2 = PrismBlock(id = 'b2', parent_id='a2', block_type=BlockType.VOTER)
         block_b_2.block_chain = 1
         p.add_block_by_fork_choice_rule(block_b_2)
 
         block_chain = list(map(lambda b: b.id, p.main_chains()[0]))
         # a1 and a2 should vote for block a
         # b1 and b2 should be absent since a1 and a2 have already voted for a
-        self.assertListEqual(block_chain, ['Genesis', block_a_1.id, block_a_2.id, block_a.id]) 
+        self.assertListEqual(block_chain, [GENESIS_ID, block_a_1.id, block_a_2.id, block_a.id]) 
 
         # add one more block to proposer tree
-        block_b = PrismBlock(id='b', parent_id='a', block_type='proposer')
-        p.add_block(parent_block=block_a, new_block=block_b) 
+        block_b = PrismBlock(id='b', parent_id='a', block_type=BlockType.PROPOSER)
+        p.add_block_by_parent(parent_block=block_a, new_block=block_b) 
 
         # add more blocks to block tree 1
-        block_c_1 = PrismBlock(id = 'c1', parent_id='b1', block_type='voter')
+        block_c_1 = PrismBlock(id = 'c1', parent_id='b1', block_type=BlockType.VOTER)
         block_c_1.block_chain = 0
         p.add_block_by_fork_choice_rule(block_c_1)
 
         block_chain = list(map(lambda b: b.id, p.main_chains()[0]))
         # now c1 should have voted on block b and be added to main chain
-        self.assertListEqual(block_chain, ['Genesis', block_a_1.id, block_a_2.id, block_a.id, block_c_1.id, block_b.id]) 
+        self.assertListEqual(block_chain, [GENESIS_ID, block_a_1.id, block_a_2.id, block_a.id, block_c_1.id, block_b.id]) 
+
+    def test_event_queue(self):
+        q = EventQueue()
+        proposals = [Proposal(3.0), Proposal(1.0)]
+        q.extend([p.timestamp for p in proposals], proposals)
+        # transactions are scheduled by id
+        q.schedule(2.0, 7, node_id=4)
+        # equal timestamps are popped in scheduling order
+        q.schedule(3.0, 7, node_id=5)
+
+        popped = [q.pop() for _ in range(len(q))]
+        self.assertListEqual([p[0] for p in popped], [1.0, 2.0, 3.0, 3.0])
+        self.assertListEqual([p[1] for p in popped], [None, 4, None, 5])
+        self.assertListEqual([p[2] for p in popped], [proposals[1], 7,
+            proposals[0], 7])
+
+    def test_link_delays(self):
+        self.assertListEqual(list(link_delays('Zero', 50, 3)), [0, 0, 0])
+        constant = link_delays('Constant-Decker-Wattenhorf', 50, 4)
+        self.assertEqual(constant.shape, (4,))
+        self.assertTrue(np.allclose(constant, SEC_PER_TRANSACTION*50))
+        # every link gets its own delay
+        delays = link_delays('Decker-Wattenhorf', 50, 1000)
+        self.assertEqual(delays.shape, (1000,))
+        self.assertGreater(np.unique(delays).shape[0], 1)
+
+    def test_mempool(self):
+        # transaction ids are in generation order
+        txs = [2, 0, 1, 3]
+
+        fifo = create_mempool('FIFO')
+        for tx in txs:
+            fifo.add(tx)
+        fifo.remove(1)
+        # txs already on the main chain are dropped, selection stops once the
+        # block is full
+        selected = fifo.select(2, included_txs=np.array([1]))
+        self.assertListEqual(selected, [2, 3])
+        self.assertEqual(len(fifo), 0)
+
+        lifo = create_mempool('LIFO')
+        for tx in txs:
+            lifo.add(tx)
+        self.assertListEqual(lifo.select(3, included_txs=np.zeros(0, dtype=np.int32)), [3, 2, 1])
+        self.assertIn(0, lifo)
+
+    def test_transaction_table(self):
+        table = TransactionTable(capacity=2)
+        self.assertListEqual(list(table.append([0.5, 1.5], [3, 1])), [0, 1])
+        self.assertListEqual(list(table.append([2.5], [0])), [2])
+        self.assertEqual(len(table), 3)
+        self.assertListEqual(list(table.timestamps[:3]), [0.5, 1.5, 2.5])
+        self.assertListEqual(list(table.sources[:3]), [3, 1, 0])
+        self.assertTrue(np.isnan(table.finalization_timestamps[:3]).all())
+
+    def test_global_main_chain(self):
+        store = BlockStore()
+        nodes = [LongestChain(store), LongestChain(store)]
+        global_chain = GlobalMainChain(store, len(nodes))
+
+        block_a = Block()
+        block_b = Block()
+        block_c = Block()
+        for node in nodes:
+            node.add_block_by_parent(block_a, node.genesis)
+            node.add_block_by_parent(block_b, block_a)
+        nodes[0].add_block_by_parent(block_c, block_b)
+        for node_id, node in enumerate(nodes):
+            global_chain.update_node(node_id, node)
+        global_chain.update()
+        self.assertListEqual(global_chain.blocks(), [store.get_block(store.root),
+            block_a, block_b])
+
+        # node 1 switches to a longer fork off block a
+        block_d = Block()
+        block_e = Block()
+        block_f = Block()
+        nodes[1].add_block_by_parent(block_d, block_a)
+        nodes[1].add_block_by_parent(block_e, block_d)
+        nodes[1].add_block_by_parent(block_f, block_e)
+        global_chain.update_node(1, nodes[1])
+        global_chain.update()
+        self.assertListEqual(global_chain.blocks()[1:], [block_a])
+
+        # node 0 catches up with node 1
+        for block, parent_block in [(block_d, block_a), (block_e, block_d),
+                (block_f, block_e)]:
+            nodes[0].add_block_by_parent(block, parent_block)
+        global_chain.update_node(0, nodes[0])
+        global_chain.update()
+        self.assertListEqual(global_chain.blocks()[1:], [block_a, block_d,
+            block_e, block_f])
+
+    def test_finalization_tracker(self):
+        store = BlockStore()
+        node = LongestChain(store)
+        global_chain = GlobalMainChain(store, 1)
+        txs = TransactionTable()
+        txs.append([0.0, 0.5, 1.5], [0, 0, 0])
+        tracker = FinalizationTracker(txs, 2)
+
+        def add(block, parent_block):
+            node.add_block_by_parent(block, parent_block)
+            global_chain.update_node(0, node)
+            tracker.update(global_chain, global_chain.update())
+
+        block_a = Block(txs=[0, 1], proposal_timestamp=1.0)
+        add(block_a, node.genesis)
+        self.assertListEqual(txs.main_chain_timestamps[:2].tolist(), [1.0, 1.0])
+        block_b = Block(txs=[2], proposal_timestamp=2.0)
+        add(block_b, block_a)
+        self.assertEqual(tracker.latencies(), ((1.0+0.5+0.5)/3, 0))
+
+        # a competing fork overtakes block b before it is finalized
+        block_c = Block(proposal_timestamp=3.0)
+        add(block_c, block_a)
+        block_d = Block(proposal_timestamp=4.0)
+        add(block_d, block_c)
+        self.assertTrue(np.isnan(txs.main_chain_timestamps[2]))
+        self.assertEqual(block_a.finalization_timestamp, 4.0)
+        self.assertListEqual(txs.finalization_timestamps[:2].tolist(), [4.0, 4.0])
+        self.assertIsNone(block_c.finalization_timestamp)
+        self.assertEqual(tracker.latencies(), (0.75, 3.0))
+
+        # a fork off genesis catches up with the chain, so the global main
+        # chain falls back to genesis below the finalized block a
+        parent_block = node.genesis
+        for i in range(0, 2):
+            block = Block(proposal_timestamp=5.0+i)
+            add(block, parent_block)
+            parent_block = block
+        with self.assertRaises(ValueError):
+            add(Block(proposal_timestamp=7.0), parent_block)
+
+    def test_workload_generation(self):
+        np.random.seed(0)
+        timestamps = generate_tx_dataset.poisson_timestamps(10, 5, 105)
+        self.assertTrue(np.all(np.diff(timestamps)>=0))
+        self.assertTrue(5<timestamps[0] and timestamps[-1]<105)
+        self.assertLess(abs(timestamps.shape[0]-1000), 150)
+
+        # streamed windows cover the same deterministic workload as
+        # generating it in full
+        data = generate_tx_dataset.deterministic(0.5, 10, 0, range(0, 4))
+        windows = list(generate_tx_dataset.stream('deterministic', 0.5, 10, 0,
+            range(0, 4), 3))
+        self.assertEqual(len(windows), 4)
+        streamed = np.concatenate([window[0] for window in windows])
+        self.assertListEqual(streamed.tolist(), list(data.timestamps[:len(data)]))
+        self.assertTrue(all(np.all(window[1]<4) for window in windows))
+
+    def test_trace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_filename = os.path.join(directory, 'txs.csv')
+            trace_filename = os.path.join(directory, 'txs.trace')
+            with open(csv_filename, 'w') as f:
+                f.write('timestamp,source node,size\n')
+                f.write('2.5,1,300\n0.5,0,250\n7.0,2,500\n1.5,1,400\n')
+            self.assertEqual(generate_tx_dataset.csv_to_trace(csv_filename,
+                trace_filename, chunk_size=3), 4)
+
+            trace = generate_tx_dataset.read_trace(trace_filename)
+            self.assertListEqual(trace['timestamp'].tolist(), [0.5, 1.5, 2.5, 7.0])
+
+            windows = list(generate_tx_dataset.TraceStream(trace_filename, 4, 1,
+                3, window=2))
+            self.assertEqual(len(windows), 2)
+            self.assertListEqual(windows[0][0].tolist(), [1.5, 2.5])
+            # sizes in bytes are streamed in transactions of 500 bytes
+            self.assertTrue(np.allclose(windows[0][2], [0.8, 0.6]))
+            self.assertListEqual(windows[1][0].tolist(), [])
+
+            with self.assertRaises(ValueError):
+                list(generate_tx_dataset.TraceStream(trace_filename, 10, 0, 2))
+            del trace
+
+    def test_confidence_interval(self):
+        mean, half_width = metrics.confidence_interval([1.0, 2.0, 3.0])
+        self.assertEqual(mean, 2.0)
+        self.assertAlmostEqual(half_width, 4.303/np.sqrt(3))
+        self.assertTrue(np.isnan(metrics.confidence_interval([1.0])[1]))
+
+    def test_checkpoint(self):
+        l = LongestChain()
+        block_a = Block(txs=[1, 2])
+        l.add_block_by_parent(block_a, l.genesis)
+        next_id = Block.next_id
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'checkpoint.gz')
+            checkpoint.save(l, filename)
+            draws = (np.random.random(), random.random())
+            Block()
+
+            restored = checkpoint.load(filename)
+        # random number generators and ids continue from the checkpoint
+        self.assertEqual((np.random.random(), random.random()), draws)
+        self.assertEqual(Block.next_id, next_id)
+        self.assertListEqual([block.id for block in restored.main_chain_blocks()],
+                [GENESIS_ID, block_a.id])
+        self.assertListEqual(restored.main_chain_blocks()[1].txs.tolist(), [1, 2])
+
+    @unittest.skipUnless(importlib.util.find_spec('graph_tool'),
+            'the coordinator logs with graph_tool')
+    def test_checkpoint_resume(self):
+        import main
+        setting = {'Number of nodes': 20, 'Number of adversaries': 1,
+                'Block size (txs)': 10,
+                'Probability of error in transaction confirmation': 0.1,
+                'Block proposal rate parameter': 0.2,
+                'Transaction dataset': 'poisson',
+                'Transaction window (sec)': 50,
+                'Transaction scheduling rule': 'FIFO',
+                'Network model': 'Decker-Wattenhorf',
+                'Fork choice rule': 'GHOST', 'Duration (sec)': 300,
+                'Logging enabled': False, 'Topology': 'random-regular',
+                'Topology degree': 4, 'Relay': True,
+                'Maximum orphan blocks': 50}
+
+        def run(directory, checkpoint_interval=None):
+            # both runs number their blocks and proposals alike
+            Block.next_id = GENESIS_ID+1
+            Proposal.next_id = 0
+            params = main.setting_to_params(setting)
+            params['seed'] = 1
+            params['log_dir'] = directory
+            if checkpoint_interval is not None:
+                params['checkpoint_file'] = os.path.join(directory, 'checkpoint.gz')
+                params['checkpoint_interval'] = checkpoint_interval
+            return main.simulate(params)
+
+        def state(c):
+            num_txs = len(c.txs)
+            return ([block.id for block in c.global_chain.blocks()],
+                    # txs not yet on the chain or finalized have nan timestamps
+                    np.nan_to_num(c.txs.main_chain_timestamps[:num_txs], nan=-1).tolist(),
+                    np.nan_to_num(c.txs.finalization_timestamps[:num_txs], nan=-1).tolist(),
+                    [sorted(node.mempool.entries) for node in c.nodes],
+                    [list(node.orphans.blocks) for node in c.nodes],
+                    c.processed)
+
+        with tempfile.TemporaryDirectory() as directory:
+            uninterrupted = state(run(directory))
+            # the last checkpoint is taken at 240 sec, and the run resumed
+            # from it finishes as the uninterrupted run did
+            run(directory, checkpoint_interval=120)
+            c = checkpoint.load(os.path.join(directory, 'checkpoint.gz'))
+            self.assertLess(c.event_queue.peek_timestamp(), 300)
+            c.params['checkpoint_interval'] = None
+            c.next_checkpoint = None
+            c.run()
+        self.assertEqual(state(c), uninterrupted)
+
+    def test_compact_block(self):
+        block_a = Block(capacity=2)
+        block_b = PrismBlock(txs=[4, 5])
+        self.assertEqual(block_b.id, block_a.id+1)
+        self.assertFalse(hasattr(block_a, '__dict__'))
+        self.assertFalse(hasattr(block_b, 'block_chain'))
+
+        # the tx buffer grows once it is full
+        for tx in range(0, 5):
+            block_a.add_tx(tx)
+        self.assertListEqual(block_a.txs.tolist(), [0, 1, 2, 3, 4])
+        self.assertListEqual(block_b.txs.tolist(), [4, 5])
+
+        block_b.set_block_type(BlockType.VOTER, 1)
+        self.assertEqual(block_b.block_chain, 1)
+
+    def test_instrumentation(self):
+        instrumentation = Instrumentation(enabled=True)
+        started = instrumentation.start()
+        instrumentation.stop('fork choice', started)
+        self.assertGreaterEqual(instrumentation.phases['fork choice'], 0)
+
+        instrumentation.buffer_processed(3, 1)
+        instrumentation.buffer_processed(5, 0)
+        # chain of length 4 cut back to depth 1 and grown to length 3
+        instrumentation.global_chain_updated(3, 3, 4)
+        instrumentation.global_chain_updated(1, 4, 3)
+
+        counters = instrumentation.to_dict()['counters']
+        self.assertEqual(counters['buffered events'], 8)
+        self.assertEqual(counters['max buffer depth'], 5)
+        self.assertEqual(counters['max orphans'], 1)
+        self.assertEqual(counters['global reorgs'], 1)
+        self.assertEqual(counters['max global reorg depth'], 2)
+        self.assertEqual(counters['global chain length'], 3)
+
+    def test_orphan_pool(self):
+        store = BlockStore()
+        sender = Node(0, 'longest-chain', 'FIFO', 10, store)
+        blocks = []
+        for i in range(0, 4):
+            block = Block(proposal_timestamp=i)
+            sender.local_blocktree.add_block_by_fork_choice_rule(block)
+            proposal = Proposal(i)
+            proposal.set_block(block)
+            blocks.append(proposal)
+
+        # descendants arrive before their ancestors and connect in one cascade
+        node = Node(1, 'longest-chain', 'FIFO', 10, store)
+        for proposal in blocks[:0:-1]:
+            node.receive(proposal)
+        node.process_buffer()
+        self.assertEqual(len(node.orphans), 3)
+        node.receive(blocks[0])
+        node.process_buffer()
+        self.assertEqual(len(node.orphans), 0)
+        self.assertEqual(node.local_blocktree.main_chain_blocks()[-1].id, blocks[3].block.id)
+
+        # evicting the oldest orphan evicts the orphans waiting on it
+        node = Node(2, 'longest-chain', 'FIFO', 10, store, max_orphans=2)
+        for proposal in [blocks[1], blocks[2], blocks[3]]:
+            node.receive(proposal)
+        node.process_buffer()
+        self.assertEqual(len(node.orphans), 0)
+        self.assertEqual(node.orphans.num_evicted, 3)
+
+        # once the parent arrives, the evicted blocks are requested again,
+        # parents first, and connect when fetched
+        node.receive(blocks[0])
+        node.process_buffer()
+        self.assertListEqual(node.requests, [proposal.block for proposal in blocks[1:]])
+        node.buffer+=[FetchedBlock(block) for block in node.requests]
+        node.requests = []
+        node.process_buffer()
+        self.assertEqual(len(node.orphans), 0)
+        self.assertEqual(node.local_blocktree.main_chain_blocks()[-1].id, blocks[3].block.id)
+
+        with self.assertRaises(ValueError):
+            OrphanPool(-1)
+
+    def test_topology(self):
+        network = topology.Topology.from_edges(4, [0, 1, 1, 2], [1, 0, 2, 2])
+        # undirected, without parallel edges and self loops
+        self.assertListEqual(network.neighbors(1).tolist(), [0, 2])
+        self.assertListEqual(network.degrees().tolist(), [1, 2, 1, 0])
+        self.assertEqual(topology.complete(5).num_links, 20)
+
+        np.random.seed(0)
+        network = topology.random_regular(100, 4)
+        self.assertTrue(np.all(network.degrees()<=4))
+        for network in [network, topology.erdos_renyi(100, 0.1),
+                topology.small_world(100, 4, 0.2)]:
+            sources, targets = network.links()
+            links = set(zip(sources.tolist(), targets.tolist()))
+            self.assertTrue(all((target, source) in links for source, target in links))
+            self.assertTrue(all(source!=target for source, target in links))
+
+        # relaying nodes pass on the first delivery of an event only
+        node = Node(0, 'longest-chain', 'FIFO', 10, BlockStore(), relay=True)
+        node.set_neighbors(np.array([1, 2]))
+        queue = EventQueue()
+        self.assertTrue(node.receive(7))
+        node.broadcast(7, 0, 10, 'Zero', queue)
+        self.assertFalse(node.receive(7))
+        self.assertEqual(len(queue), 2)
+        self.assertListEqual(node.buffer, [7])
+        # and not back to the neighbor it came from
+        proposal = Proposal(0)
+        self.assertTrue(node.receive(proposal))
+        self.assertFalse(node.receive(proposal))
+        queue = EventQueue()
+        node.broadcast(8, 0, 10, 'Zero', queue, exclude=1)
+        self.assertEqual(queue.pop_delivery(), (0, 2, 8, 0))
+        self.assertEqual(len(queue), 0)
+
+        seen = Bitmap(8)
+        seen.add(3)
+        seen.add(100)
+        self.assertTrue(3 in seen and 100 in seen)
+        self.assertFalse(4 in seen or 99 in seen or 10**6 in seen)
+
+    def test_propagation_delays(self):
+        # New York, London and the antipode of New York
+        locations = [(40.7, -74.0), (51.5, -0.13), (-40.7, 106.0)]
+        network = topology.complete(3)
+        delays = propagation_delays(locations, network)
+        self.assertEqual(delays.dtype, np.float32)
+        # links are in row order: 0-1, 0-2, 1-0, 1-2, 2-0, 2-1
+        self.assertAlmostEqual(delays[0], 5570/200000.0, places=3)
+        self.assertAlmostEqual(delays[1], np.pi*6371/200000.0, places=3)
+        self.assertEqual(delays[0], delays[2])
+
+        # geographic models add the propagation delay of each link
+        node = Node(0, 'longest-chain', 'FIFO', 10, BlockStore())
+        node.set_neighbors(network.neighbors(0), delays[:2])
+        queue = EventQueue()
+        node.broadcast(1, 0, 10, 'Geographic-Constant-Decker-Wattenhorf', queue)
+        timestamps = sorted(queue.pop()[0] for i in range(0, 2))
+        self.assertTrue(np.allclose(timestamps, delays[:2]+SEC_PER_TRANSACTION,
+            atol=1e-6))
+
+    def test_upload_bandwidth(self):
+        # 4 txs/sec shared by 2 links, so a tx takes 0.5 sec on each link
+        node = Node(0, 'longest-chain', 'FIFO', 10, BlockStore(), upload_bandwidth=4)
+        node.set_neighbors(np.array([1, 2]))
+        queue = EventQueue()
+        node.broadcast(1, 0, 10, 'Zero', queue)
+        # the second tx, twice the size, waits for the first on both links
+        node.broadcast(2, 0.1, 10, 'Zero', queue, tx_size=2)
+        deliveries = [queue.pop() for i in range(0, 4)]
+        self.assertListEqual([event for _, _, event in deliveries], [1, 1, 2, 2])
+        self.assertTrue(np.allclose([timestamp for timestamp, _, _ in deliveries],
+            [0.5, 0.5, 1.5, 1.5]))
+        self.assertAlmostEqual(node.queueing_delay, 0.8)
+
+        # a link sending alone gets all of the bandwidth
+        node.broadcast(3, 2, 10, 'Zero', queue, exclude=1)
+        self.assertEqual(queue.pop(), (2.25, 2, 3))
+
+        # sending replaces the transmission delay of the network model, and
+        # the propagation delays of geographic models are added
+        node = Node(0, 'longest-chain', 'FIFO', 10, BlockStore(), upload_bandwidth=4)
+        node.set_neighbors(np.array([1, 2]), np.array([0.1, 0.2]))
+        node.broadcast(1, 0, 10, 'Geographic-Constant-Decker-Wattenhorf', queue)
+        self.assertTrue(np.allclose([queue.pop()[0] for i in range(0, 2)],
+            [0.6, 0.7]))
+
+    def test_compact_block_relay(self):
+        store = BlockStore()
+        sender = Node(0, 'longest-chain', 'FIFO', 10, store, compact_blocks=True)
+        receiver = Node(1, 'longest-chain', 'FIFO', 10, store, compact_blocks=True)
+        sender.set_neighbors(np.array([1]))
+        receiver.receive(1)
+
+        block = Block(txs=[1, 2, 3])
+        sender.local_blocktree.add_block_by_fork_choice_rule(block)
+        proposal = Proposal(0)
+        proposal.set_block(block)
+        queue = EventQueue()
+        sender.broadcast(proposal, 0, 10, 'Constant-Decker-Wattenhorf', queue)
+
+        # the announcement costs the header and short ids, not the block
+        timestamp, node_id, event = queue.pop()
+        self.assertIsInstance(event, CompactBlock)
+        self.assertIs(event.proposal, proposal)
+        self.assertAlmostEqual(timestamp, SEC_PER_TRANSACTION*(80+3*6)/500.0)
+        # the receiver fetches the two txs it has not seen
+        self.assertListEqual(receiver.missing_txs(event, timestamp), [2, 3])
+        self.assertAlmostEqual(receiver.round_trip_delay(2, 2.5, sender,
+            'Constant-Decker-Wattenhorf'), SEC_PER_TRANSACTION*(2*6/500.0+2.5))
+
+    @unittest.skipUnless(importlib.util.find_spec('graph_tool'),
+            'the coordinator logs with graph_tool')
+    def test_compact_block_duplicates(self):
+        from coordinator import Coordinator
+        c = Coordinator({'tx_error_prob': 0.1, 'num_nodes': 3,
+            'num_adversaries': 1, 'fork_choice_rule': 'longest-chain',
+            'model': 'Constant-Decker-Wattenhorf', 'max_block_size': 10})
+        for node_id in range(0, 3):
+            node = Node(node_id, 'longest-chain', 'FIFO', 10, c.blockstore,
+                    compact_blocks=True)
+            node.set_neighbors(np.array([i for i in range(0, 3) if i!=node_id]))
+            c.add_node(node)
+        c.txs.append(np.zeros(2), np.zeros(2, dtype=np.int32))
+        block = Block(txs=[0, 1])
+        c.nodes[0].local_blocktree.add_block_by_fork_choice_rule(block)
+        proposal = Proposal(0)
+        proposal.set_block(block)
+
+        # node 2 fetches the missing txs once, however many neighbors
+        # announce the block while it does
+        c.deliver(0, 2, CompactBlock(proposal, 0), 0, False)
+        c.deliver(0.1, 2, CompactBlock(proposal, 1), 1, False)
+        self.assertEqual(len(c.event_queue), 1)
+        timestamp, node_id, event, sender = c.event_queue.pop_delivery()
+        self.assertEqual((node_id, sender), (2, 0))
+        c.deliver(timestamp, node_id, event, sender, False)
+        self.assertListEqual(c.nodes[2].buffer, [proposal])
+        c.deliver(timestamp, 2, CompactBlock(proposal, 1), 1, False)
+        self.assertEqual(len(c.event_queue), 0)
+
+    @unittest.skipUnless(importlib.util.find_spec('graph_tool'),
+            'the coordinator logs with graph_tool')
+    def test_orphan_refetch(self):
+        from coordinator import Coordinator
+        c = Coordinator({'tx_error_prob': 0.1, 'num_nodes': 2,
+            'num_adversaries': 0, 'fork_choice_rule': 'longest-chain',
+            'model': 'Constant-Decker-Wattenhorf', 'max_block_size': 10})
+        c.add_node(Node(0, 'longest-chain', 'FIFO', 10, c.blockstore))
+        c.add_node(Node(1, 'longest-chain', 'FIFO', 10, c.blockstore,
+            max_orphans=0))
+        proposals = []
+        for i in range(0, 2):
+            block = Block(proposal_timestamp=i)
+            c.nodes[0].local_blocktree.add_block_by_fork_choice_rule(block)
+            proposal = Proposal(i)
+            proposal.set_block(block)
+            proposals.append(proposal)
+
+        # node 1 evicts the block it received before its parent
+        node = c.nodes[1]
+        c.deliver(0, 1, proposals[1], 0, False)
+        node.process_buffer()
+        self.assertEqual(node.orphans.num_evicted, 1)
+
+        # the evicted block is fetched as soon as its parent reaches the
+        # node, rather than the next time the node proposes
+        c.deliver(1, 1, proposals[0], 0, False)
+        self.assertEqual(len(c.event_queue), 1)
+        timestamp, node_id, event, sender = c.event_queue.pop_delivery()
+        self.assertEqual(node_id, 1)
+        self.assertIs(event.block, proposals[1].block)
+        c.deliver(timestamp, node_id, event, sender, False)
+        node.process_buffer()
+        self.assertEqual(node.local_blocktree.main_chain_blocks()[-1].id,
+                proposals[1].block.id)
+
+    def test_virtual_mempool(self):
+        # path 0-1-2 relaying txs with a constant delay per link
+        network = topology.Topology.from_edges(3, [0, 1], [1, 2])
+        offsets = constant_offsets(network, 'Constant-Decker-Wattenhorf', relay=True)
+        self.assertAlmostEqual(offsets[0, 2], 2*SEC_PER_TRANSACTION, places=6)
+        self.assertEqual(offsets[1, 1], 0)
+
+        arrivals = TransactionArrivals(3, offsets)
+        arrivals.add(np.array([0.0, 1.0, 2.0, 3.0]), np.array([0, 2, 0, 2]))
+        mempool = VirtualMempool(arrivals, 2, 'FIFO')
+        # tx 0 reaches node 2 two hops after it is generated
+        self.assertListEqual(mempool.select(10, {}, 0.05), [])
+        self.assertListEqual(mempool.select(1, {}, 1.0), [0])
+        self.assertListEqual(mempool.select(10, {}, 1.0), [1])
+        self.assertListEqual(VirtualMempool(arrivals, 2, 'LIFO').select(2, {}, 3.0), [3, 2])
+        # a tx disconnected from the main chain returns to the pool
+        mempool.add(0)
+        self.assertListEqual(mempool.select(10, {}, 3.0), [0, 2, 3])
+
+        # random models draw the arrival of every tx at every neighbor
+        arrivals = TransactionArrivals(3, topology=topology.complete(3),
+                model='Decker-Wattenhorf')
+        arrivals.add(np.array([0.0, 1.0]), np.array([1, 0]))
+        self.assertEqual(arrivals.arrival_times(1, 0, 2)[0], 0)
+        self.assertTrue(np.all(arrivals.arrival_times(2, 0, 2)>=[0, 1]))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,172 @@
+import numpy as np
+
+'''
+Network topologies.
+
+A topology is stored as a sparse adjacency structure in compressed sparse row
+(CSR) form: the neighbors of node i are indices[indptr[i]:indptr[i+1]], in
+increasing order. Building one from an edge list takes one sort of the edges,
+and nodes take their neighbors as views of indices, so setting up the network
+is O(N+E) array work with no per-edge Python.
+
+Generators build undirected topologies without self loops or parallel edges:
+
+    complete       - every node is a neighbor of every other node
+    random-regular - every node has degree neighbors (configuration model)
+    erdos-renyi    - every pair of nodes is linked with probability p
+    small-world    - ring lattice of degree neighbors, each edge rewired to a
+                     random node with probability p (Watts-Strogatz)
+
+Topologies are saved to and read from .npz files of the CSR arrays, and read
+from edge list files of one 'source target' (or 'source,target') pair per
+line.
+'''
+class Topology():
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    # build a topology from edges (sources[i], targets[i]); undirected
+    # topologies link both ways. Self loops and parallel edges are dropped
+    @classmethod
+    def from_edges(cls, num_nodes, sources, targets, directed=False):
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if not directed:
+            sources, targets = np.concatenate([sources, targets]), \
+                    np.concatenate([targets, sources])
+        keep = sources!=targets
+        # sorting the edge keys orders edges by source, then target
+        keys = np.unique(sources[keep]*num_nodes+targets[keep])
+        indptr = np.zeros(num_nodes+1, dtype=np.int64)
+        np.cumsum(np.bincount(keys//num_nodes, minlength=num_nodes), out=indptr[1:])
+        return cls(indptr, (keys%num_nodes).astype(np.int32))
+
+    @property
+    def num_nodes(self):
+        return self.indptr.shape[0]-1
+
+    # number of directed links; each undirected edge counts twice
+    @property
+    def num_links(self):
+        return self.indices.shape[0]
+
+    def neighbors(self, node_id):
+        return self.indices[self.indptr[node_id]:self.indptr[node_id+1]]
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    # source and target of every directed link, sorted by source
+    def links(self):
+        return np.repeat(np.arange(self.num_nodes), self.degrees()), self.indices
+
+    def save(self, filename):
+        np.savez(filename, indptr=self.indptr, indices=self.indices)
+
+def complete(num_nodes):
+    # every row lists all nodes but itself
+    indices = np.tile(np.arange(num_nodes, dtype=np.int32), num_nodes)
+    indices = indices[indices!=np.repeat(np.arange(num_nodes), num_nodes)]
+    indptr = np.arange(num_nodes+1, dtype=np.int64)*(num_nodes-1)
+    return Topology(indptr, indices)
+
+'''
+Random regular topology by the configuration model: every node gets degree
+stubs, which are paired at random. Pairs that would form a self loop or a
+parallel edge are put back and paired again, so a few nodes may end up one
+short of degree neighbors when the last stubs cannot be paired.
+'''
+def random_regular(num_nodes, degree, max_rounds=100):
+    if num_nodes*degree%2!=0:
+        raise ValueError('number of nodes times degree must be even')
+    stubs = np.repeat(np.arange(num_nodes, dtype=np.int64), degree)
+    keys = np.array([], dtype=np.int64)
+    for i in range(0, max_rounds):
+        if stubs.shape[0]<2:
+            break
+        np.random.shuffle(stubs)
+        pairs = stubs[:stubs.shape[0]//2*2].reshape(-1, 2)
+        pairs.sort(axis=1)
+        pair_keys = pairs[:, 0]*num_nodes+pairs[:, 1]
+        # keep the first of repeated pairs, and pairs not linked yet
+        _, first = np.unique(pair_keys, return_index=True)
+        valid = np.zeros(pair_keys.shape[0], dtype=bool)
+        valid[first] = True
+        valid&=(pairs[:, 0]!=pairs[:, 1])&~np.isin(pair_keys, keys)
+        keys = np.concatenate([keys, pair_keys[valid]])
+        stubs = pairs[~valid].ravel()
+    return Topology.from_edges(num_nodes, keys//num_nodes, keys%num_nodes)
+
+'''
+Erdos-Renyi G(n, p) topology. The number of edges is drawn first, then that
+many distinct node pairs are sampled by their index in the upper triangle of
+the adjacency matrix, so the work is O(E) rather than O(N^2).
+'''
+def erdos_renyi(num_nodes, probability):
+    num_pairs = num_nodes*(num_nodes-1)//2
+    num_edges = np.random.binomial(num_pairs, probability)
+    pair_ids = np.array([], dtype=np.int64)
+    while pair_ids.shape[0]<num_edges:
+        # draw a few extra pairs to make up for repeats
+        draws = np.random.randint(0, num_pairs, size=int(1.1*(num_edges-pair_ids.shape[0]))+1,
+                dtype=np.int64)
+        pair_ids = np.unique(np.concatenate([pair_ids, draws]))
+    pair_ids = np.random.permutation(pair_ids)[:num_edges]
+
+    # row i of the upper triangle starts at pair offset(i)
+    def offset(i):
+        return i*(2*num_nodes-i-1)//2
+    b = 2*num_nodes-1
+    sources = ((b-np.sqrt(b*b-8.0*pair_ids))//2).astype(np.int64)
+    # correct rounding of the square root
+    sources[offset(sources+1)<=pair_ids]+=1
+    sources[offset(sources)>pair_ids]-=1
+    targets = pair_ids-offset(sources)+sources+1
+    return Topology.from_edges(num_nodes, sources, targets)
+
+'''
+Watts-Strogatz small-world topology: a ring where every node is linked to its
+degree/2 nearest nodes on each side, after which the far end of every edge is
+rewired to a random node with probability. Rewired edges that form self loops
+or parallel edges are dropped.
+'''
+def small_world(num_nodes, degree, probability):
+    nodes = np.arange(num_nodes, dtype=np.int64)
+    sources = np.tile(nodes, degree//2)
+    targets = (sources+np.repeat(np.arange(1, degree//2+1), num_nodes))%num_nodes
+    rewired = np.random.random(targets.shape[0])<probability
+    targets[rewired] = np.random.randint(0, num_nodes, size=np.count_nonzero(rewired))
+    return Topology.from_edges(num_nodes, sources, targets)
+
+# read a topology from an .npz file or an edge list file of num_nodes nodes;
+# edge lists are undirected unless directed is set
+def read(filename, num_nodes, directed=False):
+    if filename.endswith('.npz'):
+        with np.load(filename) as f:
+            topology = Topology(f['indptr'], f['indices'])
+        if topology.num_nodes!=num_nodes:
+            raise ValueError(f'{filename} has {topology.num_nodes} nodes, '
+                    f'expected {num_nodes}')
+        return topology
+
+    with open(filename) as f:
+        line = f.readline()
+    delimiter = ',' if ',' in line else None
+    edges = np.loadtxt(filename, dtype=np.int64, comments='#',
+            delimiter=delimiter, ndmin=2)
+    if edges.shape[0]>0 and edges.max()>=num_nodes:
+        raise ValueError(f'{filename} has edges to nodes beyond {num_nodes-1}')
+    return Topology.from_edges(num_nodes, edges[:, 0], edges[:, 1], directed)
+
+# create the named topology, or read it from a file
+def create(name, num_nodes, degree=None, probability=None):
+    if name=='complete':
+        return complete(num_nodes)
+    elif name=='random-regular':
+        return random_regular(num_nodes, degree)
+    elif name=='erdos-renyi':
+        return erdos_renyi(num_nodes, probability)
+    elif name=='small-world':
+        return small_world(num_nodes, degree, probability)
+    return read(name, num_nodes)
@@ -1,9 +1,10 @@
-import sys, csv
+import sys, csv, numpy as np
+from topology import Topology
 
 '''
-Parse csv files
+Parse a csv file of node (latitude, longitude) locations
 '''
-def get_topology(locations_filename, topology_filename):
+def read_locations(locations_filename):
     locations = []
     with open(f'{locations_filename}', newline='') as f:
         # ignore first row
@@ -21,19 +22,18 @@ def get_topology(locations_filename, topology_filename):
                 else:
                     print('Invalid latitude longitude provided')
                     sys.exit()
+    return locations
 
-
+'''
+Parse csv files of node locations and a dense adjacency matrix, returning the
+topology in sparse form
+'''
+def get_topology(locations_filename, topology_filename):
+    locations = read_locations(locations_filename)
     num_nodes = len(locations)
-    G = []
-    with open(f'{topology_filename}', newline='') as f:
-        # ignore first row
-        first_row = True
-        adjacency_reader = csv.reader(f)
-        node = 1
-        for row in adjacency_reader:
-            G.append([])
-            for i in range(0, len(row)):
-                adjacent = int(row[i])
-                if adjacent==1:
-                    G[-1].append(i)
-    return num_nodes, locations, G
+    # row i of the adjacency matrix marks the neighbors of node i
+    adjacency = np.loadtxt(topology_filename, dtype=np.int64, delimiter=',',
+            ndmin=2)
+    sources, targets = np.nonzero(adjacency==1)
+    return num_nodes, locations, Topology.from_edges(num_nodes, sources,
+            targets, directed=True)
@@ -0,0 +1,59 @@
+import numpy as np
+from constants import TX_SIZE
+
+'''
+Columnar table of all transactions in a simulation.
+
+A transaction is identified by its integer id, which is its row in the table.
+Ids are assigned in generation order, so they are also sorted by generation
+timestamp. Blocks, mempools and the event queue refer to transactions by id
+only; per-transaction data lives in one NumPy column per field:
+
+    timestamps              - generation timestamp
+    sources                 - index of the node the transaction originates at
+    sizes                   - size of the transaction in transactions of
+                              TX_BYTES bytes (TX_SIZE unless replayed from a
+                              trace), used for its network delays
+    main_chain_timestamps   - arrival on the global main chain (nan if never)
+    finalization_timestamps - finalization on the global main chain (nan if
+                              never)
+'''
+class TransactionTable():
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.sources = np.zeros(capacity, dtype=np.int32)
+        self.sizes = np.full(capacity, TX_SIZE, dtype=np.float32)
+        self.main_chain_timestamps = np.full(capacity, np.nan)
+        self.finalization_timestamps = np.full(capacity, np.nan)
+
+    def __len__(self):
+        return self.size
+
+    def capacity(self):
+        return self.timestamps.shape[0]
+
+    def _grow(self, capacity):
+        for name, fill in [('timestamps', 0), ('sources', 0), ('sizes', TX_SIZE),
+                ('main_chain_timestamps', np.nan),
+                ('finalization_timestamps', np.nan)]:
+            column = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    # append transactions generated at timestamps by nodes sources, returning
+    # their ids
+    def append(self, timestamps, sources, sizes=TX_SIZE):
+        num_txs = len(timestamps)
+        if self.size+num_txs>self.capacity():
+            self._grow(max(2*self.capacity(), self.size+num_txs))
+        ids = np.arange(self.size, self.size+num_txs)
+        self.timestamps[ids] = timestamps
+        self.sources[ids] = sources
+        self.sizes[ids] = sizes
+        self.size+=num_txs
+        return ids
+
+    def ids(self):
+        return np.arange(0, self.size)